@@ -0,0 +1,82 @@
+"""
+Saved benchmark results and the regression check against them, shared by the benchmark scripts.
+
+A result file is {"config": {...}, "cases": {case: {metric: value}}}. Results are only comparable when they were
+measured with the same config, a mismatch is reported but does not fail the check.
+"""
+import json
+from typing import Any, Dict, List, NamedTuple
+
+
+class Regression(NamedTuple):
+    case: str
+    metric: str
+    baseline: float
+    current: float
+    change: float
+
+
+def save_results(path: str, config: Dict[str, Any], cases: Dict[str, Dict[str, float]]) -> None:
+    with open(path, "w", encoding="utf-8") as results_file:
+        json.dump({"config": config, "cases": cases}, results_file, indent=2, sort_keys=True)
+        results_file.write("\n")
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as results_file:
+        return json.load(results_file)
+
+
+def find_regressions(
+    cases: Dict[str, Dict[str, float]],
+    baseline_cases: Dict[str, Dict[str, float]],
+    higher_is_better: Dict[str, bool],
+    max_regression: float
+) -> List[Regression]:
+    """
+    Compare the metrics of every case that is also in the baseline.
+    :param higher_is_better: The compared metrics, e.g. {"p95_ms": False, "rps": True}.
+    :param max_regression: Allowed relative change in the bad direction, 0.2 fails a case that got more than 20% worse.
+    """
+    regressions: List[Regression] = []
+
+    for case, metrics in sorted(cases.items()):
+        baseline_metrics = baseline_cases.get(case)
+        if baseline_metrics is None:
+            continue
+
+        for metric, higher in higher_is_better.items():
+            baseline_value = baseline_metrics.get(metric)
+            current_value = metrics.get(metric)
+            if not baseline_value or current_value is None:
+                continue
+
+            change = (current_value - baseline_value) / baseline_value
+            if (-change if higher else change) > max_regression:
+                regressions.append(Regression(case, metric, baseline_value, current_value, change))
+
+    return regressions
+
+
+def check_baseline(path: str, config: Dict[str, Any], cases: Dict[str, Dict[str, float]], higher_is_better: Dict[str, bool], max_regression: float) -> bool:
+    """
+    Print the regressions against the baseline file.
+    :return: False if any metric regressed by more than max_regression.
+    """
+    baseline = load_results(path)
+
+    if baseline.get("config") != config:
+        print(f"\nWarning: {path} was measured with a different config, the comparison may not be meaningful")
+        print(f"  baseline: {json.dumps(baseline.get('config'), sort_keys=True)}")
+        print(f"  current:  {json.dumps(config, sort_keys=True)}")
+
+    regressions = find_regressions(cases, baseline.get("cases", {}), higher_is_better, max_regression)
+
+    if not regressions:
+        print(f"\nNo regressions above {max_regression:.0%} against {path}")
+        return True
+
+    print(f"\nRegressions above {max_regression:.0%} against {path}:")
+    for regression in regressions:
+        print(f"  {regression.case} {regression.metric}: {regression.baseline:,.3f} -> {regression.current:,.3f} ({regression.change:+.1%})")
+    return False
@@ -0,0 +1,27 @@
+import os
+
+#settings the app needs, fixed so that a local .env with real credentials is never used by a benchmark
+BENCHMARK_ENVIRONMENT = {
+    "PALANTIR_API_KEY": "benchmark",
+    "INTERVIEWER_AGENT_RID": "ri.aip-agents..agent.benchmark",
+    "ONTOLOGY_RID": "ri.ontology.main.ontology.benchmark",
+    "PALANTIR_PROJECT_URL": "http://localhost",
+    "FOUNDRY_TOKEN": "benchmark",
+    "ALLOWED_ORIGINS": '["*"]',
+    "REDIS_CLOUD_URL": "redis://localhost:6379/15",
+    "UPSTASH_REDIS_REST_URL": "http://localhost",
+    "UPSTASH_REDIS_REST_TOKEN": "benchmark",
+    "OAUTHLIB_INSECURE_TRANSPORT": "1",
+    "JWT_AUTH_ALGORITHM": "HS256",
+    "JWT_SIGNATURE_SECRET_KEY": "benchmark-secret-key-that-is-long-enough",
+    "JWT_TOKEN_EXPIRATION_MINUTES": "60",
+    "JWT_REFRESH_TOKEN_EXPIRATION_DAYS": "7",
+}
+
+
+def use_benchmark_environment() -> None:
+    """
+    Set the benchmark settings, has to run before utils.config is imported. Tuning settings such as CACHE_CODEC
+    still come from the environment or .env.
+    """
+    os.environ.update(BENCHMARK_ENVIRONMENT)
@@ -0,0 +1,107 @@
+"""
+Fake Palantir AIP agent API for the load benchmark: creates agent sessions and streams interview questions back,
+with configurable latencies. It listens on a real socket, so the benchmark exercises the connection pool, timeouts and
+streaming of the upstream client.
+
+Run standalone from the repository root (point PALANTIR_PROJECT_URL at it):
+    python -m benchmarks.fake_aip_server --port 8090 --session-latency-ms 300 --chunks 20 --chunk-delay-ms 15
+"""
+import argparse
+import asyncio
+import itertools
+import socket
+import threading
+import time
+from typing import AsyncGenerator, Optional
+
+import uvicorn
+from fastapi import Body, FastAPI
+from fastapi.responses import StreamingResponse
+
+QUESTION = "Thank you for that. Tell me about a time you disagreed with a teammate on a technical decision, what did you do and what was the result?"
+
+
+def create_fake_aip_app(session_latency_seconds: float, stream_first_chunk_seconds: float, chunks: int, chunk_delay_seconds: float) -> FastAPI:
+    """
+    :param session_latency_seconds: Time to create an agent session.
+    :param stream_first_chunk_seconds: Time until the first chunk of an answer, the agent "thinking".
+    :param chunks: Number of chunks a question is streamed in.
+    :param chunk_delay_seconds: Time between two chunks.
+    """
+    app = FastAPI()
+    session_ids = itertools.count(1)
+    words = QUESTION.split(" ")
+    chunk_size = max(1, len(words) // max(1, chunks))
+    question_chunks = [" ".join(words[i:i + chunk_size]) + " " for i in range(0, len(words), chunk_size)]
+
+    @app.post("/api/v2/aipAgents/agents/{agent_rid}/sessions")
+    async def create_session(agent_rid: str):
+        await asyncio.sleep(session_latency_seconds)
+        return {"rid": f"ri.aip-agents..session.{next(session_ids)}", "agentRid": agent_rid}
+
+    @app.post("/api/v2/aipAgents/agents/{agent_rid}/sessions/{session_rid}/streamingContinue")
+    async def streaming_continue(agent_rid: str, session_rid: str, userInput: dict = Body(...)):
+        async def stream() -> AsyncGenerator[str, None]:
+            await asyncio.sleep(stream_first_chunk_seconds)
+            for index, chunk in enumerate(question_chunks):
+                if index:
+                    await asyncio.sleep(chunk_delay_seconds)
+                yield chunk
+
+        return StreamingResponse(stream(), media_type="text/plain")
+
+    @app.post("/api/v2/aipAgents/agents/{agent_rid}/sessions/{session_rid}/blockingContinue")
+    async def blocking_continue(agent_rid: str, session_rid: str, userInput: dict = Body(...)):
+        await asyncio.sleep(stream_first_chunk_seconds + chunk_delay_seconds * len(question_chunks))
+        return {"agentMarkdownResponse": QUESTION}
+
+    return app
+
+
+class FakeAipServer:
+    """
+    Runs the fake AIP app with uvicorn in a background thread, on a free port of the loopback interface.
+    """
+
+    def __init__(self, app: FastAPI, host: str = "127.0.0.1", port: int = 0):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self.url = f"http://{host}:{self._socket.getsockname()[1]}"
+
+        self._server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, timeout_seconds: float = 10.0) -> None:
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+        self._thread.start()
+
+        deadline = time.monotonic() + timeout_seconds
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("The fake AIP server did not start")
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self._socket.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--session-latency-ms", type=float, default=300, help="Time to create an agent session.")
+    parser.add_argument("--first-chunk-ms", type=float, default=400, help="Time until the first chunk of a question.")
+    parser.add_argument("--chunks", type=int, default=20, help="Chunks a question is streamed in.")
+    parser.add_argument("--chunk-delay-ms", type=float, default=15, help="Time between two chunks.")
+    args = parser.parse_args()
+
+    app = create_fake_aip_app(args.session_latency_ms / 1000, args.first_chunk_ms / 1000, args.chunks, args.chunk_delay_ms / 1000)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+In-memory stand-in for the generated Foundry SDK (ai_interviewer_sdk and foundry_sdk_runtime), used by the load benchmark.
+
+Implements the part of the ontology the routes and jobs use: the object types and their object sets (where, iterate,
+page, get and the links between objects), the actions, the create_turn batch action, the next id queries and the
+attachment upload. Every SDK call sleeps for the configured latency in the calling thread, like the real blocking
+SDK does on the Foundry thread pool.
+
+install() has to run before any module of the service is imported, the stand-in modules then shadow the real SDK
+in this process. No Foundry credentials or SDK package are needed.
+"""
+import random
+import sys
+import threading
+import time
+import types
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+#object type -> primary key property
+PRIMARY_KEYS = {
+    "User": "uid",
+    "JobDescription": "jid",
+    "InterviewSession": "iid",
+    "Turn": "qaid",
+    "CombinedResult": "rid",
+    "PracticePlan": "ppid",
+    "PracticeTask": "ptid",
+    "Resume": "cvid",
+}
+
+#next id query -> object type, see services/id_allocator.py
+ID_QUERIES = {
+    "next_user_id_api": "User",
+    "next_job_description_id_api": "JobDescription",
+    "next_interview_session_id_api": "InterviewSession",
+    "next_turn_id_api": "Turn",
+    "next_resume_cvidas_api": "Resume",
+}
+
+#action -> (object type, parameter holding the primary key of the edited object, None for create actions)
+ACTIONS = {
+    "create_user": ("User", None),
+    "create_job_description": ("JobDescription", None),
+    "create_interview_session": ("InterviewSession", None),
+    "create_resume": ("Resume", None),
+    "edit_user": ("User", "user"),
+    "edit_interview_session": ("InterviewSession", "interview_session"),
+    "edit_practice_plan": ("PracticePlan", "practice_plan"),
+    "edit_practice_task": ("PracticeTask", "practice_task"),
+}
+
+
+class ObjectFilter:
+    """
+    Object set filter, combined with & | ~ like the filters of the SDK.
+    """
+
+    def __init__(self, predicate: Callable[[Any], bool]):
+        self.predicate = predicate
+
+    def __and__(self, other: "ObjectFilter") -> "ObjectFilter":
+        return ObjectFilter(lambda obj: self.predicate(obj) and other.predicate(obj))
+
+    def __or__(self, other: "ObjectFilter") -> "ObjectFilter":
+        return ObjectFilter(lambda obj: self.predicate(obj) or other.predicate(obj))
+
+    def __invert__(self) -> "ObjectFilter":
+        return ObjectFilter(lambda obj: not self.predicate(obj))
+
+
+class PropertyReference:
+    """
+    A property of an object type, e.g. Turn.object_type.iid. Comparisons build filters.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def _compare(self, matches: Callable[[Any], bool]) -> ObjectFilter:
+        return ObjectFilter(lambda obj: matches(getattr(obj, self.name, None)))
+
+    def __eq__(self, value: Any) -> ObjectFilter:  # type: ignore[override]
+        return self._compare(lambda actual: actual == value)
+
+    def __ne__(self, value: Any) -> ObjectFilter:  # type: ignore[override]
+        return self._compare(lambda actual: actual != value)
+
+    def __lt__(self, value: Any) -> ObjectFilter:
+        return self._compare(lambda actual: actual is not None and actual < value)
+
+    def __le__(self, value: Any) -> ObjectFilter:
+        return self._compare(lambda actual: actual is not None and actual <= value)
+
+    def __gt__(self, value: Any) -> ObjectFilter:
+        return self._compare(lambda actual: actual is not None and actual > value)
+
+    def __ge__(self, value: Any) -> ObjectFilter:
+        return self._compare(lambda actual: actual is not None and actual >= value)
+
+    def is_in(self, values: List[Any]) -> ObjectFilter:
+        value_set = set(values)
+        return self._compare(lambda actual: actual in value_set)
+
+    __hash__ = object.__hash__
+
+
+class ObjectTypeProperties:
+    def __getattr__(self, name: str) -> PropertyReference:
+        return PropertyReference(name)
+
+
+class FakeOntology:
+    """
+    The objects of the fake ontology, shared by every FoundryClient of the process.
+    :param latency_seconds: Time every SDK call takes.
+    :param jitter: Spread of the latency, 0.2 draws every call's latency from +-20% around latency_seconds.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, jitter: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.jitter = jitter
+
+        self._lock = threading.Lock()
+        self._objects: Dict[str, Dict[Any, "FakeObject"]] = {object_type: {} for object_type in PRIMARY_KEYS}
+
+        self.calls = 0
+
+    def call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+        if self.latency_seconds > 0:
+            time.sleep(self.latency_seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def put(self, object_type: str, **properties: Any) -> "FakeObject":
+        obj = FakeObject(self, object_type, properties)
+        with self._lock:
+            self._objects[object_type][properties[PRIMARY_KEYS[object_type]]] = obj
+        return obj
+
+    def edit(self, object_type: str, primary_key: Any, **properties: Any) -> None:
+        with self._lock:
+            obj = self._objects[object_type].get(primary_key)
+            if obj is not None:
+                obj.__dict__.update(properties)
+
+    def get(self, object_type: str, primary_key: Any) -> Optional["FakeObject"]:
+        with self._lock:
+            return self._objects[object_type].get(primary_key)
+
+    def all(self, object_type: str) -> List["FakeObject"]:
+        with self._lock:
+            return list(self._objects[object_type].values())
+
+    def max_primary_key(self, object_type: str) -> int:
+        with self._lock:
+            return max(self._objects[object_type], default=0)
+
+    def count(self, object_type: str) -> int:
+        with self._lock:
+            return len(self._objects[object_type])
+
+
+class FakeObject:
+    """
+    An ontology object, its properties are plain attributes.
+    """
+
+    def __init__(self, ontology: FakeOntology, object_type: str, properties: Dict[str, Any]):
+        self._ontology = ontology
+        self._object_type = object_type
+        self.__dict__.update(properties)
+
+    def _linked_one(self, object_type: str, property_name: str, value: Any) -> Optional["FakeObject"]:
+        self._ontology.call()
+        return next((obj for obj in self._ontology.all(object_type) if getattr(obj, property_name, None) == value), None)
+
+    def interview_sessions(self) -> "FakeObjectSet":
+        return FakeObjectSet(self._ontology, "InterviewSession", [PropertyReference("uid") == self.uid])
+
+    def turns(self) -> "FakeObjectSet":
+        return FakeObjectSet(self._ontology, "Turn", [PropertyReference("iid") == self.iid])
+
+    def practice_plans(self) -> "FakeObjectSet":
+        return FakeObjectSet(self._ontology, "PracticePlan", [PropertyReference("iid") == self.iid])
+
+    def combined_result(self) -> Optional["FakeObject"]:
+        return self._linked_one("CombinedResult", "iid", self.iid)
+
+    def practice_task(self) -> Optional["FakeObject"]:
+        return self._linked_one("PracticeTask", "ppid", self.ppid)
+
+
+class FakeObjectSet:
+    """
+    Lazily filtered object set, like the generated <ObjectType>ObjectSet classes.
+    """
+
+    def __init__(self, ontology: FakeOntology, object_type: str, filters: Optional[List[ObjectFilter]] = None):
+        self._ontology = ontology
+        self._object_type = object_type
+        self._filters = filters or []
+
+    def where(self, object_filter: ObjectFilter) -> "FakeObjectSet":
+        return FakeObjectSet(self._ontology, self._object_type, self._filters + [object_filter])
+
+    def _matching(self) -> List[FakeObject]:
+        return [
+            obj for obj in self._ontology.all(self._object_type)
+            if all(object_filter.predicate(obj) for object_filter in self._filters)
+        ]
+
+    def iterate(self) -> Iterator[FakeObject]:
+        self._ontology.call()
+        return iter(self._matching())
+
+    def page(self, page_size: int = 100, page_token: Optional[str] = None) -> SimpleNamespace:
+        self._ontology.call()
+        objects = self._matching()
+        start = int(page_token or 0)
+        end = start + page_size
+        return SimpleNamespace(data=objects[start:end], next_page_token=str(end) if end < len(objects) else None)
+
+    def get(self, primary_key: Any) -> Optional[FakeObject]:
+        self._ontology.call()
+        obj = self._ontology.get(self._object_type, primary_key)
+        if obj is not None and all(object_filter.predicate(obj) for object_filter in self._filters):
+            return obj
+        return None
+
+
+def _valid_response() -> SimpleNamespace:
+    return SimpleNamespace(validation=SimpleNamespace(result="VALID", submission_criteria=[]), edits=None)
+
+
+class FakeActions:
+    def __init__(self, ontology: FakeOntology):
+        self._ontology = ontology
+
+    def __getattr__(self, action_name: str) -> Callable[..., SimpleNamespace]:
+        if action_name not in ACTIONS:
+            raise AttributeError(action_name)
+        object_type, primary_key_parameter = ACTIONS[action_name]
+
+        def apply_action(action_config: Any = None, **parameters: Any) -> SimpleNamespace:
+            self._ontology.call()
+            if primary_key_parameter is None:
+                self._ontology.put(object_type, **parameters)
+            else:
+                self._ontology.edit(object_type, parameters.pop(primary_key_parameter), **parameters)
+            return _valid_response()
+
+        return apply_action
+
+
+class FakeBatchActions:
+    def __init__(self, ontology: FakeOntology):
+        self._ontology = ontology
+
+    def create_turn(self, batch_action_config: Any = None, requests: Optional[List["CreateTurnBatchRequest"]] = None) -> SimpleNamespace:
+        self._ontology.call()
+        for request in requests or []:
+            self._ontology.put("Turn", **request.parameters)
+        return SimpleNamespace(edits=None)
+
+
+class FakeQueries:
+    def __init__(self, ontology: FakeOntology):
+        self._ontology = ontology
+
+    def __getattr__(self, query_name: str) -> Callable[[], int]:
+        if query_name not in ID_QUERIES:
+            raise AttributeError(query_name)
+
+        def next_id() -> int:
+            self._ontology.call()
+            return self._ontology.max_primary_key(ID_QUERIES[query_name]) + 1
+
+        return next_id
+
+
+class FakeAttachments:
+    def __init__(self, ontology: FakeOntology):
+        self._ontology = ontology
+
+    def upload(self, file_path: str, attachment_name: str) -> SimpleNamespace:
+        self._ontology.call()
+        return SimpleNamespace(rid=f"ri.attachments.main.attachment.{attachment_name}.{random.getrandbits(32):08x}")
+
+
+#the ontology behind every FoundryClient of this process, configured and seeded by the benchmark
+fake_ontology = FakeOntology()
+
+
+class FakeFoundryClient:
+    """
+    Drop-in for ai_interviewer_sdk.FoundryClient, backed by fake_ontology.
+    """
+
+    def __init__(self, auth: Any = None, hostname: Optional[str] = None, ontology: Optional[FakeOntology] = None):
+        ontology = ontology or fake_ontology
+        self.ontology = SimpleNamespace(
+            objects=SimpleNamespace(**{object_type: FakeObjectSet(ontology, object_type) for object_type in PRIMARY_KEYS}),
+            actions=FakeActions(ontology),
+            batch_actions=FakeBatchActions(ontology),
+            queries=FakeQueries(ontology),
+            attachments=FakeAttachments(ontology),
+        )
+
+
+class CreateTurnBatchRequest:
+    def __init__(self, **parameters: Any):
+        self.parameters = parameters
+
+
+class _Parameters:
+    #ActionConfig, BatchActionConfig, ... only carry their parameters
+    def __init__(self, **parameters: Any):
+        self.__dict__.update(parameters)
+
+
+def install() -> None:
+    """
+    Register the stand-in SDK modules, has to run before the service modules are imported.
+    """
+    if "ai_interviewer_sdk" in sys.modules and getattr(sys.modules["ai_interviewer_sdk"], "FoundryClient", None) is not FakeFoundryClient:
+        raise RuntimeError("The Foundry SDK was imported before the fake was installed, call install() before importing the service")
+
+    sdk = types.ModuleType("ai_interviewer_sdk")
+    sdk.FoundryClient = FakeFoundryClient
+    sdk.UserTokenAuth = _Parameters
+
+    objects = types.ModuleType("ai_interviewer_sdk.ontology.objects")
+    object_sets = types.ModuleType("ai_interviewer_sdk.ontology.object_sets")
+    for object_type in PRIMARY_KEYS:
+        setattr(objects, object_type, type(object_type, (FakeObject,), {"object_type": ObjectTypeProperties()}))
+        setattr(object_sets, f"{object_type}ObjectSet", FakeObjectSet)
+
+    action_types = types.ModuleType("ai_interviewer_sdk.ontology.action_types")
+    action_types.CreateTurnBatchRequest = CreateTurnBatchRequest
+
+    runtime_types = types.ModuleType("foundry_sdk_runtime.types")
+    for name in ("ActionConfig", "BatchActionConfig", "SyncApplyActionResponse"):
+        setattr(runtime_types, name, type(name, (_Parameters,), {}))
+    runtime_types.ActionMode = SimpleNamespace(VALIDATE_AND_EXECUTE="VALIDATE_AND_EXECUTE", VALIDATE_ONLY="VALIDATE_ONLY")
+    runtime_types.ReturnEditsMode = SimpleNamespace(ALL="ALL", NONE="NONE")
+
+    attachments = types.ModuleType("foundry_sdk_runtime.attachments")
+    attachments.Attachment = SimpleNamespace
+
+    sys.modules.update({
+        "ai_interviewer_sdk": sdk,
+        "ai_interviewer_sdk.ontology": types.ModuleType("ai_interviewer_sdk.ontology"),
+        "ai_interviewer_sdk.ontology.objects": objects,
+        "ai_interviewer_sdk.ontology.object_sets": object_sets,
+        "ai_interviewer_sdk.ontology.action_types": action_types,
+        "foundry_sdk_runtime": types.ModuleType("foundry_sdk_runtime"),
+        "foundry_sdk_runtime.types": runtime_types,
+        "foundry_sdk_runtime.attachments": attachments,
+    })
+
+
+def seed(ontology: FakeOntology, candidates: int, coaches: int, sessions_per_candidate: int, turns_per_session: int, password_hash: str) -> Dict[str, List[int]]:
+    """
+    Fill the ontology with users and their completed interviews: sessions, turns, results, practice plans and tasks.
+    Candidates get the emails candidate<n>@benchmark.test, coaches coach<n>@benchmark.test.
+    :param password_hash: bcrypt hash of the password of every user, hashed once by the caller.
+    :return: The uids by role, {"candidate": [...], "coach": [...]}.
+    """
+    now = datetime.now().replace(microsecond=0)
+    uids: Dict[str, List[int]] = {"candidate": [], "coach": []}
+    iid = qaid = 0
+
+    def add_user(role: str, number: int) -> int:
+        uid = ontology.max_primary_key("User") + 1
+        ontology.put(
+            "User", uid=uid, name=f"{role.title()} {number}", email=f"{role}{number}@benchmark.test",
+            password_hash=password_hash, role=role, created_at=now, updated_at=now, jwt_refresh_token=""
+        )
+        uids[role].append(uid)
+        return uid
+
+    for number in range(coaches):
+        add_user("coach", number)
+
+    for number in range(candidates):
+        uid = add_user("candidate", number)
+
+        for _ in range(sessions_per_candidate):
+            iid += 1
+            started_at = now - timedelta(days=iid % 30, minutes=30)
+            ontology.put(
+                "JobDescription", jid=iid, uid=uid, role="Software Engineer", company="Benchmark Inc",
+                jd_summary="Build and run backend services.", minimum_qualification="Python",
+                preferred_qualification="FastAPI", created_at=started_at, updated_at=started_at
+            )
+            ontology.put(
+                "InterviewSession", iid=iid, uid=uid, jid=iid, status="completed", started_at=started_at,
+                ended_at=started_at + timedelta(minutes=25), created_at=started_at, updated_at=now, phase_log="{}"
+            )
+
+            for turn_index in range(turns_per_session):
+                qaid += 1
+                ontology.put(
+                    "Turn", qaid=qaid, iid=iid, uid=uid, turn_index=turn_index,
+                    question=f"Tell me about a time you handled situation {turn_index}?",
+                    answer="I took ownership of the problem and " * 8, target_competency="phone-interview",
+                    audio_url="", transcript_text="I took ownership of the problem and " * 8, created_at=started_at,
+                    updated_at=started_at, repair_attempts=0, relevance=4, star_a=3, clarity=4, filler=0.1, issues="",
+                    technical_depth=3, blocked=False, composite_star=3.5, star_r=3, star_s=4, justification="Clear STAR answer",
+                    star_t=3, safety_flags=""
+                )
+
+            ontology.put(
+                "CombinedResult", rid=iid, iid=iid, uid=uid, total_score25=18.5, clarity_avg=3.8, created_at=now,
+                eval_confidence=0.85, filler_avg=0.1, gaps="Quantify results", per_metric_weights="equal",
+                recommendation="hire", relevance_avg=4.1, rubric_version="v1", star_avg=3.4, strengths="Ownership",
+                technical_depth_avg=3.2, turn_indices_used=",".join(str(index) for index in range(turns_per_session)),
+                updated_at=now, weaknesses="Brevity"
+            )
+            ontology.put(
+                "PracticePlan", ppid=iid, iid=iid, uid=uid, overall_goal="Sharper STAR answers", approved_at=None,
+                approved_by=None, created_at=now, created_by="evaluator", decline_reason=None,
+                motivation_note="You are close", next_session_suggestion_days=3, plan_version="v1",
+                reading_list="STAR method guide", status="pending", updated_at=now
+            )
+            ontology.put(
+                "PracticeTask", ptid=iid, ppid=iid, uid=uid, competency="communication",
+                actions="Record two answers", completed_at="", created_at=now, description="Practice the result part",
+                due_date=date.today() + timedelta(days=7), est_minutes=30, priority="high", status="todo",
+                success_criteria="Results are quantified", updated_at=now
+            )
+
+    return uids
@@ -0,0 +1,475 @@
+"""
+End-to-end load benchmark of the API, without Palantir access.
+
+The app runs in this process with its real middlewares, routes, caches, job queue workers and agent session pool.
+Foundry is replaced by the in-memory ontology of benchmarks/fake_foundry.py, the AIP agent API by the HTTP server of
+benchmarks/fake_aip_server.py and redis by fakeredis (or a throwaway local redis with --redis-url). Both fakes
+answer after configurable latencies.
+
+Virtual users drive a mix of scenarios against the app for a fixed duration:
+    signup_login   sign up a new candidate and log in
+    interview      create a session, the opening message, the answers and the finalizing message
+    dashboard      candidate dashboard and interview runs
+    turns          all turns and the turns of one interview
+    practice       practice plans and tasks
+    coach          coach dashboard, all practice plans and the review of one plan
+
+Latency percentiles and requests per second are reported per endpoint. With --output the results are saved, with
+--baseline they are compared against saved results and the run fails if an endpoint got slower than allowed.
+
+Run from the repository root:
+    python -m benchmarks.load_benchmark --users 20 --duration 60 --foundry-latency-ms 80
+    python -m benchmarks.load_benchmark --output load_baseline.json
+    python -m benchmarks.load_benchmark --baseline load_baseline.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Union
+
+import httpx
+
+from benchmarks import fake_foundry
+from benchmarks.baseline import check_baseline, save_results
+from benchmarks.environment import use_benchmark_environment
+from benchmarks.fake_aip_server import FakeAipServer, create_fake_aip_app
+
+PASSWORD = "benchmark-password"
+
+END_OF_INTERVIEW = "##END_INTERVIEW##"
+
+#messages after the opening one before giving up on an interview that does not end
+MAX_INTERVIEW_MESSAGES = 30
+
+#metrics compared against the baseline, and whether higher is better
+COMPARED_METRICS = {"p95_ms": False, "rps": True}
+
+
+def compared_metrics(endpoints: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    #the requests per second of a single endpoint follow the random scenario choices, only the total is compared
+    return {
+        endpoint: {"p95_ms": result["p95_ms"], **({"rps": result["rps"]} if endpoint == "total" else {})}
+        for endpoint, result in endpoints.items()
+    }
+
+
+class BenchmarkData(NamedTuple):
+    """
+    What the virtual users need to know about the seeded ontology.
+    """
+    candidate_emails: List[str]
+    candidate_uids: List[int]
+    coach_emails: List[str]
+    iids_by_uid: Dict[int, List[int]]
+    practice_plans: List[Any]
+
+
+class LatencyRecorder:
+    """
+    Latencies and errors per endpoint, only recorded between start() and stop() so the warmup is left out.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+
+    @property
+    def recording(self) -> bool:
+        return self.started_at is not None and self.stopped_at is None
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+
+    def stop(self) -> None:
+        self.stopped_at = time.perf_counter()
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        if not self.recording:
+            return
+        self.latencies[endpoint].append(seconds)
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        duration = (self.stopped_at or time.perf_counter()) - (self.started_at or time.perf_counter())
+        endpoints = {
+            endpoint: _summarize(latencies, self.errors[endpoint], duration)
+            for endpoint, latencies in self.latencies.items()
+        }
+        endpoints["total"] = _summarize(
+            [latency for latencies in self.latencies.values() for latency in latencies],
+            sum(self.errors.values()),
+            duration
+        )
+        return endpoints
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    #nearest rank
+    return sorted_values[max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)]
+
+
+def _summarize(latencies: List[float], errors: int, duration: float) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"requests": 0, "errors": errors, "rps": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / duration, 3),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+    }
+
+
+class VirtualUser:
+    """
+    One simulated client. Every virtual user interviews as its own candidate, interviews of the same candidate
+    would overwrite each other's redis state. The coaches are shared.
+    """
+
+    def __init__(self, index: int, client: httpx.AsyncClient, recorder: LatencyRecorder, data: BenchmarkData, rng: random.Random):
+        self.index = index
+        self.client = client
+        self.recorder = recorder
+        self.data = data
+        self.rng = rng
+
+        self.candidate_email = data.candidate_emails[index]
+        self.candidate_uid = data.candidate_uids[index]
+        self.coach_email = data.coach_emails[index % len(data.coach_emails)] if data.coach_emails else None
+        self._tokens: Dict[str, str] = {}
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        endpoint: Union[str, Callable[[httpx.Response], str], None] = None,
+        token: Optional[str] = None,
+        **kwargs: Any
+    ) -> Optional[httpx.Response]:
+        """
+        Send a request and record its latency under the endpoint name, by default "METHOD path".
+        :param endpoint: Endpoint name, or a function naming the endpoint after the response.
+        :return: The response, None if it failed (status >= 400 or no response at all).
+        """
+        if token is not None:
+            kwargs["headers"] = {"Authorization": f"Bearer {token}"}
+
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except Exception:
+            self.recorder.record(f"{method} {path}", time.perf_counter() - started, ok=False)
+            return None
+        seconds = time.perf_counter() - started
+
+        if callable(endpoint):
+            endpoint = endpoint(response)
+        ok = response.status_code < 400
+        self.recorder.record(endpoint or f"{method} {path}", seconds, ok=ok)
+        return response if ok else None
+
+    async def login(self, email: str) -> Optional[str]:
+        response = await self.request("POST", "/api/auth/login", json={"email": email, "password": PASSWORD})
+        return response.json()["data"]["jwt_token"] if response is not None else None
+
+    async def token(self, email: str) -> Optional[str]:
+        #logged in once per account, like a browser keeping its token
+        if email not in self._tokens:
+            token = await self.login(email)
+            if token is None:
+                return None
+            self._tokens[email] = token
+        return self._tokens[email]
+
+
+async def signup_login_scenario(user: VirtualUser) -> None:
+    email = f"signup{user.index}-{user.rng.getrandbits(48):012x}@benchmark.test"
+    response = await user.request(
+        "POST", "/api/auth/signup", json={"email": email, "password": PASSWORD, "name": "New Candidate", "role": "candidate"}
+    )
+    if response is not None:
+        await user.login(email)
+
+
+async def interview_scenario(user: VirtualUser) -> None:
+    token = await user.token(user.candidate_email)
+    if token is None:
+        return
+
+    response = await user.request(
+        "POST", "/interviewagent/create-session", token=token,
+        json={
+            "role": "Software Engineer", "company": "Benchmark Inc", "jd_summary": "Build and run backend services.",
+            "min_qualifications": "Python", "preferred_qualifications": "FastAPI"
+        }
+    )
+    if response is None:
+        return
+
+    #the finalizing message is listed on its own, it enqueues the finalization instead of streaming a question
+    def message_endpoint(response: httpx.Response) -> str:
+        if response.text == END_OF_INTERVIEW:
+            return "POST /interviewagent/send-message-streaming (finalize)"
+        return "POST /interviewagent/send-message-streaming"
+
+    message = "<start>"
+    for _ in range(MAX_INTERVIEW_MESSAGES):
+        response = await user.request(
+            "POST", "/interviewagent/send-message-streaming", endpoint=message_endpoint, token=token, json={"message": message}
+        )
+        if response is None or response.text == END_OF_INTERVIEW:
+            return
+        message = "In that project I owned the migration, split it into small steps and we shipped with no downtime."
+
+
+async def dashboard_scenario(user: VirtualUser) -> None:
+    token = await user.token(user.candidate_email)
+    if token is None:
+        return
+    await user.request("GET", "/api/dashboard/get-dashboard-data", token=token)
+    await user.request("GET", "/api/interview-runs/get-all-interview-sessions", token=token)
+
+
+async def turns_scenario(user: VirtualUser) -> None:
+    token = await user.token(user.candidate_email)
+    if token is None:
+        return
+    await user.request("GET", "/api/turn/get-all-turns", token=token)
+
+    iids = user.data.iids_by_uid.get(user.candidate_uid)
+    if iids:
+        await user.request(
+            "POST", "/api/turn/get-turn-by-iid", token=token,
+            json={
+                "iid": user.rng.choice(iids), "uid": user.candidate_uid, "jid": 0, "status": None, "started_at": None,
+                "ended_at": None, "created_at": None, "updated_at": None
+            }
+        )
+
+
+async def practice_scenario(user: VirtualUser) -> None:
+    token = await user.token(user.candidate_email)
+    if token is None:
+        return
+    await user.request("GET", "/api/practice/get-all-practice-details", token=token)
+
+
+async def coach_scenario(user: VirtualUser) -> None:
+    if user.coach_email is None:
+        return
+    token = await user.token(user.coach_email)
+    if token is None:
+        return
+
+    await user.request("GET", "/api/dashboard/get-dashboard-data", endpoint="GET /api/dashboard/get-dashboard-data (coach)", token=token)
+    await user.request("GET", "/api/practice/get-all-practice-details", endpoint="GET /api/practice/get-all-practice-details (coach)", token=token)
+
+    if not user.data.practice_plans:
+        return
+    plan = user.rng.choice(user.data.practice_plans)
+    await user.request(
+        "POST", "/api/practice/review", token=token,
+        json={
+            "practice_plan_details": {
+                "ppid": plan.ppid, "iid": plan.iid, "uid": plan.uid, "overall_goal": plan.overall_goal,
+                "motivation_note": plan.motivation_note, "status": "approved", "plan_version": plan.plan_version,
+                "reading_list": plan.reading_list, "next_session_suggested_days": plan.next_session_suggestion_days,
+                "created_by": plan.created_by, "created_at": plan.created_at.isoformat(),
+                "updated_at": plan.updated_at.isoformat()
+            }
+        }
+    )
+
+
+SCENARIOS: Dict[str, Callable[[VirtualUser], Awaitable[None]]] = {
+    "signup_login": signup_login_scenario,
+    "interview": interview_scenario,
+    "dashboard": dashboard_scenario,
+    "turns": turns_scenario,
+    "practice": practice_scenario,
+    "coach": coach_scenario,
+}
+
+DEFAULT_MIX = "signup_login=1,interview=2,dashboard=4,turns=2,practice=2,coach=2"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Parse scenario weights, e.g. "dashboard=4,interview=1".
+    """
+    weights: Dict[str, float] = {}
+    for entry in mix.split(","):
+        name, _, weight = entry.strip().partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name!r}, choose from {', '.join(SCENARIOS)}")
+        try:
+            weights[name] = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid weight {weight!r} for scenario {name!r}")
+    return weights
+
+
+async def run_virtual_user(user: VirtualUser, mix: Dict[str, float], deadline: float) -> None:
+    names = list(mix)
+    weights = list(mix.values())
+    while time.perf_counter() < deadline:
+        await SCENARIOS[user.rng.choices(names, weights)[0]](user)
+
+
+async def run_load(app: Any, data: BenchmarkData, args: argparse.Namespace) -> LatencyRecorder:
+    recorder = LatencyRecorder()
+    mix: Dict[str, float] = args.mix
+
+    if args.redis_url is not None:
+        from db.redisConnection import redis_client
+        await redis_client.flushdb()
+
+    #runs the startup and shutdown of the app, the job queue workers and the agent session pool refiller included
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.request_timeout) as client:
+            deadline = time.perf_counter() + args.warmup + args.duration
+            users = [
+                VirtualUser(index, client, recorder, data, random.Random(args.seed + index))
+                for index in range(args.users)
+            ]
+
+            async def measure() -> None:
+                await asyncio.sleep(args.warmup)
+                recorder.start()
+                await asyncio.sleep(args.duration)
+                recorder.stop()
+
+            await asyncio.gather(measure(), *(run_virtual_user(user, mix, deadline) for user in users))
+
+    return recorder
+
+
+def print_report(endpoints: Dict[str, Dict[str, float]], foundry_calls: int, duration: float) -> None:
+    print(f"\n{'endpoint':<62}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint in sorted(endpoints, key=lambda name: (name == "total", name)):
+        result = endpoints[endpoint]
+        print(
+            f"{endpoint:<62}{result['requests']:>10,}{result['errors']:>8,}{result['rps']:>10,.1f}"
+            f"{result['p50_ms']:>10,.1f}{result['p95_ms']:>10,.1f}{result['p99_ms']:>10,.1f}"
+        )
+    print(f"\nFoundry calls: {foundry_calls:,} ({foundry_calls / duration:,.1f}/s, warmup included)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users.")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds.")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of load before measuring.")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Scenario weights, default {DEFAULT_MIX}.")
+    parser.add_argument("--candidates", type=int, default=None, help="Seeded candidates, at least --users, default --users.")
+    parser.add_argument("--coaches", type=int, default=3, help="Seeded coaches.")
+    parser.add_argument("--sessions-per-candidate", type=int, default=5, help="Seeded completed interviews per candidate.")
+    parser.add_argument("--turns-per-session", type=int, default=9, help="Seeded turns per interview.")
+    parser.add_argument("--foundry-latency-ms", type=float, default=50, help="Time every Foundry SDK call takes.")
+    parser.add_argument("--foundry-jitter", type=float, default=0.2, help="Spread of the Foundry latency, 0.2 is +-20%%.")
+    parser.add_argument("--aip-session-latency-ms", type=float, default=300, help="Time the AIP API takes to create a session.")
+    parser.add_argument("--aip-first-chunk-ms", type=float, default=400, help="Time until the first chunk of an agent answer.")
+    parser.add_argument("--aip-chunks", type=int, default=20, help="Chunks an agent answer is streamed in.")
+    parser.add_argument("--aip-chunk-delay-ms", type=float, default=15, help="Time between two chunks of an agent answer.")
+    parser.add_argument("--redis-url", default=None, help="Use this redis instead of fakeredis. The database is flushed before the run!")
+    parser.add_argument("--request-timeout", type=float, default=60, help="Client side timeout of every request.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the scenario choices.")
+    parser.add_argument("--output", default=None, help="Save the results to this JSON file.")
+    parser.add_argument("--baseline", default=None, help="Compare against results saved with --output, exits with 1 on a regression.")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p95 latency increase and req/s decrease, 0.2 is 20%%.")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the app.")
+    args = parser.parse_args()
+
+    args.candidates = args.candidates or args.users
+    if args.candidates < args.users:
+        parser.error("--candidates must be at least --users, every virtual user interviews as its own candidate")
+    if args.redis_url is None and importlib.util.find_spec("fakeredis") is None:
+        parser.error("fakeredis is not installed (pip install 'fakeredis[lua]'), install it or pass --redis-url")
+
+    aip_server = FakeAipServer(create_fake_aip_app(
+        args.aip_session_latency_ms / 1000, args.aip_first_chunk_ms / 1000, args.aip_chunks, args.aip_chunk_delay_ms / 1000
+    ))
+    aip_server.start()
+
+    #everything below reads the settings on import, so the environment and the fakes have to be in place first
+    use_benchmark_environment()
+    os.environ["PALANTIR_PROJECT_URL"] = aip_server.url
+    if args.redis_url is not None:
+        os.environ["REDIS_CLOUD_URL"] = args.redis_url
+
+    fake_foundry.install()
+    fake_foundry.fake_ontology.latency_seconds = args.foundry_latency_ms / 1000
+    fake_foundry.fake_ontology.jitter = args.foundry_jitter
+
+    import db.redisConnection
+    if args.redis_url is None:
+        import fakeredis
+        db.redisConnection.redis_client = db.redisConnection.TracedRedis(
+            connection_pool=fakeredis.FakeAsyncRedis(decode_responses=True).connection_pool
+        )
+
+    from utils.utils import encrypt_string
+    uids = fake_foundry.seed(
+        fake_foundry.fake_ontology,
+        candidates=args.candidates,
+        coaches=args.coaches,
+        sessions_per_candidate=args.sessions_per_candidate,
+        turns_per_session=args.turns_per_session,
+        password_hash=encrypt_string(PASSWORD)
+    )
+    iids_by_uid: Dict[int, List[int]] = defaultdict(list)
+    for session in fake_foundry.fake_ontology.all("InterviewSession"):
+        iids_by_uid[session.uid].append(session.iid)
+    data = BenchmarkData(
+        candidate_emails=[f"candidate{number}@benchmark.test" for number in range(len(uids["candidate"]))],
+        candidate_uids=uids["candidate"],
+        coach_emails=[f"coach{number}@benchmark.test" for number in range(len(uids["coach"]))],
+        iids_by_uid=dict(iids_by_uid),
+        practice_plans=fake_foundry.fake_ontology.all("PracticePlan")
+    )
+
+    import logging
+    from main import app
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    print(f"{args.users} virtual users, {args.warmup:g}s warmup and {args.duration:g}s measured, mix {args.mix}")
+    started = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            recorder = asyncio.run(run_load(app, data, args))
+    finally:
+        aip_server.stop()
+
+    endpoints = recorder.summary()
+    print_report(endpoints, fake_foundry.fake_ontology.calls, time.perf_counter() - started)
+
+    config = {
+        key: value for key, value in vars(args).items()
+        if key not in ("output", "baseline", "max_regression", "verbose", "redis_url", "request_timeout")
+    }
+    config["redis"] = "fakeredis" if args.redis_url is None else "redis"
+
+    if args.output:
+        save_results(args.output, config, endpoints)
+        print(f"\nSaved the results to {args.output}")
+
+    if args.baseline and not check_baseline(args.baseline, config, compared_metrics(endpoints), COMPARED_METRICS, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Micro-benchmarks of the CPU hot paths inside a request: building the TurnSchema and PracticePlanSchema objects,
+the redis cache codec (encode_for_cache, decode_from_cache, serialize_for_redis) and the encoding of the response
+bodies, FastAPI's jsonable_encoder path next to the pydantic-core one the routes use.
+
+Every case runs on synthetic payloads of each size. A case is timed for at least --min-rounds rounds and
+--min-time seconds, like pytest-benchmark does, and reported with its min, median and mean time per round.
+With --output the results are saved, with --baseline they are compared against saved results and the run fails
+if the median time of a case grew by more than --max-regression.
+
+Run from the repository root:
+    python -m benchmarks.micro_benchmark
+    python -m benchmarks.micro_benchmark --sizes 10,1000 --filter cache --output micro_baseline.json
+    python -m benchmarks.micro_benchmark --baseline micro_baseline.json --max-regression 0.15
+"""
+import argparse
+import gc
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from benchmarks.baseline import check_baseline, save_results
+from benchmarks.environment import use_benchmark_environment
+from benchmarks.projection_benchmark import make_turns
+
+DEFAULT_SIZES = "10,1000,100000"
+
+#metrics compared against the baseline, and whether higher is better
+COMPARED_METRICS = {"median_ms": False}
+
+#case name -> setup, the setup builds the payload of a size and returns the timed function
+Setup = Callable[[int], Callable[[], Any]]
+
+
+def make_practice_plans(count: int) -> List[Any]:
+    now = datetime.now()
+    return [
+        SimpleNamespace(
+            ppid=i, overall_goal="Sharper STAR answers", approved_at=None, approved_by=None, created_at=now,
+            created_by="evaluator", decline_reason=None, iid=i, motivation_note="You are close",
+            next_session_suggestion_days=3, plan_version="v1", reading_list="STAR method guide", status="pending",
+            uid=7, updated_at=now
+        )
+        for i in range(count)
+    ]
+
+
+def build_cases() -> Dict[str, Setup]:
+    #imported here, the settings have to be in place first
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from pydantic_core import to_json
+
+    from pydantic_schemas.response_pydantic import ResponseEnvelope, ResponseSchema, TurnsDataSchema
+    from services.ontology_projection import practice_plan_projector, turn_projector
+    from utils.json_response import EncodedJSONResponse, encode_envelope
+    from utils.utils import decode_from_cache, encode_for_cache, serialize_for_redis
+
+    def turn_schemas(size: int) -> List[Any]:
+        return turn_projector.project_many(make_turns(size), uid=7)
+
+    def response_schema(size: int) -> ResponseSchema:
+        return ResponseSchema(success=True, status_code=200, message="Turns retrieved successfully.", data={"turn": turn_schemas(size)})
+
+    def project_turns(trusted: bool) -> Setup:
+        def setup(size: int) -> Callable[[], Any]:
+            turns = make_turns(size)
+            return lambda: turn_projector.project_many(turns, trusted=trusted, uid=7)
+        return setup
+
+    def project_practice_plans(trusted: bool) -> Setup:
+        def setup(size: int) -> Callable[[], Any]:
+            practice_plans = make_practice_plans(size)
+            return lambda: practice_plan_projector.project_many(practice_plans, trusted=trusted)
+        return setup
+
+    def encode_turns_for_cache(size: int) -> Callable[[], Any]:
+        turns = turn_schemas(size)
+        return lambda: encode_for_cache(turns)
+
+    def decode_turns_from_cache(size: int) -> Callable[[], Any]:
+        cache_entry = encode_for_cache(turn_schemas(size))
+        return lambda: decode_from_cache(cache_entry)
+
+    def serialize_turns_for_redis(size: int) -> Callable[[], Any]:
+        turns = [turn.model_dump(mode="json") for turn in turn_schemas(size)]
+        return lambda: serialize_for_redis(turns)
+
+    def fastapi_encode_response(size: int) -> Callable[[], Any]:
+        #what FastAPI does with a ResponseSchema returned by a route without a response class
+        response = response_schema(size)
+        return lambda: JSONResponse(jsonable_encoder(response)).body
+
+    def encoded_json_response(size: int) -> Callable[[], Any]:
+        response = response_schema(size)
+        return lambda: EncodedJSONResponse(response).body
+
+    def encoded_json_envelope(size: int) -> Callable[[], Any]:
+        envelope = ResponseEnvelope[TurnsDataSchema](
+            success=True, status_code=200, message="Turns retrieved successfully.", data=TurnsDataSchema(turn=turn_schemas(size))
+        )
+        return lambda: EncodedJSONResponse(envelope).body
+
+    def cached_envelope_splice(size: int) -> Callable[[], Any]:
+        turns_json = to_json(turn_schemas(size)).decode()
+        return lambda: encode_envelope("Turns retrieved successfully.", {"turn": turns_json})
+
+    return {
+        "TurnSchema projector (validated)": project_turns(trusted=False),
+        "TurnSchema projector (trusted)": project_turns(trusted=True),
+        "PracticePlanSchema projector (validated)": project_practice_plans(trusted=False),
+        "PracticePlanSchema projector (trusted)": project_practice_plans(trusted=True),
+        "encode_for_cache turns": encode_turns_for_cache,
+        "decode_from_cache turns": decode_turns_from_cache,
+        "serialize_for_redis turns": serialize_turns_for_redis,
+        "ResponseSchema jsonable_encoder + JSONResponse": fastapi_encode_response,
+        "ResponseSchema EncodedJSONResponse": encoded_json_response,
+        "ResponseEnvelope[TurnsDataSchema] EncodedJSONResponse": encoded_json_envelope,
+        "encode_envelope cached turns": cached_envelope_splice,
+    }
+
+
+def time_case(fn: Callable[[], Any], min_rounds: int, min_time: float, max_rounds: int) -> List[float]:
+    """
+    Time rounds of fn until both min_rounds and min_time are reached, garbage collection is paused while timing.
+    :return: Seconds per round.
+    """
+    fn()
+
+    timings: List[float] = []
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        while len(timings) < max_rounds and (len(timings) < min_rounds or time.perf_counter() - started < min_time):
+            round_started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - round_started)
+    finally:
+        gc.enable()
+
+    return timings
+
+
+def parse_sizes(sizes: str) -> List[int]:
+    try:
+        return [int(size) for size in sizes.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid sizes {sizes!r}, expected e.g. {DEFAULT_SIZES}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes(DEFAULT_SIZES), help=f"Payload sizes in objects, default {DEFAULT_SIZES}.")
+    parser.add_argument("--filter", default=None, help="Only run the cases whose name contains this text.")
+    parser.add_argument("--min-rounds", type=int, default=5, help="Timed rounds per case at least.")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds of timed rounds per case at least.")
+    parser.add_argument("--max-rounds", type=int, default=10000, help="Timed rounds per case at most.")
+    parser.add_argument("--output", default=None, help="Save the results to this JSON file.")
+    parser.add_argument("--baseline", default=None, help="Compare against results saved with --output, exits with 1 on a regression.")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed increase of the median time per case, 0.2 is 20%%.")
+    args = parser.parse_args()
+
+    use_benchmark_environment()
+    cases = build_cases()
+    if args.filter:
+        cases = {name: setup for name, setup in cases.items() if args.filter.lower() in name.lower()}
+        if not cases:
+            parser.error(f"No case matches {args.filter!r}")
+
+    results: Dict[str, Dict[str, float]] = {}
+
+    print(f"{'case':<66}{'rounds':>8}{'min ms':>12}{'median ms':>12}{'mean ms':>12}{'objects/s':>14}")
+    for size in args.sizes:
+        for name, setup in cases.items():
+            timings = time_case(setup(size), args.min_rounds, args.min_time, args.max_rounds)
+            case = f"{name}[{size}]"
+            results[case] = {
+                "rounds": len(timings),
+                "min_ms": round(min(timings) * 1000, 6),
+                "median_ms": round(statistics.median(timings) * 1000, 6),
+                "mean_ms": round(statistics.fmean(timings) * 1000, 6),
+                "objects_per_second": round(size / min(timings), 1),
+            }
+            result = results[case]
+            print(
+                f"{case:<66}{result['rounds']:>8,}{result['min_ms']:>12,.3f}{result['median_ms']:>12,.3f}"
+                f"{result['mean_ms']:>12,.3f}{result['objects_per_second']:>14,.0f}"
+            )
+
+    from importlib.metadata import version
+    from utils.config import settings
+
+    #results only compare on the same interpreter, library versions and codec settings
+    config = {
+        "python": platform.python_version(),
+        "pydantic": version("pydantic"),
+        "fastapi": version("fastapi"),
+        "cache_codec": settings.CACHE_CODEC,
+        "cache_compression_min_bytes": settings.CACHE_COMPRESSION_MIN_BYTES,
+    }
+
+    if args.output:
+        save_results(args.output, config, results)
+        print(f"\nSaved the results to {args.output}")
+
+    if args.baseline and not check_baseline(args.baseline, config, results, COMPARED_METRICS, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark for the ontology -> schema projection layer.
+
+Compares the hand written per-route schema construction (full pydantic validation) with the precompiled
+projectors in services/ontology_projection.py, in validated and trusted mode.
+
+Run from the repository root:
+    python -m benchmarks.projection_benchmark --count 10000 --repeat 5
+"""
+import argparse
+import time
+from datetime import date, datetime, time as dt_time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from pydantic_schemas.practicetask_pydantic import PracticeTaskSchema
+from pydantic_schemas.turn_pydantic import TurnSchema
+from services.ontology_projection import practice_task_projector, turn_projector
+
+
+def make_turns(count: int) -> List[Any]:
+    now = datetime.now()
+    return [
+        SimpleNamespace(
+            qaid=i, question=f"Question {i}?", answer="An answer " * 20, blocked=False, clarity=3, composite_star=3.5,
+            filler=0.1, iid=i // 9, issues="", justification="ok", relevance=4, repair_attempts=0, safety_flags="",
+            star_a=3, star_r=3, star_s=3, star_t=3, target_competency="phone-interview", technical_depth=3,
+            transcript_text="An answer " * 20, turn_index=i % 9, uid=7, created_at=now, updated_at=now
+        )
+        for i in range(count)
+    ]
+
+def make_practice_tasks(count: int) -> List[Any]:
+    now = datetime.now()
+    return [
+        SimpleNamespace(
+            ptid=i, competency="communication", actions="Practice STAR answers", completed_at=None, created_at=now,
+            description="Record two answers", due_date=date.today(), est_minutes=30, ppid=i, priority="high",
+            status="todo", success_criteria="Clear structure", uid=7, updated_at=now
+        )
+        for i in range(count)
+    ]
+
+
+def handwritten_turns(turns: List[Any]) -> List[TurnSchema]:
+    return [
+        TurnSchema(
+            qaid=turn.qaid, question=turn.question, answer=turn.answer, blocked=turn.blocked, clarity=turn.clarity,
+            composite_star=turn.composite_star, filler=turn.filler, iid=turn.iid, issues=turn.issues,
+            justification=turn.justification, relevance=turn.relevance, repair_attempts=turn.repair_attempts,
+            safety_flags=turn.safety_flags, star_a=turn.star_a, star_r=turn.star_r, star_s=turn.star_s,
+            star_t=turn.star_t, target_competency=turn.target_competency, technical_depth=turn.technical_depth,
+            transcript_text=turn.transcript_text, turn_index=turn.turn_index, uid=7, created_at=turn.created_at,
+            updated_at=turn.updated_at
+        )
+        for turn in turns
+    ]
+
+def handwritten_practice_tasks(tasks: List[Any]) -> List[PracticeTaskSchema]:
+    return [
+        PracticeTaskSchema(
+            ptid=task.ptid, competency=task.competency, actions=task.actions, completed_at=task.completed_at,
+            created_at=task.created_at, description=task.description,
+            due_date=datetime.combine(task.due_date, dt_time(23, 59)), est_minutes=task.est_minutes, ppid=task.ppid,
+            priority=task.priority, status=task.status, success_criteria=task.success_criteria, uid=task.uid,
+            updated_at=task.updated_at
+        )
+        for task in tasks
+    ]
+
+
+def objects_per_second(fn: Callable[[], List[Any]], count: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started_at)
+    return count / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10000, help="Objects per run.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case, the best run is reported.")
+    args = parser.parse_args()
+
+    turns = make_turns(args.count)
+    tasks = make_practice_tasks(args.count)
+
+    cases: Dict[str, Callable[[], List[Any]]] = {
+        "Turn handwritten (validated)": lambda: handwritten_turns(turns),
+        "Turn projector (validated)": lambda: turn_projector.project_many(turns, trusted=False, uid=7),
+        "Turn projector (trusted)": lambda: turn_projector.project_many(turns, uid=7),
+        "PracticeTask handwritten (validated)": lambda: handwritten_practice_tasks(tasks),
+        "PracticeTask projector (validated)": lambda: practice_task_projector.project_many(tasks, trusted=False),
+        "PracticeTask projector (trusted)": lambda: practice_task_projector.project_many(tasks),
+    }
+
+    print(f"{'case':<40}{'objects/sec':>15}")
+    for name, fn in cases.items():
+        print(f"{name:<40}{objects_per_second(fn, args.count, args.repeat):>15,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,46 @@
+from typing import Any, Optional
+
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
 
+from services.tracing import tracer
 from utils.config import settings
 
-redis_client: Redis = Redis.from_url(settings.REDIS_CLOUD_URL, decode_responses=True)
+
+class TracedPipeline(Pipeline):
+    """
+    Pipeline recorded as one span per round trip while a request is traced.
+    """
+
+    async def execute(self, raise_on_error: bool = True) -> Any:
+        if not tracer.is_tracing():
+            return await super().execute(raise_on_error)
+
+        with tracer.span("PIPELINE", kind="redis", commands=len(self.command_stack)):
+            return await super().execute(raise_on_error)
+
+
+class TracedRedis(Redis):
+    """
+    Redis client recording every command (Lua scripts included) as a span while a request is traced.
+    """
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        if not tracer.is_tracing():
+            return await super().execute_command(*args, **options)
+
+        with tracer.span(str(args[0]), kind="redis"):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        return TracedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+redis_client: Redis = TracedRedis.from_url(settings.REDIS_CLOUD_URL, decode_responses=True)
 
 async def get_redis_connection() -> Redis:
     """
     Dependency to get a Redis connection.
     This function can be used in FastAPI routes to get a Redis connection for caching.
     """
-    return redis_client
\ No newline at end of file
+    return redis_client
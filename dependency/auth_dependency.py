@@ -1,16 +1,31 @@
 from typing import Any
 
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from jose import jwt, JWTError, ExpiredSignatureError
+from redis.asyncio import Redis
 from starlette import status
 from datetime import datetime, timedelta
 
+from db.redisConnection import get_redis_connection
+from pydantic_schemas.principal_pydantic import PrincipalSchema
+from services.cache_tags import add_invalidation_listener, parse_cache_tag
+from services.foundry_executor import foundry_call
 from utils.config import settings
+from utils.ttl_cache import TTLCache
 
 #this module automatically parses the request header containing the Bearer token and the jwt token
 http_bearer = HTTPBearer()
 
+#the user:{uid} hash is written at login and refreshed whenever we have to resolve a principal from Palantir
+USER_CACHE_TTL_SECONDS = 60 * 90
+
+#resolved principals of this worker, short lived so that edits made through other workers show up quickly
+principal_cache: TTLCache[PrincipalSchema] = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_MAX_SIZE,
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+
 def create_jwt_token(data: dict[str, Any]) -> str:
     """
     Function to create a JWT token.
@@ -74,3 +89,79 @@ def authenticate_request(http_credentials: HTTPAuthorizationCredentials = Depend
         )
 
     return jwt_payload
+
+
+async def get_current_principal(
+    request: Request,
+    jwt_payload: dict = Depends(authenticate_request),
+    redis_connection: Redis = Depends(get_redis_connection)
+) -> PrincipalSchema:
+    """
+    Dependency that resolves the authenticated user into a principal (uid, role, name).
+    Lookup order is the in-process cache, then the user:{uid} redis hash, and only then the Palantir ontology,
+    so most requests authenticate without any Foundry call.
+    """
+    subject = jwt_payload.get("sub") or {}
+    user_id = subject.get("uid") if isinstance(subject, dict) else None
+
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    cached_user = await redis_connection.hgetall(f"user:{user_id}")
+
+    if cached_user.get("uid"):
+        principal = PrincipalSchema(
+            uid=int(cached_user["uid"]),
+            role=cached_user.get("role") or subject.get("role"),
+            name=cached_user.get("name")
+        )
+
+    else:
+        palantir_client = request.app.state.foundry_client
+        user = await foundry_call("User.get", palantir_client.ontology.objects.User.get, user_id)
+
+        if not user:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
+
+        principal = PrincipalSchema(uid=user.uid, role=user.role or subject.get("role"), name=user.name)
+
+        redis_pipe = redis_connection.pipeline()
+        await redis_pipe.hset(f"user:{user_id}", mapping={
+            "uid": principal.uid,
+            "role": principal.role or "",
+            "name": principal.name or "",
+        })
+        await redis_pipe.expire(f"user:{user_id}", USER_CACHE_TTL_SECONDS)
+        await redis_pipe.execute()
+
+    principal_cache.set(user_id, principal)
+    return principal
+
+
+def invalidate_principal(user_id: int) -> None:
+    """
+    Drop a user from this worker's principal cache, call it whenever the User object is edited.
+    """
+    principal_cache.pop(user_id)
+
+
+def _drop_invalidated_principals(tags: list[str]) -> None:
+    for tag in tags:
+        object_type, user_id = parse_cache_tag(tag)
+        if object_type != settings.USER_API_NAME:
+            continue
+
+        if user_id is None:
+            principal_cache.clear()
+        else:
+            invalidate_principal(user_id)
+
+#User edits made by any worker are published as cache invalidations, see services/cache_tags.py
+add_invalidation_listener(_drop_invalidated_principals)
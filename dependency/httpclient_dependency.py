@@ -1,9 +1,10 @@
-import httpx
 from fastapi import Request
 
-async def get_http_client(request: Request) -> httpx.AsyncClient:
+from services.upstream_client import UpstreamClient
+
+async def get_http_client(request: Request) -> UpstreamClient:
     """
-    Dependency function to get the HTTP client from the FastAPI application state.
+    Dependency function to get the upstream HTTP client from the FastAPI application state.
     :param request:
     :return:
     """
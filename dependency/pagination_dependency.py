@@ -0,0 +1,17 @@
+from typing import Optional
+
+from fastapi import Query
+
+from pydantic_schemas.pagination_pydantic import PageParamsSchema
+from utils.config import settings
+
+def get_page_params(
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page."),
+    limit: Optional[int] = Query(None, ge=1, le=settings.ONTOLOGY_MAX_PAGE_SIZE, description="Page size."),
+    stream: bool = Query(False, description="Stream every object as one NDJSON line instead of a JSON body.")
+) -> PageParamsSchema:
+    """
+    Dependency function parsing the pagination query parameters of the bulk listing endpoints.
+    Without any of them the endpoints return the whole listing as before.
+    """
+    return PageParamsSchema(cursor=cursor, limit=limit, stream=stream)
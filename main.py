@@ -1,8 +1,9 @@
-import httpx
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from ai_interviewer_sdk import FoundryClient, UserTokenAuth
 
 from pydantic_schemas.response_pydantic import ResponseSchema
 from routes.allqna_route import all_qna_router
@@ -14,7 +15,63 @@ from routes.dashboard_route import dashboard_router
 from routes.uploadfile_route import upload_router
 from routes.interviewagent_route import agent_router
 from routes.practice_route import practice_router
-app = FastAPI()
+from routes.job_route import job_router
+from routes.metrics_route import metrics_router
+from routes.trace_route import trace_router
+from db.redisConnection import redis_client
+from services.agent_session_pool import agent_session_pool
+from services.cache_tags import run_invalidation_subscriber
+from services.foundry_client import LazyFoundryClient
+from services.foundry_executor import foundry_executor
+from services.job_queue import JobContext, job_queue
+from services.metrics import metrics_registry, MetricsMiddleware, register_router
+from services.password_hashing import password_hasher
+from services.single_flight import cache_single_flight
+from services.tracing import tracer, TracingMiddleware
+from services.upstream_client import build_upstream_client
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start up without network calls, so new workers are ready as soon as they are up. The Foundry client imports
+    the generated SDK on first use, FOUNDRY_SDK_PRELOAD does that in the background instead of in the first request.
+    Shut down the HTTP client, the Foundry thread pool and the password hashing processes. Jobs the workers are
+    still running are retried by another worker once their lease expires.
+    """
+    app.state.foundry_client = LazyFoundryClient()
+    app.state.client = build_upstream_client()
+    metrics_registry.register_collector("foundry_client", app.state.foundry_client.stats)
+    metrics_registry.register_collector("upstream_client", app.state.client.stats)
+
+    if settings.FOUNDRY_SDK_PRELOAD:
+        app.state.foundry_client_preload_task = asyncio.create_task(app.state.foundry_client.preload())
+
+    #forwards the cache invalidations published by the other workers to this worker's in-process caches
+    app.state.cache_invalidation_task = asyncio.create_task(run_invalidation_subscriber(redis_client))
+
+    #background job workers of this process, more can run as separate processes with scripts/run_job_worker.py
+    job_context = JobContext(redis_connection=redis_client, palantir_client=app.state.foundry_client)
+    job_queue.start_workers(job_context, settings.JOB_QUEUE_IN_APP_WORKERS)
+
+    #keeps pre-created agent sessions ready for new interviews
+    app.state.agent_session_pool_task = asyncio.create_task(agent_session_pool.run_refiller(redis_client, app.state.client))
+
+    try:
+        yield
+    finally:
+        app.state.cache_invalidation_task.cancel()
+        app.state.agent_session_pool_task.cancel()
+        job_queue.stop_workers()
+        await app.state.client.aclose()
+        foundry_executor.shutdown()
+        password_hasher.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,36 +80,31 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TracingMiddleware)
+#outermost, so the request latency includes the other middlewares
+app.add_middleware(MetricsMiddleware)
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+ROUTERS = {
+    "login_router": login_router,
+    "turn_route": turn_route,
+    "dashboard_router": dashboard_router,
+    "upload_router": upload_router,
+    "agent_router": agent_router,
+    "practice_router": practice_router,
+    "allinterview_router": allinterview_router,
+    "all_qna_router": all_qna_router,
+    "job_router": job_router,
+    "metrics_router": metrics_router,
+    "trace_router": trace_router,
+}
 
-app.include_router(login_router)
-app.include_router(turn_route)
-app.include_router(dashboard_router)
-app.include_router(upload_router)
-app.include_router(agent_router)
-app.include_router(practice_router)
-app.include_router(allinterview_router)
-app.include_router(all_qna_router)
-
-@app.on_event("startup")
-async def startup_event():
-    """
-    Startup event to initialize the Palantir Foundry client and HTTP client.
-    :return:
-    """
-    auth = UserTokenAuth(token=settings.FOUNDRY_TOKEN)
-    app.state.foundry_client = FoundryClient(auth=auth, hostname=settings.PALANTIR_PROJECT_URL)
-    app.state.client = httpx.AsyncClient()
-
-    next_id = app.state.foundry_client.ontology.queries.next_resume_cvidas_api()
-    print(f"Next CV ID: {next_id}")
+for router_name, router in ROUTERS.items():
+    app.include_router(router)
+    #the request latency histograms are labelled with the router name
+    register_router(router_name, router)
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    """
-    Shutdown event to close the HTTP client connection.
-    :return:
-    """
-    await app.state.client.aclose()
\ No newline at end of file
+metrics_registry.register_collector("foundry_executor", foundry_executor.stats)
+metrics_registry.register_collector("job_queue", job_queue.stats)
+metrics_registry.register_collector("agent_session_pool", agent_session_pool.stats)
+metrics_registry.register_collector("cache_single_flight", cache_single_flight.stats)
+metrics_registry.register_collector("tracing", tracer.exporter.stats)
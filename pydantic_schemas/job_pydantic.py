@@ -0,0 +1,16 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+class JobSchema(BaseModel):
+    id: str
+    name: str
+    status: str
+    attempts: int
+    max_attempts: int
+    progress: Dict[str, Any]
+    created_at: datetime
+    updated_at: datetime
+    last_error: Optional[str] = None
+    payload: Optional[Dict[str, Any]] = None
@@ -0,0 +1,15 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+class PageParamsSchema(BaseModel):
+    cursor: Optional[str] = None
+    limit: Optional[int] = None
+    stream: bool = False
+
+    @property
+    def paginated(self) -> bool:
+        """
+        True if the client asked for a single page instead of the whole (cached) listing.
+        """
+        return self.cursor is not None or self.limit is not None
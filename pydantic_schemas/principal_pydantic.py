@@ -0,0 +1,8 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+class PrincipalSchema(BaseModel):
+    uid: int
+    role: Optional[str] = None
+    name: Optional[str] = None
@@ -1,8 +1,48 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Generic, List, Optional, Dict, Any, TypeVar
+
+from pydantic_schemas.combinedresults_pydantic import CombinedResultSchema
+from pydantic_schemas.interviewsession_pydantic import InterviewSessionSchema
+from pydantic_schemas.practiceplan_pydantic import PracticePlanSchema
+from pydantic_schemas.practicetask_pydantic import PracticeTaskSchema
+from pydantic_schemas.turn_pydantic import TurnSchema
+
+DataT = TypeVar("DataT")
 
 class ResponseSchema(BaseModel):
     success: bool = True
     status_code: int
     message: Optional[str] = None
-    data: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    data: Optional[Dict[str, Any]] = None
+
+class ResponseEnvelope(BaseModel, Generic[DataT]):
+    """
+    Typed variant of ResponseSchema, serializes to the same JSON but pydantic-core knows the type of every field.
+    """
+    success: bool = True
+    status_code: int
+    message: Optional[str] = None
+    data: Optional[DataT] = None
+
+class DashboardDataSchema(BaseModel):
+    CombinedResult: List[CombinedResultSchema]
+    InterviewSession: List[InterviewSessionSchema]
+    PracticePlans: List[PracticePlanSchema]
+    PracticeTasks: List[PracticeTaskSchema]
+    role: Optional[str] = None
+
+class InterviewRunsPageDataSchema(DashboardDataSchema):
+    next_cursor: Optional[str] = None
+
+class PracticeDetailsDataSchema(BaseModel):
+    practice_plan: List[PracticePlanSchema]
+    practice_tasks: List[PracticeTaskSchema]
+
+class PracticeDetailsPageDataSchema(PracticeDetailsDataSchema):
+    next_cursor: Optional[str] = None
+
+class TurnsDataSchema(BaseModel):
+    turn: List[TurnSchema]
+
+class TurnsPageDataSchema(TurnsDataSchema):
+    next_cursor: Optional[str] = None
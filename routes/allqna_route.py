@@ -1,23 +1,29 @@
-import pickle
-from datetime import datetime, time
-
 from fastapi import APIRouter, Depends, HTTPException, Request
-from typing import Iterator, Optional, List
-from ai_interviewer_sdk.ontology.object_sets import UserObjectSet, InterviewSessionObjectSet, TurnObjectSet
-from ai_interviewer_sdk import FoundryClient
+from typing import TYPE_CHECKING, Iterator, Optional, List
+from pydantic_core import to_json
 from redis.asyncio import Redis
 
 from pydantic_schemas.turn_pydantic import TurnSchema
-from utils.utils import encode_for_cache, decode_from_cache
+from services.cache_tags import cache_tag, tag_cache_entry
+from services.foundry_executor import foundry_call
+from services.metrics import record_cache_lookup
+from services.ontology_projection import qna_turn_projector
+from utils.cache_codec import encode_cache_json
+from utils.json_response import cached_envelope, encode_envelope, EncodedJSONResponse
 from permissions.user_permissions import user_can
+from utils.config import settings
 from db.redisConnection import get_redis_connection
-from dependency.auth_dependency import authenticate_request
+from dependency.auth_dependency import get_current_principal
 from pydantic_schemas.combinedresults_pydantic import CombinedResultSchema
 from pydantic_schemas.interviewsession_pydantic import InterviewSessionSchema
 from pydantic_schemas.practiceplan_pydantic import PracticePlanSchema
 from pydantic_schemas.practicetask_pydantic import PracticeTaskSchema
-from pydantic_schemas.response_pydantic import ResponseSchema
-from ai_interviewer_sdk.ontology.objects import User, Turn, InterviewSession, CombinedResult, PracticePlan, PracticeTask
+from pydantic_schemas.principal_pydantic import PrincipalSchema
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk.ontology.object_sets import UserObjectSet, InterviewSessionObjectSet, TurnObjectSet
+    from ai_interviewer_sdk import FoundryClient
+    from ai_interviewer_sdk.ontology.objects import User, Turn, InterviewSession, CombinedResult, PracticePlan, PracticeTask
 
 all_qna_router = APIRouter(
     prefix="/api/qna",
@@ -29,40 +35,36 @@ all_qna_router = APIRouter(
 async def get_qna_by_iid(
         request: Request,
         query_iid: int,
-        jwt_payload: dict = Depends(authenticate_request),
+        principal: PrincipalSchema = Depends(get_current_principal),
         redis_connection: Redis = Depends(get_redis_connection)):
 
     """
     Endpoint to get all QnA for a specific interview session by its ID.
     :param request:
-    :param jwt_payload:
+    :param principal:
     :param redis_connection:
     :return:
     """
 
-    user_id = jwt_payload.get("sub").get("uid")
+    from ai_interviewer_sdk.ontology.objects import Turn
 
-    palantir_client: FoundryClient = request.app.state.foundry_client
+    user_id = principal.uid
 
-    user: User = palantir_client.ontology.objects.User.get(user_id)
+    palantir_client: FoundryClient = request.app.state.foundry_client
 
     print("Fetching QnA for user ID: ", user_id, " and interview session ID: ", query_iid)
 
-    if not user:
-        print("User not found for ID: ", user_id)
-        raise HTTPException(status_code=404, detail="User not found.")
-
-    cached_qna = await redis_connection.get(f"allqna_cache:{user_id}")
+    redis_cache_key = f"allqna_cache:{user_id}:{query_iid}"
+    cached_qna = await redis_connection.get(redis_cache_key)
+    record_cache_lookup(redis_cache_key, hit=cached_qna is not None)
 
     if cached_qna:
-        return ResponseSchema(
-            success=True,
-            status_code=200,
-            message="QnA retrieved from cache.",
-            data={
-                "OnA": decode_from_cache(cached_qna)
-            }
-        )
+        try:
+            return cached_envelope("QnA retrieved from cache.", {"OnA": cached_qna})
+
+        #the cache entry is stale or from an older deploy, so we are deleting the cache and instead fetch the data again
+        except Exception:
+            await redis_connection.delete(redis_cache_key)
 
 
     Turn_object_set: TurnObjectSet = (
@@ -70,47 +72,20 @@ async def get_qna_by_iid(
         .where(Turn.object_type.iid == query_iid)
     )
 
-    turns_list: List[TurnSchema] = []
-
-    for turn in Turn_object_set.iterate():
-        turns_list.append(TurnSchema(
-            qaid=turn.qaid,
-            question=turn.question,
-            answer=turn.answer,
-            blocked=turn.blocked,
-            clarity= turn.clarity,
-            composite_star=turn.composite_star,
-            filler=turn.filler,
-            iid=turn.iid,
-            issues=turn.issues,
-            justification= turn.justification,
-            relevance= turn.relevance,
-            repair_attempts= turn.repair_attempts,
-            safety_flags= turn.safety_flags,
-            star_a= turn.star_a,
-            star_r= turn.star_r,
-            star_s= turn.star_s,
-            star_t= turn.star_t,
-            target_competency= turn.target_competency,
-            technical_depth= turn.technical_depth,
-            transcript_text=turn.transcript_text,
-            turn_index= turn.turn_index,
-            uid= user_id,
-            created_at= turn.created_at if turn.created_at else datetime.now(),
-            updated_at= turn.updated_at if turn.updated_at else datetime.now()
-        ))
+    turns: List[Turn] = await foundry_call("Turn.iterate", lambda: list(Turn_object_set.iterate()))
+
+    turns_list: List[TurnSchema] = qna_turn_projector.project_many(turns, uid=user_id)
 
     if not turns_list:
         print("No qna for iid: ", query_iid)
         raise HTTPException(status_code=404, detail="No QnA found for the given interview session ID.")
 
-    await redis_connection.set(f"allqna_cache:{user_id}", encode_for_cache(turns_list), ex=60*10)
+    #serialized once, the same JSON goes into the cache entry and the response body
+    turns_json = to_json(turns_list).decode()
 
-    return ResponseSchema(
-        success=True,
-        status_code=200,
-        message="QnA retrieved successfully.",
-        data={
-            "OnA": turns_list
-        }
-    )
+    await redis_connection.set(redis_cache_key, encode_cache_json(turns_json), ex=settings.QNA_CACHE_TTL_SECONDS)
+
+    #the turns are looked up by iid only, so they may belong to any user
+    await tag_cache_entry(redis_connection, redis_cache_key, tags=[cache_tag(settings.TURN_API_NAME)], ttl_seconds=settings.QNA_CACHE_TTL_SECONDS)
+
+    return EncodedJSONResponse(encode_envelope("QnA retrieved successfully.", {"OnA": turns_json}))
@@ -1,227 +1,290 @@
-import pickle
-from datetime import datetime, time
-
 from fastapi import APIRouter, Depends, HTTPException, Request
-from typing import Iterator, Optional, List
-from ai_interviewer_sdk.ontology.object_sets import UserObjectSet, InterviewSessionObjectSet, PracticePlanObjectSet
-from ai_interviewer_sdk import FoundryClient
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, List
+from pydantic_core import to_json
 from redis.asyncio import Redis
 
-from utils.utils import encode_for_cache, decode_from_cache
+from services.cache_tags import cache_tag, read_tag_generations
+from services.coach_view import CoachView, load_coach_view
+from services.foundry_executor import foundry_call
+from services.metrics import record_cache_lookup
+from services.ontology_loader import load_session_bundle, SessionBundle
+from services.response_cache import is_stale, read_cache_hash, schedule_cache_refresh, write_cache_hash
+from services.single_flight import cache_single_flight
+from services.ontology_projection import (
+    combined_result_projector,
+    dashboard_practice_task_projector,
+    interview_session_projector,
+    practice_plan_projector
+)
+from utils.cache_codec import encode_cache_json
+from utils.json_response import cached_envelope, encode_envelope, EncodedJSONResponse
 from permissions.user_permissions import user_can
+from utils.config import settings
 from db.redisConnection import get_redis_connection
-from dependency.auth_dependency import authenticate_request
+from dependency.auth_dependency import get_current_principal
 from pydantic_schemas.combinedresults_pydantic import CombinedResultSchema
 from pydantic_schemas.interviewsession_pydantic import InterviewSessionSchema
 from pydantic_schemas.practiceplan_pydantic import PracticePlanSchema
 from pydantic_schemas.practicetask_pydantic import PracticeTaskSchema
+from pydantic_schemas.principal_pydantic import PrincipalSchema
 from pydantic_schemas.response_pydantic import ResponseSchema
-from ai_interviewer_sdk.ontology.objects import User, InterviewSession, CombinedResult, PracticePlan, PracticeTask
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk.ontology.object_sets import UserObjectSet, InterviewSessionObjectSet, PracticePlanObjectSet
+    from ai_interviewer_sdk import FoundryClient
+    from ai_interviewer_sdk.ontology.objects import User, InterviewSession, CombinedResult, PracticePlan, PracticeTask
 
 dashboard_router = APIRouter(
     prefix="/api/dashboard",
     tags=["Dashboard"]
 )
 
+#object types the dashboard cache is built from
+DASHBOARD_OBJECT_TYPES = [
+    settings.INTERVIEW_SESSION_API_NAME,
+    settings.COMBINED_RESULT_API_NAME,
+    settings.PRACTICE_PLAN_API_NAME,
+    settings.PRACTICE_TASK_API_NAME,
+]
+
+#response data key -> dashboard cache field, in response order
+DASHBOARD_RESPONSE_FIELDS = {
+    "CombinedResult": "combined_result",
+    "InterviewSession": "interview_session",
+    "PracticePlans": "practice_plans",
+    "PracticeTasks": "practice_tasks",
+}
+
+DASHBOARD_CACHE_FIELDS = list(DASHBOARD_RESPONSE_FIELDS.values())
+
+
+def dashboard_cache_tags(user_id: int, role: str) -> List[str]:
+    """
+    Cache tags of the dashboard entry of a user, coaches see the sessions of every user, candidates only their own.
+    """
+    tag_uid = None if user_can(role, "all_view_combined_results") else user_id
+    return [cache_tag(object_type, tag_uid) for object_type in DASHBOARD_OBJECT_TYPES]
+
+
+def dashboard_response_from_cache(cached_data: Dict[str, str]) -> EncodedJSONResponse:
+    """
+    Build the response from a cached entry, the cached JSON is spliced into the body without decoding it.
+    Cache entries carry a schema version header, cached_envelope raises for entries written by an older deploy.
+    """
+    return cached_envelope(
+        "Dashboard data retrieved successfully from cache.",
+        {response_field: cached_data[cache_field] for response_field, cache_field in DASHBOARD_RESPONSE_FIELDS.items()}
+    )
+
+
+async def build_dashboard_data(palantir_client: "FoundryClient", redis_connection: Redis, user_id: int, role: str) -> EncodedJSONResponse:
+    """
+    Load the dashboard data from Palantir and write it to the dashboard cache.
+    Used by the endpoint on a cache miss and by the background refresh of stale entries.
+    """
+    from ai_interviewer_sdk.ontology.objects import InterviewSession
+
+    #read before the data, an invalidation while the dashboard is built keeps the older data out of the cache
+    tag_generations: Dict[str, str] = await read_tag_generations(redis_connection, dashboard_cache_tags(user_id, role))
+
+    if user_can(role, "all_view_combined_results"):
+        return await build_coach_dashboard_data(palantir_client, redis_connection, user_id, role, tag_generations)
+
+    user_interview_session_object_set: InterviewSessionObjectSet = (
+        palantir_client.ontology.objects.InterviewSession
+        .where(InterviewSession.object_type.uid == user_id)
+    )
+    interview_session_list: List[InterviewSession] = await foundry_call("InterviewSession.iterate", lambda: list(user_interview_session_object_set.iterate()))
+    interview_session: List[InterviewSession] = [max(interview_session_list, key=lambda x: x.created_at, default=None)]
+
+    if not interview_session or interview_session[0] is None:
+        return EncodedJSONResponse(ResponseSchema(
+            success=True,
+            status_code=200,
+            message="No interview sessions found. Take new interview to get started.",
+            data={}
+        ))
+
+    #load the combined results, practice plans and practice tasks of all the sessions in a few set based queries and join them in memory
+    session_bundle: SessionBundle = await load_session_bundle(
+        palantir_client,
+        iids=[each_interview_session.iid for each_interview_session in interview_session]
+    )
+
+    combined_result: List[CombinedResult] = [
+        session_bundle.combined_results[each_interview_session.iid]
+        for each_interview_session in interview_session
+        if each_interview_session.iid in session_bundle.combined_results
+    ]
+
+    if not combined_result:
+        return EncodedJSONResponse(ResponseSchema(
+            success=True,
+            status_code=200,
+            message="Processing the results. Please wait or try again later.",
+        ))
+
+    #the bundle only holds the plans of the candidate's most recent interview session
+    practice_plan_list: List[PracticePlan] = [
+        practice_plan
+        for each_interview_session in interview_session
+        for practice_plan in session_bundle.practice_plans.get(each_interview_session.iid, [])
+    ]
+
+    practice_task_list: List[PracticeTask] = [
+        session_bundle.practice_tasks[practice_plan.ppid]
+        for practice_plan in practice_plan_list
+        if practice_plan.ppid in session_bundle.practice_tasks
+    ]
 
-def get_linked_interview_sessions_from_object(
-    source: User
-) -> Iterator[InterviewSession]:
-    linked_object_set: InterviewSessionObjectSet = source.interview_sessions()
-    return linked_object_set.iterate()
+    combined_result_data: List[CombinedResultSchema] = combined_result_projector.project_many(combined_result)
 
-def get_linked_practice_plans_from_object(
-    source: InterviewSession
-) -> Iterator[PracticePlan]:
-    linked_object_set: PracticePlanObjectSet = source.practice_plans()
-    return linked_object_set.iterate()
+    practice_plan_list_data: List[PracticePlanSchema] = practice_plan_projector.project_many(practice_plan_list)
+
+    practice_task_list_data: List[PracticeTaskSchema] = dashboard_practice_task_projector.project_many(practice_task_list)
+
+    interview_session_data: List[InterviewSessionSchema] = interview_session_projector.project_many(interview_session)
+
+    return await cache_dashboard_data(
+        redis_connection, user_id, role, tag_generations,
+        combined_result_data, interview_session_data, practice_plan_list_data, practice_task_list_data
+    )
+
+
+async def build_coach_dashboard_data(
+    palantir_client: "FoundryClient",
+    redis_connection: Redis,
+    user_id: int,
+    role: str,
+    tag_generations: Dict[str, str]
+) -> EncodedJSONResponse:
+    """
+    Dashboard of coaches and admins, it spans every user so it is assembled from the incrementally maintained
+    coach view in redis (services/coach_view.py) instead of a full scan of the ontology.
+    """
+    coach_view: CoachView = await load_coach_view(redis_connection, palantir_client)
+
+    interview_session_data: List[Dict[str, Any]] = coach_view.interview_sessions
+
+    if not interview_session_data:
+        return EncodedJSONResponse(ResponseSchema(
+            success=True,
+            status_code=200,
+            message="No interview sessions found. Take new interview to get started.",
+            data={}
+        ))
+
+    combined_result_data: List[Dict[str, Any]] = [
+        coach_view.combined_results[each_interview_session["iid"]]
+        for each_interview_session in interview_session_data
+        if each_interview_session["iid"] in coach_view.combined_results
+    ]
+
+    if not combined_result_data:
+        return EncodedJSONResponse(ResponseSchema(
+            success=True,
+            status_code=200,
+            message="Processing the results. Please wait or try again later.",
+        ))
+
+    practice_plan_list_data: List[Dict[str, Any]] = [
+        practice_plan
+        for each_interview_session in interview_session_data
+        for practice_plan in coach_view.practice_plans.get(each_interview_session["iid"], [])
+    ]
+
+    practice_task_list_data: List[Dict[str, Any]] = [
+        coach_view.practice_tasks[practice_plan["ppid"]]
+        for practice_plan in practice_plan_list_data
+        if practice_plan["ppid"] in coach_view.practice_tasks
+    ]
+
+    return await cache_dashboard_data(
+        redis_connection, user_id, role, tag_generations,
+        combined_result_data, interview_session_data, practice_plan_list_data, practice_task_list_data
+    )
+
+
+async def cache_dashboard_data(
+    redis_connection: Redis,
+    user_id: int,
+    role: str,
+    tag_generations: Dict[str, str],
+    combined_result_data: List[Any],
+    interview_session_data: List[Any],
+    practice_plan_list_data: List[Any],
+    practice_task_list_data: List[Any]
+) -> EncodedJSONResponse:
+    """
+    Write the dashboard data to the dashboard cache and build the response.
+    :param tag_generations: Generations of the dashboard cache tags, read before the data was loaded.
+    """
+    #serialized once, the same JSON goes into the cache entry and the response body
+    json_fields = {
+        "CombinedResult": to_json(combined_result_data).decode(),
+        "InterviewSession": to_json(interview_session_data).decode(),
+        "PracticePlans": to_json(practice_plan_list_data).decode(),
+        "PracticeTasks": to_json(practice_task_list_data).decode(),
+    }
+
+    await write_cache_hash(
+        redis_connection,
+        f"dashboard_cache:{user_id}",
+        mapping={
+            cache_field: encode_cache_json(json_fields[response_field])
+            for response_field, cache_field in DASHBOARD_RESPONSE_FIELDS.items()
+        },
+        soft_ttl_seconds=settings.DASHBOARD_CACHE_SOFT_TTL_SECONDS,
+        hard_ttl_seconds=settings.DASHBOARD_CACHE_TTL_SECONDS,
+        tag_generations=tag_generations
+    )
+
+    return EncodedJSONResponse(encode_envelope("Dashboard data retrieved successfully.", json_fields, role=role))
 
 @dashboard_router.get("/get-dashboard-data")
-async def get_dashboard_data(request: Request, jwt_payload: dict = Depends(authenticate_request), redis_connection: Redis = Depends(get_redis_connection)):
+async def get_dashboard_data(request: Request, principal: PrincipalSchema = Depends(get_current_principal), redis_connection: Redis = Depends(get_redis_connection)):
     """
     Endpoint to get dashboard data.
     """
-    user_id = jwt_payload.get("sub").get("uid")
-    role = jwt_payload.get("sub").get("role")
+    user_id = principal.uid
+    role = principal.role
 
     palantir_client: FoundryClient = request.app.state.foundry_client
 
-    user: User = palantir_client.ontology.objects.User.get(user_id)
+    redis_cache_key = f"dashboard_cache:{user_id}"
+    cached_data = await read_cache_hash(redis_connection, redis_cache_key, DASHBOARD_CACHE_FIELDS)
+    record_cache_lookup(redis_cache_key, hit=cached_data is not None)
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found.")
+    if cached_data:
 
-    cached_data = await redis_connection.hgetall(f"dashboard_cache:{user_id}")
+        try:
+            cached_response = dashboard_response_from_cache(cached_data)
 
-    if cached_data and all(k in cached_data for k in ["combined_result", "practice_plans", "interview_session", "practice_tasks"]):
+            #past the soft expiry the stale dashboard is served right away and rebuilt in the background
+            if is_stale(cached_data):
+                schedule_cache_refresh(
+                    redis_connection,
+                    redis_cache_key,
+                    lambda: build_dashboard_data(palantir_client, redis_connection, user_id, role)
+                )
 
-        try:
-            #i am decoding and encoding the redis cache because the data is stored as stringifiable bytes, so i need to use base64 decoding and encoding to avoid data corruption
-            combined_result = decode_from_cache(cached_data["combined_result"])
-            practice_plans = decode_from_cache(cached_data["practice_plans"])
-            interview_session = decode_from_cache(cached_data["interview_session"])
-            practice_tasks = decode_from_cache(cached_data["practice_tasks"])
-
-            return ResponseSchema(
-                success=True,
-                status_code=200,
-                message="Dashboard data retrieved successfully from cache.",
-                data={
-                    "CombinedResult": combined_result,
-                    "InterviewSession": interview_session,
-                    "PracticePlans": practice_plans,
-                    "PracticeTasks": practice_tasks
-                }
-            )
+            return cached_response
 
         #something went wrong while decoding the cache, so we are deleting the cache and instead fetch the data again
         except Exception:
-            await redis_connection.delete(f"dashboard_cache:{user_id}")
+            await redis_connection.delete(redis_cache_key)
 
-    try:
+    async def read_cached() -> Optional[EncodedJSONResponse]:
+        cached_data = await read_cache_hash(redis_connection, redis_cache_key, DASHBOARD_CACHE_FIELDS)
+        return dashboard_response_from_cache(cached_data) if cached_data else None
 
-        if user_can(role, "all_view_combined_results"):
-            interview_session_list: List[InterviewSession] = list(palantir_client.ontology.objects.InterviewSession.iterate())
-            interview_session: List[InterviewSession] = [session for session in interview_session_list]
-        else:
-            interview_session_list: List[InterviewSession] = list(get_linked_interview_sessions_from_object(source=user))
-            interview_session: List[InterviewSession] = [max(interview_session_list, key=lambda x: x.created_at, default=None)]
-
-        if not interview_session or interview_session[0] is None:
-            return ResponseSchema(
-                success=True,
-                status_code=200,
-                message="No interview sessions found. Take new interview to get started.",
-                data={}
-            )
-
-        combined_result: List[CombinedResult] = [each_combined_results.combined_result() for each_combined_results in interview_session]
-
-        if not combined_result:
-            return ResponseSchema(
-                success=True,
-                status_code=200,
-                message="Processing the results. Please wait or try again later.",
-            )
-
-        practice_plan_iterator: List[Iterator[PracticePlan]] = [get_linked_practice_plans_from_object(source=each_interview_session) for each_interview_session in interview_session]
-
-        practice_plan_list: List[PracticePlan] = []
-        practice_task_list: List[PracticeTask] = []
-
-        for iterator in practice_plan_iterator:
-            for practice_plan in iterator:
-
-                if user_can(role, "all_view_combined_results"):
-                    practice_plan_list.append(practice_plan)
-                    practice_task_list.append(practice_plan.practice_task())
-
-                else:
-                    #at a time the user will only have 1 most recent interview session, so we access the 1st element directly in interview_session
-                    if practice_plan.iid == interview_session[0].iid:
-                        practice_plan_list.append(practice_plan)
-                        practice_task_list.append(practice_plan.practice_task())
-
-        combined_result_data = [CombinedResultSchema(
-            rid=int(each_combined_results.rid if isinstance(each_combined_results.rid, int) else 0),
-            total_score_25=each_combined_results.total_score25,
-            clarity_avg=each_combined_results.clarity_avg,
-            created_at=each_combined_results.created_at,
-            eval_confidence=each_combined_results.eval_confidence,
-            filler_avg=each_combined_results.filler_avg,
-            gaps=each_combined_results.gaps,
-            iid=each_combined_results.iid,
-            per_metric_weights=each_combined_results.per_metric_weights,
-            recommendation=each_combined_results.recommendation,
-            relevance_avg=each_combined_results.relevance_avg,
-            rubric_version=each_combined_results.rubric_version,
-            star_avg=each_combined_results.star_avg,
-            strengths=each_combined_results.strengths,
-            technical_depth_avg=each_combined_results.technical_depth_avg,
-            turn_indices_used=each_combined_results.turn_indices_used,
-            uid=each_combined_results.uid,
-            updated_at=each_combined_results.updated_at,
-            weaknesses=each_combined_results.weaknesses,
-        )
-            for each_combined_results in combined_result
-        ]
-
-        practice_plan_list_data: List[PracticePlanSchema] = [
-            PracticePlanSchema(
-                ppid=plan.ppid,
-                overall_goal=plan.overall_goal,
-                approved_at=plan.approved_at,
-                approved_by=plan.approved_by,
-                created_at=plan.created_at,
-                created_by=plan.created_by,
-                decline_reason=plan.decline_reason,
-                iid=plan.iid,
-                motivation_note=plan.motivation_note,
-                next_session_suggested_days=plan.next_session_suggestion_days,
-                plan_version=plan.plan_version,
-                reading_list=plan.reading_list,
-                status=plan.status,
-                uid=plan.uid,
-                updated_at=plan.updated_at,
-            )
-            for plan in practice_plan_list
-        ]
-
-        # TODO: chekc palantir ontology for PracticeTask completed_at because its returning '' for some reason
-        practice_task_list_data: List[PracticeTaskSchema] = [
-            PracticeTaskSchema(
-                ptid=task.ptid,
-                competency=task.competency,
-                actions=task.actions,
-                completed_at=task.completed_at if task.completed_at not in ("", None) else datetime.today(),
-                created_at=task.created_at,
-                description=task.description,
-                due_date=datetime.combine(task.due_date, time(23, 59)),
-                est_minutes=task.est_minutes,
-                ppid=task.ppid,
-                priority=task.priority,
-                status=task.status,
-                success_criteria=task.success_criteria,
-                uid=task.uid,
-                updated_at=task.updated_at,
-            )
-            for task in practice_task_list
-        ]
-
-        interview_session_data: List[InterviewSessionSchema] = [InterviewSessionSchema(
-            iid=each_interview_session.iid,
-            uid=each_interview_session.uid,
-            jid=each_interview_session.jid,
-            created_at=each_interview_session.created_at,
-            updated_at=each_interview_session.updated_at,
-            status=each_interview_session.status,
-            started_at=each_interview_session.started_at,
-            ended_at=each_interview_session.ended_at
-        )
-            for each_interview_session in interview_session
-        ]
-        await redis_connection.hset(
-            f"dashboard_cache:{user_id}",
-            mapping={
-                "combined_result": encode_for_cache(combined_result_data),
-                "interview_session": encode_for_cache(interview_session_data),
-                "practice_plans": encode_for_cache(practice_plan_list_data),
-                "practice_tasks": encode_for_cache(practice_task_list_data),
-            }
-        )
-
-        await redis_connection.expire(f"dashboard_cache:{user_id}", 60*15)
-
-        return ResponseSchema(
-            success=True,
-            status_code=200,
-            message="Dashboard data retrieved successfully.",
-            data={"CombinedResult": combined_result_data,
-                  "InterviewSession": interview_session_data,
-                  "PracticePlans": practice_plan_list_data,
-                  "PracticeTasks": practice_task_list_data,
-                  "role": role
-                  }
+    try:
+        #concurrent misses for the same key, in this worker or any other, share a single rebuild
+        return await cache_single_flight.run(
+            redis_connection,
+            redis_cache_key,
+            build=lambda: build_dashboard_data(palantir_client, redis_connection, user_id, role),
+            read_cached=read_cached
         )
 
     except Exception as e:
@@ -1,59 +1,75 @@
+import asyncio
 import json
-from typing import AsyncGenerator
+import logging
+from typing import TYPE_CHECKING, AsyncGenerator
 
 from fastapi import APIRouter, Depends, Request, HTTPException, Body
 from fastapi.responses import StreamingResponse
 import httpx
 from redis.asyncio import Redis
-from ai_interviewer_sdk.ontology.objects import User, InterviewSession
-from foundry_sdk_runtime.types import BatchActionConfig, ReturnEditsMode, ActionConfig, ActionMode, SyncApplyActionResponse
-from ai_interviewer_sdk.ontology.action_types import CreateTurnBatchRequest
-from datetime import datetime, timezone
-from ai_interviewer_sdk import FoundryClient, UserTokenAuth
+from datetime import datetime
 
 from db.redisConnection import get_redis_connection
+from pydantic_schemas.interviewsession_pydantic import InterviewSessionSchema
+from pydantic_schemas.principal_pydantic import PrincipalSchema
 from pydantic_schemas.response_pydantic import ResponseSchema
 from pydantic_schemas.jobdescription_pydantic import JobDescriptionSchema
 from dependency.httpclient_dependency import get_http_client
-from dependency.auth_dependency import authenticate_request
+from dependency.auth_dependency import get_current_principal
+from services.agent_session_pool import agent_session_pool
+from services.cache_tags import invalidate_cache_tags, write_tags
+from services.coach_view import upsert_interview_session
+from services.foundry_executor import foundry_call
+from services.id_allocator import allocate_id
+from services.interview_finalization import enqueue_interview_finalization, InterviewNotActiveError
+from services.interview_state import InterviewState, interview_state_store
+from services.turn_persistence import enqueue_turn_flush
+from services.upstream_client import AGENT_STREAM, CircuitOpenError, UpstreamClient
 from utils.config import settings
 
+if TYPE_CHECKING:
+    from ai_interviewer_sdk.ontology.objects import User, InterviewSession
+    from foundry_sdk_runtime.types import ReturnEditsMode, ActionConfig, ActionMode
+    from ai_interviewer_sdk import FoundryClient, UserTokenAuth
+
+logger = logging.getLogger(__name__)
+
+#sent after the streamed question when it could not be recorded, the interview session expired, was finalized or
+#restarted while the agent answered, so the client has to create a new session instead of answering the question
+SESSION_ENDED_MARKER = "##SESSION_ENDED##"
+
 agent_router = APIRouter(
     prefix="/interviewagent",
     tags=["interviewagent"]
 )
 
 @agent_router.post("/create-session")
-async def create_agent_session(request: Request, job_details: JobDescriptionSchema, jwt_payload: dict[str] = Depends(authenticate_request) , http_client: httpx.AsyncClient = Depends(get_http_client), redis_connection: Redis = Depends(get_redis_connection)):
+async def create_agent_session(request: Request, job_details: JobDescriptionSchema, principal: PrincipalSchema = Depends(get_current_principal) , http_client: UpstreamClient = Depends(get_http_client), redis_connection: Redis = Depends(get_redis_connection)):
     """
     Endpoint to create a new interview agent session.
+    The AIP session (from the warm pool) and the jid + iid allocation run concurrently. The job description and
+    the interview session are only created once both succeeded, so a failed AIP call leaves no records behind,
+    and all the redis state is committed in a single script at the end.
     """
 
-    user_id = jwt_payload.get("sub").get("uid")
+    user_id = principal.uid
 
     palantir_client: FoundryClient = request.app.state.foundry_client
-    user: User = palantir_client.ontology.objects.User.get(user_id)
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found in Palantir ontology.")
+    interview_state: InterviewState = await interview_state_store.load(redis_connection, user_id)
+    cached_agent_session_id = interview_state.agent_session_id
 
-    redis_hash_key = f"interview_agent:{user_id}"
-
-    cached_agent_session_id = await redis_connection.hget(redis_hash_key, "agent_session_id")
+    job_description_mapping = {
+        "role": job_details.role,
+        "company": job_details.company,
+        "minimum_qualification": job_details.min_qualifications,
+        "preferred_qualification": job_details.preferred_qualifications,
+        "jd_summary": job_details.jd_summary,
+    }
 
     if cached_agent_session_id:
-        await redis_connection.hset(redis_hash_key, "current_qna_pointer", str(0))
-        await redis_connection.expire(redis_hash_key, 3600*2)
-
-        await redis_connection.hset(f"jobdescription:{user_id}", mapping={
-            "role": job_details.role,
-            "company": job_details.company,
-            "minimum_qualification": job_details.min_qualifications,
-            "preferred_qualification": job_details.preferred_qualifications,
-            "jd_summary": job_details.jd_summary,
-        })
-
-        await redis_connection.expire(f"jobdescription:{user_id}", 3600)
+        #restart the interview on the existing agent session
+        await interview_state_store.start(redis_connection, user_id, session_fields={}, job_description=job_description_mapping)
 
         return ResponseSchema(
             success=True,
@@ -62,67 +78,55 @@ async def create_agent_session(request: Request, job_details: JobDescriptionSche
             data={"session_id": cached_agent_session_id}
         )
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {settings.PALANTIR_API_KEY}"
-    }
-
-    payload = {
-        "agentVersion": "1.0"
-    }
-
-    try:
-        response = await http_client.post(
-            url=f"{settings.PALANTIR_PROJECT_URL}/api/v2/aipAgents/agents/{settings.INTERVIEWER_AGENT_RID}/sessions?preview=true",
-            headers=headers,
-            json=payload
-        )
-
-        response.raise_for_status()
-
-        data = response.json()
-
-        if "rid" not in data:
-            print("Palantir response does not contain 'rid':", data)
-            raise HTTPException(status_code=500, detail="Missing 'rid' in Palantir response")
-
-        agent_session_id = data["rid"]
-
-        # get the next jid & iid primary key from Palantir ontology
-        new_jid = palantir_client.ontology.queries.next_job_description_id_api()
-        new_iid = palantir_client.ontology.queries.next_interview_session_id_api()
-
-        # creating the job description in Palantir ontology
-        new_job_description: SyncApplyActionResponse = palantir_client.ontology.actions.create_job_description(
-            action_config=ActionConfig(
-                mode=ActionMode.VALIDATE_AND_EXECUTE,
-                return_edits=ReturnEditsMode.ALL),
-            jid=new_jid,
-            role=job_details.role,
-            company=job_details.company,
-            minimum_qualification=job_details.min_qualifications,
-            preferred_qualification=job_details.preferred_qualifications,
-            jd_summary=job_details.jd_summary,
-            competencies="",
-            jd_text=job_details.jd_summary,
-            created_at=datetime.today().replace(microsecond=0),
-            updated_at=datetime.today().replace(microsecond=0)
+    async def allocate_record_ids() -> tuple[int, int]:
+        # get the next jid & iid primary key, both come from the redis id allocator so they do not depend on each other
+        new_jid, new_iid = await asyncio.gather(
+            allocate_id(redis_connection, palantir_client, settings.JOB_DESCRIPTION_API_NAME),
+            allocate_id(redis_connection, palantir_client, settings.INTERVIEW_SESSION_API_NAME)
         )
-
-        new_interview_session: SyncApplyActionResponse = palantir_client.ontology.actions.create_interview_session(
-            action_config=ActionConfig(
-                mode=ActionMode.VALIDATE_AND_EXECUTE,
-                return_edits=ReturnEditsMode.ALL),
-            iid=new_iid,
-            uid=user_id,
-            jid=new_jid,
-            started_at=datetime.today().replace(microsecond=0),
-            status="started",
-            rubric_version="v1",
-            phase_log=json.dumps({"phase1": 3, "phase2": 3, "phase3": 3}),
-            created_at=datetime.today().replace(microsecond=0),
-            updated_at=datetime.today().replace(microsecond=0),
-            ended_at=datetime.today().replace(microsecond=0)
+        return new_jid, new_iid
+
+    async def create_ontology_records(new_jid: int, new_iid: int) -> None:
+        from foundry_sdk_runtime.types import ActionConfig, ActionMode, ReturnEditsMode
+
+        session_created_at = datetime.today().replace(microsecond=0)
+
+        # creating the job description and the interview session in Palantir ontology, the session only needs the jid
+        new_job_description, new_interview_session = await asyncio.gather(
+            foundry_call(
+                "create_job_description",
+                palantir_client.ontology.actions.create_job_description,
+                action_config=ActionConfig(
+                    mode=ActionMode.VALIDATE_AND_EXECUTE,
+                    return_edits=ReturnEditsMode.ALL),
+                jid=new_jid,
+                role=job_details.role,
+                company=job_details.company,
+                minimum_qualification=job_details.min_qualifications,
+                preferred_qualification=job_details.preferred_qualifications,
+                jd_summary=job_details.jd_summary,
+                competencies="",
+                jd_text=job_details.jd_summary,
+                created_at=datetime.today().replace(microsecond=0),
+                updated_at=datetime.today().replace(microsecond=0)
+            ),
+            foundry_call(
+                "create_interview_session",
+                palantir_client.ontology.actions.create_interview_session,
+                action_config=ActionConfig(
+                    mode=ActionMode.VALIDATE_AND_EXECUTE,
+                    return_edits=ReturnEditsMode.ALL),
+                iid=new_iid,
+                uid=user_id,
+                jid=new_jid,
+                started_at=session_created_at,
+                status="started",
+                rubric_version="v1",
+                phase_log=json.dumps({"phase1": 3, "phase2": 3, "phase3": 3}),
+                created_at=session_created_at,
+                updated_at=session_created_at,
+                ended_at=session_created_at
+            )
         )
 
         if new_job_description.validation.result != "VALID":
@@ -131,25 +135,46 @@ async def create_agent_session(request: Request, job_details: JobDescriptionSche
         if new_interview_session.validation.result != "VALID":
             raise HTTPException(status_code=400, detail="Interview Session creation failed")
 
-        await redis_connection.hset(redis_hash_key, mapping={
-                "agent_session_id": agent_session_id,
-                "current_qna_pointer": str(0),
-                "jid": str(new_jid),
-                "iid": str(new_iid),
-            }
+        await upsert_interview_session(redis_connection, InterviewSessionSchema(
+            iid=new_iid, uid=user_id, jid=new_jid, status="started",
+            started_at=session_created_at, ended_at=session_created_at,
+            created_at=session_created_at, updated_at=session_created_at
+        ))
+
+    try:
+        agent_session, record_ids = await asyncio.gather(
+            agent_session_pool.acquire(redis_connection, http_client),
+            allocate_record_ids(),
+            return_exceptions=True
         )
 
-        await redis_connection.hset(f"jobdescription:{user_id}", mapping={
-            "jid": str(new_jid),
-            "role": job_details.role,
-            "company": job_details.company,
-            "minimum_qualification": job_details.min_qualifications,
-            "preferred_qualification": job_details.preferred_qualifications,
-            "jd_summary": job_details.jd_summary,
-            })
+        if isinstance(agent_session, BaseException):
+            #unused ids are only a gap in the primary keys
+            raise agent_session
 
-        await redis_connection.expire(redis_hash_key, 3600*2)
-        await redis_connection.expire(f"jobdescription:{user_id}", 3600)
+        try:
+            if isinstance(record_ids, BaseException):
+                raise record_ids
+
+            new_jid, new_iid = record_ids
+            await create_ontology_records(new_jid, new_iid)
+
+        except Exception:
+            #the agent session is still unused, another interview can take it
+            await agent_session_pool.release(redis_connection, agent_session)
+            raise
+
+        agent_session_id = agent_session.rid
+
+        await interview_state_store.start(
+            redis_connection,
+            user_id,
+            session_fields={"agent_session_id": agent_session_id, "jid": new_jid, "iid": new_iid},
+            job_description={"jid": new_jid, **job_description_mapping}
+        )
+
+        #the new interview session shows up in the interview runs and the dashboard
+        await invalidate_cache_tags(redis_connection, write_tags(settings.INTERVIEW_SESSION_API_NAME, user_id))
 
         return ResponseSchema(
             success=True,
@@ -158,9 +183,18 @@ async def create_agent_session(request: Request, job_details: JobDescriptionSche
             data={"session_id": agent_session_id}
         )
 
+    except HTTPException:
+        raise
+
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
 
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Palantir did not respond in time")
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -169,31 +203,26 @@ async def create_agent_session(request: Request, job_details: JobDescriptionSche
 async def send_message_streaming(
     request: Request,
     message: str = Body(..., embed=True),
-    jwt_payload: dict[str] = Depends(authenticate_request),
-    http_client: httpx.AsyncClient = Depends(get_http_client),
+    principal: PrincipalSchema = Depends(get_current_principal),
+    http_client: UpstreamClient = Depends(get_http_client),
     redis_connection: Redis = Depends(get_redis_connection)
 ):
     """
     Endpoint to send message to Palantir AIP Agent in streaming mode.
     """
 
-    user_id = jwt_payload.get("sub").get("uid")
+    user_id = principal.uid
 
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID not found in JWT payload.")
 
-    redis_hash_key = f"interview_agent:{user_id}"
-
-    fields = ["agent_session_id", "current_qna_pointer"]
-    cached_session_rid, question_counter = await redis_connection.hmget(redis_hash_key, fields)
+    interview_state: InterviewState = await interview_state_store.load(redis_connection, user_id, include_job_description=message == "<start>")
+    cached_session_rid = interview_state.agent_session_id
     if not cached_session_rid:
         print("Cached session RID not found in Redis for user:", user_id)
         raise HTTPException(status_code=404, detail="No active session found. Please create a session first.")
 
-    palantir_client = request.app.state.foundry_client
-
     streaming_url = f"{settings.PALANTIR_PROJECT_URL}/api/v2/aipAgents/agents/{settings.INTERVIEWER_AGENT_RID}/sessions/{cached_session_rid}/streamingContinue?preview=true"
-    url = f"{settings.PALANTIR_PROJECT_URL}/api/v2/aipAgents/agents/{settings.INTERVIEWER_AGENT_RID}/sessions/{cached_session_rid}/blockingContinue?preview=true"
 
     headers = {
         "Authorization": f"Bearer {settings.PALANTIR_API_KEY}",
@@ -204,7 +233,7 @@ async def send_message_streaming(
     # initial_prompt = "Read the below job context and Directly start the behavioral interview, dont tell any of your starter sentences, only respond with the 1st question directly!!"
 
     if message == "<start>":
-        job_info = await redis_connection.hgetall(f"jobdescription:{user_id}")
+        job_info = interview_state.job_description
 
         job_context = (
             f"Role: {job_info.get('role', 'N/A')}\n"
@@ -224,118 +253,85 @@ async def send_message_streaming(
         }
     }
 
-    redis_pipe = redis_connection.pipeline()
     buffer = []
 
     text = "##END_INTERVIEW##"
 
-    if message != "<start>":
-        await redis_pipe.rpush(f"interview_agent:{user_id}:answers", message)
+    answer = message if message != "<start>" else None
 
     #limiting the number of questions to 9, but can be increased based on requirements
-    if int(question_counter) >= 9:
-        await redis_pipe.execute()
-        await finalize_interview_logic(user_id, redis_connection, palantir_client)
-    else:
-
-        resp = await http_client.post(url, headers=headers, json=payload)
-        resp.raise_for_status()
-        text = resp.json().get("agentMarkdownResponse", "").strip()
-
-        await redis_pipe.rpush(f"interview_agent:{user_id}:questions", text)
-        await redis_pipe.hset(f"interview_agent:{user_id}", "current_qna_pointer", str(int(question_counter) + 1))
-        await redis_pipe.execute()
-
-    return ResponseSchema(
-        success=True,
-        status_code=200,
-        message="Message sent successfully",
-        data={
-            "text": text
-        }
-    )
+    if interview_state.current_qna_pointer >= 9:
+        #persisting the last turn and completing the session runs on the job queue, the user does not wait for Foundry
+        try:
+            await enqueue_interview_finalization(user_id, redis_connection, answer)
+        except InterviewNotActiveError:
+            raise HTTPException(status_code=409, detail="The interview session expired or was already finalized.")
 
+        return StreamingResponse(iter([text]), media_type="text/plain")
 
-async def finalize_interview_logic(user_id: int, redis_connection: Redis, palantir_client: FoundryClient):
-    redis_hash_key = f"interview_agent:{user_id}"
-
-    questions = await redis_connection.lrange(f"{redis_hash_key}:questions", 0, -1)
-    answers = await redis_connection.lrange(f"{redis_hash_key}:answers", 0, -1)
-
-    if not questions or not answers or len(questions) != len(answers):
-        raise ValueError("Invalid interview data in Redis")
-
-    interview_fields = ["qaid", "iid"]
-    cached_qaid, cached_iid = await redis_connection.hmget(redis_hash_key, interview_fields)
-
-    #convert the str to int after retrieving from redis or palantir
-    new_qaid = int(cached_qaid) if cached_qaid else palantir_client.ontology.queries.next_turn_id_api()
-    cached_iid = int(cached_iid)
-
-    batch_requests = []
-    for idx, (q, a) in enumerate(zip(questions, answers)):
-        batch_requests.append(
-            CreateTurnBatchRequest(
-                qaid=new_qaid, iid=cached_iid, uid=user_id,
-                turn_index=idx,
-                question=q, answer=a,
-                target_competency="phone-interview",
-                audio_url="", transcript_text=a,
-                created_at=datetime.now(timezone.utc),
-                updated_at=datetime.now(timezone.utc),
-                repair_attempts=0,
-                relevance=0,
-                star_a= 0,
-                clarity=0,
-                filler=0.0,
-                issues="",
-                technical_depth=0,
-                blocked=False,
-                composite_star=0.0,
-                star_r=0,
-                star_s=0,
-                justification="",
-                star_t=0,
-                safety_flags=""
-            )
-        )
+    #only one message at a time can answer the current question, a double submit gets a 409 instead of a second turn
+    turn_token = await interview_state_store.reserve_turn(redis_connection, user_id, interview_state)
+    if turn_token is None:
+        raise HTTPException(status_code=409, detail="Another message of this interview is being answered, please try again.")
 
-        new_qaid += 1
+    async def open_agent_stream() -> httpx.Response:
+        #open the upstream stream before returning, so that palantir errors are still reported as proper http errors
+        try:
+            upstream_response = await http_client.stream(AGENT_STREAM, "POST", streaming_url, headers=headers, json=payload)
 
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=str(e))
 
-    response = palantir_client.ontology.batch_actions.create_turn(
-        batch_action_config=BatchActionConfig(return_edits=ReturnEditsMode.ALL),
-        requests=batch_requests
-    )
+        except httpx.TimeoutException:
+            raise HTTPException(status_code=504, detail="Palantir did not respond in time")
 
-    current_interview_data: InterviewSession = palantir_client.ontology.objects.InterviewSession.get(cached_iid)
-
-    edit_interview_session: SyncApplyActionResponse = palantir_client.ontology.actions.edit_interview_session(
-        action_config=ActionConfig(
-            mode=ActionMode.VALIDATE_AND_EXECUTE,
-            return_edits=ReturnEditsMode.ALL),
-        interview_session=cached_iid,
-        uid=user_id,
-        jid=current_interview_data.jid,
-        started_at=current_interview_data.started_at,
-        ended_at=datetime.now(timezone.utc),
-        status="completed",
-        rubric_version="v1",
-        phase_log=current_interview_data.phase_log,
-        created_at=current_interview_data.created_at,
-        updated_at=datetime.now(timezone.utc)
-    )
+        if upstream_response.is_error:
+            await upstream_response.aread()
+            await upstream_response.aclose()
+            raise HTTPException(status_code=upstream_response.status_code, detail=upstream_response.text)
 
-    if edit_interview_session.validation.result != "VALID":
-        raise HTTPException(status_code=400, detail="Failed to mark interview session as completed")
+        return upstream_response
 
-    await redis_connection.delete(
-        redis_hash_key,
-        f"{redis_hash_key}:questions",
-        f"{redis_hash_key}:answers",
-        f"interview_agent:{user_id}:qaid",
-        f"interview_agent:{user_id}:iid",
-        f"jobdescription:{user_id}"
+    try:
+        upstream_response = await open_agent_stream()
+    except BaseException:
+        #the question is not answered, the retried message can take the turn
+        await interview_state_store.release_turn(redis_connection, user_id, turn_token)
+        raise
+
+    async def stream_agent_response() -> AsyncGenerator[str, None]:
+        """
+        Forward the agent output to the client as it arrives and keep a copy of every chunk,
+        the full question is written to redis only after palantir finished the stream.
+        """
+        current_qna_pointer = None
+        try:
+            try:
+                async for chunk in upstream_response.aiter_text():
+                    buffer.append(chunk)
+                    yield chunk
+            finally:
+                await upstream_response.aclose()
+
+            question_text = "".join(buffer).strip()
+
+            #the answer, the question and the pointer are written together, a dropped stream records neither
+            current_qna_pointer = await interview_state_store.append_turn(redis_connection, user_id, turn_token, question_text, answer=answer)
+
+            if current_qna_pointer < 0:
+                logger.warning("Interview state of user %s is gone, the streamed question was not recorded", user_id)
+                yield SESSION_ENDED_MARKER
+
+        finally:
+            if current_qna_pointer is None:
+                await interview_state_store.release_turn(redis_connection, user_id, turn_token)
+
+        #the answered turn goes to Foundry in the background, redis only holds it until then
+        if answer is not None and current_qna_pointer > 0 and interview_state.iid:
+            await enqueue_turn_flush(redis_connection, user_id, interview_state.iid, interview_state.run, current_qna_pointer)
+
+    return StreamingResponse(
+        stream_agent_response(),
+        media_type="text/plain",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-
-    return response
@@ -1,218 +1,281 @@
-import pickle
-from datetime import datetime, time
-
 from fastapi import APIRouter, Depends, HTTPException, Request
-from typing import Iterator, Optional, List
-from ai_interviewer_sdk.ontology.object_sets import UserObjectSet, InterviewSessionObjectSet, PracticePlanObjectSet
-from ai_interviewer_sdk import FoundryClient
+from typing import TYPE_CHECKING, Dict, Iterator, NamedTuple, Optional, List
+from pydantic_core import to_json
 from redis.asyncio import Redis
 
-from utils.utils import encode_for_cache, decode_from_cache
+from services.cache_tags import cache_tag, read_tag_generations
+from services.foundry_executor import foundry_call
+from services.metrics import record_cache_lookup
+from services.ontology_pagination import fetch_page, iterate_pages, ndjson_response, OntologyPage
+from services.ontology_loader import load_session_bundle, SessionBundle
+from services.response_cache import is_stale, read_cache_hash, schedule_cache_refresh, write_cache_hash
+from services.single_flight import cache_single_flight
+from services.ontology_projection import (
+    combined_result_projector,
+    dashboard_practice_task_projector,
+    interview_session_projector,
+    practice_plan_projector
+)
+from utils.cache_codec import encode_cache_json
+from utils.json_response import cached_envelope, encode_envelope, EncodedJSONResponse
 from permissions.user_permissions import user_can
+from utils.config import settings
 from db.redisConnection import get_redis_connection
-from dependency.auth_dependency import authenticate_request
+from dependency.auth_dependency import get_current_principal
+from dependency.pagination_dependency import get_page_params
 from pydantic_schemas.combinedresults_pydantic import CombinedResultSchema
 from pydantic_schemas.interviewsession_pydantic import InterviewSessionSchema
+from pydantic_schemas.pagination_pydantic import PageParamsSchema
 from pydantic_schemas.practiceplan_pydantic import PracticePlanSchema
 from pydantic_schemas.practicetask_pydantic import PracticeTaskSchema
-from pydantic_schemas.response_pydantic import ResponseSchema
-from ai_interviewer_sdk.ontology.objects import User, InterviewSession, CombinedResult, PracticePlan, PracticeTask
+from pydantic_schemas.principal_pydantic import PrincipalSchema
+from pydantic_schemas.response_pydantic import InterviewRunsPageDataSchema, ResponseEnvelope, ResponseSchema
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk.ontology.object_sets import UserObjectSet, InterviewSessionObjectSet, PracticePlanObjectSet
+    from ai_interviewer_sdk import FoundryClient
+    from ai_interviewer_sdk.ontology.objects import User, InterviewSession, CombinedResult, PracticePlan, PracticeTask
 
 allinterview_router = APIRouter(
         prefix="/api/interview-runs",
     tags=["Dashboard"]
 )
 
+#response data key -> interview runs cache field, in response order
+INTERVIEW_RUNS_RESPONSE_FIELDS = {
+    "CombinedResult": "combined_result",
+    "InterviewSession": "interview_session",
+    "PracticePlans": "practice_plans",
+    "PracticeTasks": "practice_tasks",
+}
+
+INTERVIEW_RUNS_CACHE_FIELDS = list(INTERVIEW_RUNS_RESPONSE_FIELDS.values())
+
+#NDJSON record types, in the field order of InterviewRuns
+INTERVIEW_RUNS_RECORD_TYPES = ["InterviewSession", "CombinedResult", "PracticePlan", "PracticeTask"]
+
 
 def get_linked_interview_sessions_from_object(
-    source: User
-) -> Iterator[InterviewSession]:
+    source: "User"
+) -> "Iterator[InterviewSession]":
     linked_object_set: InterviewSessionObjectSet = source.interview_sessions()
     return linked_object_set.iterate()
 
-def get_linked_practice_plans_from_object(
-    source: InterviewSession
-) -> Iterator[PracticePlan]:
-    linked_object_set: PracticePlanObjectSet = source.practice_plans()
-    return linked_object_set.iterate()
+def interview_runs_response_from_cache(cached_data: Dict[str, str]) -> EncodedJSONResponse:
+    """
+    Build the response from a cached entry, the cached JSON is spliced into the body without decoding it.
+    Cache entries carry a schema version header, cached_envelope raises for entries written by an older deploy.
+    """
+    return cached_envelope(
+        "Dashboard data retrieved successfully from cache.",
+        {response_field: cached_data[cache_field] for response_field, cache_field in INTERVIEW_RUNS_RESPONSE_FIELDS.items()}
+    )
 
-@allinterview_router.get("/get-all-interview-sessions")
-async def get_all_interview_runs(request: Request, jwt_payload: dict = Depends(authenticate_request), redis_connection: Redis = Depends(get_redis_connection)):
+
+class InterviewRuns(NamedTuple):
     """
-    Endpoint to get dashboard data.
+    Projected interview sessions with their linked objects, in session order.
     """
-    user_id = jwt_payload.get("sub").get("uid")
-    role = jwt_payload.get("sub").get("role")
+    interview_sessions: List[InterviewSessionSchema]
+    combined_results: List[CombinedResultSchema]
+    practice_plans: List[PracticePlanSchema]
+    practice_tasks: List[PracticeTaskSchema]
 
-    palantir_client: FoundryClient = request.app.state.foundry_client
 
-    user: User = palantir_client.ontology.objects.User.get(user_id)
+def project_interview_runs(interview_session_list: "List[InterviewSession]", session_bundle: SessionBundle) -> InterviewRuns:
+    """
+    Join the sessions with their combined results, practice plans and practice tasks and project them.
+    """
+    combined_result: List[CombinedResult] = [
+        session_bundle.combined_results[each_interview_session.iid]
+        for each_interview_session in interview_session_list
+        if each_interview_session.iid in session_bundle.combined_results
+    ]
+
+    practice_plan_list: List[PracticePlan] = [
+        practice_plan
+        for each_interview_session in interview_session_list
+        for practice_plan in session_bundle.practice_plans.get(each_interview_session.iid, [])
+    ]
+
+    practice_task_list: List[PracticeTask] = [
+        session_bundle.practice_tasks[practice_plan.ppid]
+        for practice_plan in practice_plan_list
+        if practice_plan.ppid in session_bundle.practice_tasks
+    ]
+
+    return InterviewRuns(
+        interview_sessions=interview_session_projector.project_many(interview_session_list),
+        combined_results=combined_result_projector.project_many(combined_result),
+        practice_plans=practice_plan_projector.project_many(practice_plan_list),
+        practice_tasks=dashboard_practice_task_projector.project_many(practice_task_list)
+    )
+
+
+async def build_interview_runs(palantir_client: "FoundryClient", redis_connection: Redis, user_id: int, role: str) -> EncodedJSONResponse:
+    """
+    Load the interview runs of a user from Palantir and write them to the allinterview cache.
+    Used by the endpoint on a cache miss and by the background refresh of stale entries.
+    """
+    from ai_interviewer_sdk.ontology.objects import InterviewSession
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found.")
+    #read before the data, an invalidation while the runs are loaded keeps the older data out of the cache
+    tag_generations: Dict[str, str] = await read_tag_generations(redis_connection, [
+        cache_tag(settings.INTERVIEW_SESSION_API_NAME, user_id),
+        cache_tag(settings.COMBINED_RESULT_API_NAME, user_id),
+        cache_tag(settings.PRACTICE_PLAN_API_NAME, user_id),
+        cache_tag(settings.PRACTICE_TASK_API_NAME, user_id),
+    ])
 
-    cached_data = await redis_connection.hgetall(f"allinterview_cache:{user_id}")
+    interview_session_list: List[InterviewSession] = await foundry_call("InterviewSession.iterate", lambda: list((
+        palantir_client.ontology.objects.InterviewSession.where(InterviewSession.object_type.uid == user_id)
+    ).iterate()))
 
-    if cached_data and all(k in cached_data for k in ["combined_result", "practice_plans", "interview_session", "practice_tasks"]):
+    # interview_session: List[InterviewSession] = [session for session in interview_session_list]
 
-        try:
-            #i am decoding and encoding the redis cache because the data is stored as stringifiable bytes, so i need to use base64 decoding and encoding to avoid data corruption
-            combined_result = decode_from_cache(cached_data["combined_result"])
-            practice_plans = decode_from_cache(cached_data["practice_plans"])
-            interview_session = decode_from_cache(cached_data["interview_session"])
-            practice_tasks = decode_from_cache(cached_data["practice_tasks"])
-
-            return ResponseSchema(
-                success=True,
-                status_code=200,
-                message="Dashboard data retrieved successfully from cache.",
-                data={
-                    "CombinedResult": combined_result,
-                    "InterviewSession": interview_session,
-                    "PracticePlans": practice_plans,
-                    "PracticeTasks": practice_tasks
-                }
-            )
+    if not interview_session_list:
+        return EncodedJSONResponse(ResponseSchema(
+            success=True,
+            status_code=200,
+            message="No interview sessions found. Take new interview to get started.",
+            data={}
+        ))
 
-        #something went wrong while decoding the cache, so we are deleting the cache and instead fetch the data again
-        except Exception:
-            await redis_connection.delete(f"allinterview_cache:{user_id}")
+    #load the combined results, practice plans and practice tasks of all the sessions in a few set based queries and join them in memory
+    session_bundle: SessionBundle = await load_session_bundle(
+        palantir_client,
+        iids=[each_interview_session.iid for each_interview_session in interview_session_list]
+    )
 
-    try:
+    interview_runs: InterviewRuns = project_interview_runs(interview_session_list, session_bundle)
 
-        interview_session_list: List[InterviewSession] = list((
-            palantir_client.ontology.objects.InterviewSession.where(InterviewSession.object_type.uid == user_id)
-        ).iterate())
+    if not interview_runs.combined_results:
+        return EncodedJSONResponse(ResponseSchema(
+            success=True,
+            status_code=200,
+            message="Processing the results. Please wait or try again later.",
+        ))
+
+    #serialized once, the same JSON goes into the cache entry and the response body
+    json_fields = {
+        "CombinedResult": to_json(interview_runs.combined_results).decode(),
+        "InterviewSession": to_json(interview_runs.interview_sessions).decode(),
+        "PracticePlans": to_json(interview_runs.practice_plans).decode(),
+        "PracticeTasks": to_json(interview_runs.practice_tasks).decode(),
+    }
+
+    await write_cache_hash(
+        redis_connection,
+        f"allinterview_cache:{user_id}",
+        mapping={
+            cache_field: encode_cache_json(json_fields[response_field])
+            for response_field, cache_field in INTERVIEW_RUNS_RESPONSE_FIELDS.items()
+        },
+        soft_ttl_seconds=settings.INTERVIEW_RUNS_CACHE_SOFT_TTL_SECONDS,
+        hard_ttl_seconds=settings.INTERVIEW_RUNS_CACHE_TTL_SECONDS,
+        tag_generations=tag_generations
+    )
+
+    return EncodedJSONResponse(encode_envelope("Dashboard data retrieved successfully.", json_fields, role=role))
+
+
+async def load_interview_runs_page(palantir_client: "FoundryClient", interview_session_list: "List[InterviewSession]") -> InterviewRuns:
+    """
+    Load and project the linked objects of one page of interview sessions.
+    """
+    session_bundle: SessionBundle = await load_session_bundle(
+        palantir_client,
+        iids=[each_interview_session.iid for each_interview_session in interview_session_list]
+    )
+    return project_interview_runs(interview_session_list, session_bundle)
 
-        # interview_session: List[InterviewSession] = [session for session in interview_session_list]
 
-        if not interview_session_list:
-            return ResponseSchema(
-                success=True,
-                status_code=200,
-                message="No interview sessions found. Take new interview to get started.",
-                data={}
-            )
+@allinterview_router.get("/get-all-interview-sessions")
+async def get_all_interview_runs(request: Request,
+                                 principal: PrincipalSchema = Depends(get_current_principal),
+                                 page_params: PageParamsSchema = Depends(get_page_params),
+                                 redis_connection: Redis = Depends(get_redis_connection)):
+    """
+    Endpoint to get dashboard data.
+    With cursor/limit a single page of sessions (with their linked objects) is returned along with the next_cursor,
+    with stream=true the objects are streamed as NDJSON while the pages arrive from Palantir. Both bypass the cache.
+    """
+    from ai_interviewer_sdk.ontology.objects import InterviewSession
 
-        combined_result: List[CombinedResult] = [each_combined_results.combined_result() for each_combined_results in interview_session_list]
+    user_id = principal.uid
+    role = principal.role
 
-        if not combined_result:
-            return ResponseSchema(
-                success=True,
-                status_code=200,
-                message="Processing the results. Please wait or try again later.",
-            )
+    palantir_client: FoundryClient = request.app.state.foundry_client
 
-        practice_plan_iterator: List[Iterator[PracticePlan]] = [get_linked_practice_plans_from_object(source=each_interview_session) for each_interview_session in interview_session_list]
-
-        practice_plan_list: List[PracticePlan] = []
-        practice_task_list: List[PracticeTask] = []
-
-        for iterator in practice_plan_iterator:
-            for practice_plan in iterator:
-                    practice_plan_list.append(practice_plan)
-                    practice_task_list.append(practice_plan.practice_task())
-
-        combined_result_data = [CombinedResultSchema(
-            rid=int(each_combined_results.rid if isinstance(each_combined_results.rid, int) else 0),
-            total_score_25=each_combined_results.total_score25,
-            clarity_avg=each_combined_results.clarity_avg,
-            created_at=each_combined_results.created_at,
-            eval_confidence=each_combined_results.eval_confidence,
-            filler_avg=each_combined_results.filler_avg,
-            gaps=each_combined_results.gaps,
-            iid=each_combined_results.iid,
-            per_metric_weights=each_combined_results.per_metric_weights,
-            recommendation=each_combined_results.recommendation,
-            relevance_avg=each_combined_results.relevance_avg,
-            rubric_version=each_combined_results.rubric_version,
-            star_avg=each_combined_results.star_avg,
-            strengths=each_combined_results.strengths,
-            technical_depth_avg=each_combined_results.technical_depth_avg,
-            turn_indices_used=each_combined_results.turn_indices_used,
-            uid=each_combined_results.uid,
-            updated_at=each_combined_results.updated_at,
-            weaknesses=each_combined_results.weaknesses,
-        )
-            for each_combined_results in combined_result
-        ]
-
-        practice_plan_list_data: List[PracticePlanSchema] = [
-            PracticePlanSchema(
-                ppid=plan.ppid,
-                overall_goal=plan.overall_goal,
-                approved_at=plan.approved_at,
-                approved_by=plan.approved_by,
-                created_at=plan.created_at,
-                created_by=plan.created_by,
-                decline_reason=plan.decline_reason,
-                iid=plan.iid,
-                motivation_note=plan.motivation_note,
-                next_session_suggested_days=plan.next_session_suggestion_days,
-                plan_version=plan.plan_version,
-                reading_list=plan.reading_list,
-                status=plan.status,
-                uid=plan.uid,
-                updated_at=plan.updated_at,
-            )
-            for plan in practice_plan_list
-        ]
-
-        # TODO: chekc palantir ontology for PracticeTask completed_at because its returning '' for some reason
-        practice_task_list_data: List[PracticeTaskSchema] = [
-            PracticeTaskSchema(
-                ptid=task.ptid,
-                competency=task.competency,
-                actions=task.actions,
-                completed_at=task.completed_at if task.completed_at not in ("", None) else datetime.today(),
-                created_at=task.created_at,
-                description=task.description,
-                due_date=datetime.combine(task.due_date, time(23, 59)),
-                est_minutes=task.est_minutes,
-                ppid=task.ppid,
-                priority=task.priority,
-                status=task.status,
-                success_criteria=task.success_criteria,
-                uid=task.uid,
-                updated_at=task.updated_at,
-            )
-            for task in practice_task_list
-        ]
-
-        interview_session_data: List[InterviewSessionSchema] = [InterviewSessionSchema(
-            iid=each_interview_session.iid,
-            uid=each_interview_session.uid,
-            jid=each_interview_session.jid,
-            created_at=each_interview_session.created_at,
-            updated_at=each_interview_session.updated_at,
-            status=each_interview_session.status,
-            started_at=each_interview_session.started_at,
-            ended_at=each_interview_session.ended_at
-        )
-            for each_interview_session in interview_session_list
-        ]
-        await redis_connection.hset(
-            f"allinterview_cache:{user_id}",
-            mapping={
-                "combined_result": encode_for_cache(combined_result_data),
-                "interview_session": encode_for_cache(interview_session_data),
-                "practice_plans": encode_for_cache(practice_plan_list_data),
-                "practice_tasks": encode_for_cache(practice_task_list_data),
-            }
-        )
+    interview_session_object_set: InterviewSessionObjectSet = (
+        palantir_client.ontology.objects.InterviewSession.where(InterviewSession.object_type.uid == user_id)
+    )
+
+    page_size = page_params.limit or settings.ONTOLOGY_PAGE_SIZE
+
+    if page_params.stream:
+        async def interview_run_records():
+            async for interview_session_list in iterate_pages("InterviewSession.page", interview_session_object_set, page_size, page_params.cursor):
+                interview_runs: InterviewRuns = await load_interview_runs_page(palantir_client, interview_session_list)
+
+                for record_type, objects in zip(INTERVIEW_RUNS_RECORD_TYPES, interview_runs):
+                    for obj in objects:
+                        yield record_type, obj
 
-        await redis_connection.expire(f"allinterview_cache:{user_id}", 60*10)
+        return ndjson_response(interview_run_records())
 
-        return ResponseSchema(
+    if page_params.paginated:
+        interview_session_page: OntologyPage = await fetch_page("InterviewSession.page", interview_session_object_set, page_size, page_params.cursor)
+        interview_runs: InterviewRuns = await load_interview_runs_page(palantir_client, interview_session_page.objects)
+
+        return EncodedJSONResponse(ResponseEnvelope[InterviewRunsPageDataSchema](
             success=True,
             status_code=200,
             message="Dashboard data retrieved successfully.",
-            data={"CombinedResult": combined_result_data,
-                  "InterviewSession": interview_session_data,
-                  "PracticePlans": practice_plan_list_data,
-                  "PracticeTasks": practice_task_list_data,
-                  "role": role
-                  }
+            data=InterviewRunsPageDataSchema(
+                CombinedResult=interview_runs.combined_results,
+                InterviewSession=interview_runs.interview_sessions,
+                PracticePlans=interview_runs.practice_plans,
+                PracticeTasks=interview_runs.practice_tasks,
+                role=role,
+                next_cursor=interview_session_page.next_page_token
+            )
+        ))
+
+    redis_cache_key = f"allinterview_cache:{user_id}"
+    cached_data = await read_cache_hash(redis_connection, redis_cache_key, INTERVIEW_RUNS_CACHE_FIELDS)
+    record_cache_lookup(redis_cache_key, hit=cached_data is not None)
+
+    if cached_data:
+
+        try:
+            cached_response = interview_runs_response_from_cache(cached_data)
+
+            #past the soft expiry the stale runs are served right away and rebuilt in the background
+            if is_stale(cached_data):
+                schedule_cache_refresh(
+                    redis_connection,
+                    redis_cache_key,
+                    lambda: build_interview_runs(palantir_client, redis_connection, user_id, role)
+                )
+
+            return cached_response
+
+        #something went wrong while decoding the cache, so we are deleting the cache and instead fetch the data again
+        except Exception:
+            await redis_connection.delete(redis_cache_key)
+
+    async def read_cached() -> Optional[EncodedJSONResponse]:
+        cached_data = await read_cache_hash(redis_connection, redis_cache_key, INTERVIEW_RUNS_CACHE_FIELDS)
+        return interview_runs_response_from_cache(cached_data) if cached_data else None
+
+    try:
+        #concurrent misses for the same key, in this worker or any other, share a single rebuild
+        return await cache_single_flight.run(
+            redis_connection,
+            redis_cache_key,
+            build=lambda: build_interview_runs(palantir_client, redis_connection, user_id, role),
+            read_cached=read_cached
         )
 
     except Exception as e:
@@ -0,0 +1,95 @@
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from redis.asyncio import Redis
+
+from db.redisConnection import get_redis_connection
+from dependency.auth_dependency import get_current_principal
+from permissions.user_permissions import user_can
+from pydantic_schemas.job_pydantic import JobSchema
+from pydantic_schemas.principal_pydantic import PrincipalSchema
+from pydantic_schemas.response_pydantic import ResponseSchema
+from services.job_queue import Job, job_queue
+
+job_router = APIRouter(
+    prefix="/api/jobs",
+    tags=["Jobs"]
+)
+
+
+def job_to_schema(job: Job, include_payload: bool) -> JobSchema:
+    return JobSchema(
+        id=job.id,
+        name=job.name,
+        status=job.status,
+        attempts=job.attempts,
+        max_attempts=job.max_attempts,
+        progress=job.progress,
+        created_at=datetime.fromtimestamp(job.created_at, timezone.utc),
+        updated_at=datetime.fromtimestamp(job.updated_at, timezone.utc),
+        last_error=job.last_error,
+        payload=job.payload if include_payload else None
+    )
+
+
+@job_router.get("/dead-letter")
+async def get_dead_letter_jobs(offset: int = Query(0, ge=0),
+                               limit: int = Query(50, ge=1, le=500),
+                               principal: PrincipalSchema = Depends(get_current_principal),
+                               redis_connection: Redis = Depends(get_redis_connection)):
+    """
+    Endpoint for admins to inspect the jobs that ran out of retries, most recent first.
+    """
+    if not user_can(principal.role, "manage_jobs"):
+        raise HTTPException(status_code=403, detail="You are not authorized to perform this action.")
+
+    dead_jobs = await job_queue.dead_jobs(redis_connection, offset=offset, limit=limit)
+
+    return ResponseSchema(
+        success=True,
+        status_code=200,
+        message="Dead letter jobs retrieved successfully.",
+        data={"jobs": [job_to_schema(job, include_payload=True) for job in dead_jobs], "stats": job_queue.stats()}
+    )
+
+
+@job_router.post("/dead-letter/{job_id}/retry")
+async def retry_dead_letter_job(job_id: str,
+                                principal: PrincipalSchema = Depends(get_current_principal),
+                                redis_connection: Redis = Depends(get_redis_connection)):
+    """
+    Endpoint for admins to put a dead lettered job back into the queue.
+    """
+    if not user_can(principal.role, "manage_jobs"):
+        raise HTTPException(status_code=403, detail="You are not authorized to perform this action.")
+
+    if not await job_queue.retry_dead_job(redis_connection, job_id):
+        raise HTTPException(status_code=404, detail="Job not found in the dead letter set.")
+
+    return ResponseSchema(
+        success=True,
+        status_code=200,
+        message="Job requeued successfully.",
+        data={"job_id": job_id}
+    )
+
+
+@job_router.get("/{job_id}")
+async def get_job_status(job_id: str,
+                         principal: PrincipalSchema = Depends(get_current_principal),
+                         redis_connection: Redis = Depends(get_redis_connection)):
+    """
+    Endpoint to check the status of a job, users can only see their own jobs.
+    """
+    job = await job_queue.get_job(redis_connection, job_id)
+
+    can_manage = user_can(principal.role, "manage_jobs")
+    if job is None or (not can_manage and job.payload.get("uid") != principal.uid):
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    return ResponseSchema(
+        success=True,
+        status_code=200,
+        message="Job retrieved successfully.",
+        data={"job": job_to_schema(job, include_payload=can_manage)}
+    )
@@ -1,22 +1,29 @@
 from datetime import datetime
+from typing import TYPE_CHECKING
 
-import redis
 from fastapi import APIRouter, Depends, Request, HTTPException
 from fastapi.responses import JSONResponse
 from starlette import status
-from ai_interviewer_sdk.ontology.object_sets import PracticePlanObjectSet, UserObjectSet
 from fastapi import APIRouter, Depends, HTTPException, Request
-from ai_interviewer_sdk import FoundryClient
-from ai_interviewer_sdk.ontology.objects import PracticePlan, User, PracticeTask
 from redis.asyncio import Redis
-from foundry_sdk_runtime.types import ActionConfig, ActionMode, ReturnEditsMode, SyncApplyActionResponse
 
-from dependency.auth_dependency import create_jwt_token, create_jwt_refresh_token
+from dependency.auth_dependency import create_jwt_token, create_jwt_refresh_token, USER_CACHE_TTL_SECONDS
 from db.redisConnection import get_redis_connection
 from pydantic_schemas.login_pydantic import LoginSchema
 from pydantic_schemas.response_pydantic import ResponseSchema
 from pydantic_schemas.signup_pydantic import SignUpSchema
-from utils.utils import verify_string, serialize_for_redis, encrypt_string
+from services.cache_tags import cache_tag, invalidate_cache_tags
+from services.foundry_executor import foundry_call
+from services.id_allocator import allocate_id
+from services.password_hashing import password_hasher, PasswordHashingOverloadedError
+from utils.config import settings
+from utils.utils import serialize_for_redis
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk.ontology.object_sets import PracticePlanObjectSet, UserObjectSet
+    from ai_interviewer_sdk import FoundryClient
+    from ai_interviewer_sdk.ontology.objects import PracticePlan, User, PracticeTask
+    from foundry_sdk_runtime.types import ActionConfig, ActionMode, ReturnEditsMode, SyncApplyActionResponse
 
 login_router = APIRouter(
     prefix="/api/auth",
@@ -24,19 +31,31 @@ login_router = APIRouter(
 )
 
 @login_router.post("/login")
-def login(request: Request, login_data: LoginSchema, redis_connection: redis.Redis = Depends(get_redis_connection)):
+async def login(request: Request, login_data: LoginSchema, redis_connection: Redis = Depends(get_redis_connection)):
+
+    from foundry_sdk_runtime.types import ActionConfig, ActionMode, ReturnEditsMode
+    from ai_interviewer_sdk.ontology.objects import User
 
     palantir_client: FoundryClient = request.app.state.foundry_client
     user_object_set: UserObjectSet = palantir_client.ontology.objects.User.where(User.object_type.email == login_data.email.lower())
 
     user: User = None
-    for user_iterator in user_object_set.iterate():
+    for user_iterator in await foundry_call("User.iterate", lambda: list(user_object_set.iterate())):
         user = user_iterator
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
     #user is not present in the db
-    if user is None or not verify_string(plain_string=login_data.password, hashed_string=user.password_hash):
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email or password")
+
+    #bcrypt is deliberately slow, it runs in the password hashing process pool instead of the event loop
+    try:
+        password_matches = await password_hasher.verify(login_data.password, user.password_hash)
+    except PasswordHashingOverloadedError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many login attempts, please try again.")
+
+    if not password_matches:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email or password")
 
 
@@ -48,7 +67,9 @@ def login(request: Request, login_data: LoginSchema, redis_connection: redis.Red
 
     user_refresh_token = create_jwt_refresh_token(data=data)
 
-    response: SyncApplyActionResponse = palantir_client.ontology.actions.edit_user(
+    response: SyncApplyActionResponse = await foundry_call(
+        "edit_user",
+        palantir_client.ontology.actions.edit_user,
         action_config=ActionConfig(
             mode=ActionMode.VALIDATE_AND_EXECUTE,
             return_edits=ReturnEditsMode.ALL),
@@ -62,17 +83,21 @@ def login(request: Request, login_data: LoginSchema, redis_connection: redis.Red
         updated_at=datetime.today()
     )
 
+    #the user object was just edited, every worker drops its cached principal and resolves it from the fresh user hash
+    await invalidate_cache_tags(redis_connection, [cache_tag(settings.USER_API_NAME, user.uid)])
+
     #cache all the user templates as soon as they login to prevent future database queries for templates
     redis_user_key = f"user:{user.uid}"
     redis_pipeline = redis_connection.pipeline()
 
-    redis_pipeline.hset(redis_user_key, mapping={
+    await redis_pipeline.hset(redis_user_key, mapping={
         "uid": user.uid,
+        "role": user.role or "",
         "name": user.name,
         "jwt_refresh_token": user_refresh_token,
     })
-    redis_pipeline.expire(redis_user_key, 60 * 90)
-    redis_pipeline.execute()
+    await redis_pipeline.expire(redis_user_key, USER_CACHE_TTL_SECONDS)
+    await redis_pipeline.execute()
 
     json_response = JSONResponse(
         content= ResponseSchema(
@@ -98,19 +123,22 @@ def login(request: Request, login_data: LoginSchema, redis_connection: redis.Red
     return json_response
 
 @login_router.post("/signup")
-def sign_up(request: Request, signup_data: SignUpSchema, redis_connection: redis.Redis = Depends(get_redis_connection)):
+async def sign_up(request: Request, signup_data: SignUpSchema, redis_connection: Redis = Depends(get_redis_connection)):
     """
     Endpoint to sign up a new user.
     """
 
+    from foundry_sdk_runtime.types import ActionConfig, ActionMode, ReturnEditsMode
+    from ai_interviewer_sdk.ontology.objects import User
+
     palantir_client: FoundryClient = request.app.state.foundry_client
     existing_user_object_set: UserObjectSet = palantir_client.ontology.objects.User.where(User.object_type.email == signup_data.email.lower())
 
-    for existing_user in existing_user_object_set.iterate():
+    for existing_user in await foundry_call("User.iterate", lambda: list(existing_user_object_set.iterate())):
         if existing_user:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
 
-    new_user_id = palantir_client.ontology.queries.next_user_id_api()
+    new_user_id = await allocate_id(redis_connection, palantir_client, settings.USER_API_NAME)
 
     data = {
         "uid": new_user_id,
@@ -120,14 +148,22 @@ def sign_up(request: Request, signup_data: SignUpSchema, redis_connection: redis
     jwt_token = create_jwt_token(data=data)
     refresh_token = create_jwt_refresh_token(data=data)
 
-    response: SyncApplyActionResponse = palantir_client.ontology.actions.create_user(
+    #bcrypt is deliberately slow, keep it off the event loop
+    try:
+        password_hash = await password_hasher.hash(signup_data.password)
+    except PasswordHashingOverloadedError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many sign ups in progress, please try again.")
+
+    response: SyncApplyActionResponse = await foundry_call(
+        "create_user",
+        palantir_client.ontology.actions.create_user,
         action_config=ActionConfig(
             mode=ActionMode.VALIDATE_AND_EXECUTE,
             return_edits=ReturnEditsMode.ALL),
         uid=new_user_id,
         name=signup_data.name,
         email=signup_data.email.lower(),
-        password_hash=encrypt_string(plain_string=signup_data.password),
+        password_hash=password_hash,
         role=signup_data.role,
         created_at=datetime.today(),
         updated_at=datetime.today(),
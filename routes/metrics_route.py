@@ -0,0 +1,22 @@
+import secrets
+
+from fastapi import APIRouter, Header, HTTPException, Response
+
+from services.metrics import metrics_registry, PROMETHEUS_CONTENT_TYPE
+from utils.config import settings
+
+metrics_router = APIRouter(
+    tags=["Metrics"]
+)
+
+
+@metrics_router.get("/metrics")
+async def get_metrics(authorization: str = Header("")):
+    """
+    Endpoint for Prometheus to scrape the metrics of this worker in the text exposition format.
+    When METRICS_TOKEN is set, the scraper has to send it as a bearer token.
+    """
+    if settings.METRICS_TOKEN and not secrets.compare_digest(authorization, f"Bearer {settings.METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token.")
+
+    return Response(content=metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
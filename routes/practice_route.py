@@ -1,90 +1,73 @@
+import asyncio
 from datetime import datetime, time
-from typing import List, Iterator
+from typing import TYPE_CHECKING, Dict, List, Iterator, Optional, Tuple
 
-from ai_interviewer_sdk.ontology.object_sets import PracticePlanObjectSet
 from fastapi import APIRouter, Depends, HTTPException, Request
-from ai_interviewer_sdk import FoundryClient
-from ai_interviewer_sdk.ontology.objects import PracticePlan, User, PracticeTask
+from pydantic_core import to_json
 from redis.asyncio import Redis
-from foundry_sdk_runtime.types import ActionConfig, ActionMode, ReturnEditsMode, SyncApplyActionResponse
 
 from db.redisConnection import get_redis_connection
-from dependency.auth_dependency import authenticate_request
+from dependency.auth_dependency import get_current_principal
+from dependency.pagination_dependency import get_page_params
 from permissions.user_permissions import user_can
 from pydantic_schemas.interviewsession_pydantic import InterviewSessionSchema
+from pydantic_schemas.pagination_pydantic import PageParamsSchema
 from pydantic_schemas.practiceplan_pydantic import PracticePlanSchema
 from pydantic_schemas.practicetask_pydantic import PracticeTaskSchema
-from pydantic_schemas.response_pydantic import ResponseSchema
-from utils.utils import encode_for_cache, decode_from_cache
+from pydantic_schemas.principal_pydantic import PrincipalSchema
+from pydantic_schemas.response_pydantic import PracticeDetailsDataSchema, PracticeDetailsPageDataSchema, ResponseEnvelope, ResponseSchema
+from services.cache_tags import cache_tag, invalidate_cache_tags, tag_cache_entry, write_tags
+from services.coach_view import upsert_practice_plan, upsert_practice_task
+from services.foundry_executor import foundry_call
+from services.metrics import record_cache_lookup
+from services.ontology_pagination import fetch_page, iterate_pages, ndjson_response, OntologyPage
+from services.ontology_loader import load_practice_tasks
+from services.response_cache import read_cache_hash
+from services.single_flight import cache_single_flight
+from services.ontology_projection import practice_plan_projector, practice_task_projector
+from utils.config import settings
+from utils.cache_codec import encode_cache_json
+from utils.json_response import cached_envelope, encode_envelope, EncodedJSONResponse
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk.ontology.object_sets import PracticePlanObjectSet
+    from ai_interviewer_sdk import FoundryClient
+    from ai_interviewer_sdk.ontology.objects import PracticePlan, User, PracticeTask
+    from foundry_sdk_runtime.types import ActionConfig, ActionMode, ReturnEditsMode, SyncApplyActionResponse
 
 practice_router = APIRouter(
     prefix="/api/practice",
     tags=["Practice Plan"]
 )
 
+PRACTICE_DETAILS_CACHE_FIELDS = ["practice_plan", "practice_tasks"]
+
 @practice_router.get("/get-practice-details")
-async def get_practice_plan(request: Request, interview_session_detail: InterviewSessionSchema , jwt_payload: dict = Depends(authenticate_request)):
+async def get_practice_plan(request: Request, interview_session_detail: InterviewSessionSchema , principal: PrincipalSchema = Depends(get_current_principal)):
     """
     Endpoint to retrieve the practice plan for the user.
     """
-    user_id = jwt_payload.get("sub")
-
-    palantir_client: FoundryClient = request.app.state.foundry_client
+    from ai_interviewer_sdk.ontology.objects import PracticePlan
 
-    user: User = palantir_client.ontology.objects.User.get(user_id)
+    user_id = principal.uid
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found.")
+    palantir_client: FoundryClient = request.app.state.foundry_client
 
     practice_plan_object_sets: PracticePlanObjectSet = (
             palantir_client.ontology.objects.PracticePlan.
             where((PracticePlan.object_type.iid == interview_session_detail.iid) & (PracticePlan.object_type.uid == user_id))
         )
 
-    practice_plan_list: List[PracticePlanSchema] = []
-    practice_task_list: List[PracticeTaskSchema] = []
-
-    for each_practice_plan in practice_plan_object_sets.iterate():
-
-        practice_plan_schema = PracticePlanSchema(
-            iid=each_practice_plan.iid,
-            uid=each_practice_plan.uid,
-            ppid= each_practice_plan.ppid,
-            overall_goal= each_practice_plan.overall_goal,
-            approved_at= each_practice_plan.approved_at,
-            approved_by= each_practice_plan.approved_by,
-            created_at= each_practice_plan.created_at,
-            created_by= each_practice_plan.created_by,
-            decline_reason= each_practice_plan.decline_reason,
-            motivation_note= each_practice_plan.motivation_note,
-            next_session_suggested_days= each_practice_plan.next_session_suggestion_days,
-            plan_version= each_practice_plan.plan_version,
-            reading_list= each_practice_plan.reading_list,
-            status= each_practice_plan.status,
-            updated_at= each_practice_plan.updated_at
-        )
+    practice_plans: List[PracticePlan] = await foundry_call("PracticePlan.iterate", lambda: list(practice_plan_object_sets.iterate()))
+    practice_tasks: Dict[int, PracticeTask] = await load_practice_tasks(palantir_client, [each_practice_plan.ppid for each_practice_plan in practice_plans])
 
-        each_practice_task: PracticeTask = each_practice_plan.practice_task()
-
-        practice_task_schema = PracticeTaskSchema(
-            ptid= each_practice_task.ptid,
-            competency= each_practice_task.competency,
-            actions= each_practice_task.actions,
-            completed_at= each_practice_task.completed_at,
-            created_at= each_practice_task.created_at,
-            description= each_practice_task.description,
-            due_date=datetime.combine(each_practice_task.due_date, time(23, 59)),
-            est_minutes= each_practice_task.est_minutes,
-            ppid= each_practice_task.ppid,
-            priority= each_practice_task.priority,
-            status= each_practice_task.status,
-            success_criteria= each_practice_task.success_criteria,
-            uid= user_id,
-            updated_at= each_practice_task.updated_at
-        )
+    practice_plans = [each_practice_plan for each_practice_plan in practice_plans if each_practice_plan.ppid in practice_tasks]
 
-        practice_plan_list.append(practice_plan_schema)
-        practice_task_list.append(practice_task_schema)
+    practice_plan_list: List[PracticePlanSchema] = practice_plan_projector.project_many(practice_plans)
+    practice_task_list: List[PracticeTaskSchema] = [
+        practice_task_projector.project(practice_tasks[each_practice_plan.ppid], uid=user_id)
+        for each_practice_plan in practice_plans
+    ]
 
     if not practice_plan_list or not practice_task_list:
         raise HTTPException(
@@ -92,53 +75,59 @@ async def get_practice_plan(request: Request, interview_session_detail: Intervie
             detail="Practice plan or tasks not found for the user."
         )
 
-    return ResponseSchema(
+    return EncodedJSONResponse(ResponseEnvelope[PracticeDetailsDataSchema](
         success=True,
         status_code=200,
         message="Practice plan retrieved successfully.",
-        data={"practice_plan": practice_plan_list, "practice_tasks": practice_task_list}
-    )
+        data=PracticeDetailsDataSchema(practice_plan=practice_plan_list, practice_tasks=practice_task_list)
+    ))
 
 
-@practice_router.get("/get-all-practice-details")
-async def get_all_practice_details(request: Request,
-                                   jwt_payload: dict = Depends(authenticate_request),
-                                   redis_connection: Redis = Depends(get_redis_connection)):
+def practice_details_response_from_cache(cached_data: Dict[str, str]) -> EncodedJSONResponse:
     """
-    Endpoint to retrieve the practice plan for the user.
+    Build the response from a cached entry, the cached JSON is spliced into the body without decoding it.
+    cached_envelope raises for entries written by an older deploy.
     """
-    user_id = jwt_payload.get("sub")
-    role = jwt_payload.get("role")
+    return cached_envelope(
+        "Practice plan retrieved successfully from cache.",
+        {field: cached_data[field] for field in PRACTICE_DETAILS_CACHE_FIELDS}
+    )
 
-    palantir_client: FoundryClient = request.app.state.foundry_client
 
-    user: User = palantir_client.ontology.objects.User.get(user_id)
+async def load_practice_details_page(palantir_client: "FoundryClient", practice_plans: "List[PracticePlan]") -> Tuple[List[PracticePlanSchema], List[PracticeTaskSchema]]:
+    """
+    Load the practice tasks of one page of practice plans and project both, plans without a task are skipped.
+    """
+    practice_tasks: Dict[int, PracticeTask] = await load_practice_tasks(palantir_client, [each_practice_plan.ppid for each_practice_plan in practice_plans])
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found.")
+    practice_plans = [each_practice_plan for each_practice_plan in practice_plans if each_practice_plan.ppid in practice_tasks]
 
-    redis_cache_key = f"all_practice_details_cache:{user_id}"
+    practice_plan_list: List[PracticePlanSchema] = practice_plan_projector.project_many(practice_plans)
+    practice_task_list: List[PracticeTaskSchema] = [
+        practice_task_projector.project(practice_tasks[each_practice_plan.ppid], uid=each_practice_plan.uid)
+        for each_practice_plan in practice_plans
+    ]
 
-    cached_data = await redis_connection.hgetall(redis_cache_key)
+    return practice_plan_list, practice_task_list
 
-    if cached_data:
-        practice_plan_list = decode_from_cache(cached_data.get("practice_plan"))
-        practice_task_list = decode_from_cache(cached_data.get("practice_tasks"))
 
-        return ResponseSchema(
-            success=True,
-            status_code=200,
-            message="Practice plan retrieved successfully from cache.",
-            data={"practice_plan": practice_plan_list, "practice_tasks": practice_task_list}
-        )
+async def build_practice_details(palantir_client: "FoundryClient", redis_connection: Redis, user_id: int, role: str) -> EncodedJSONResponse:
+    """
+    Load the practice plans and tasks from Palantir and write them to the practice details cache.
+    """
+    from ai_interviewer_sdk.ontology.objects import PracticePlan
+
+    redis_cache_key = f"all_practice_details_cache:{user_id}"
 
     if user_can(role, "all_view_practice_plans") and user_can(role, "all_view_practice_tasks"):
 
-        practice_plan_iterator: Iterator[PracticePlan] = palantir_client.ontology.objects.PracticePlan.iterate()
-        practice_task_iterator: Iterator[PracticeTask] = palantir_client.ontology.objects.PracticeTask.iterate()
+        practice_plans, practice_tasks = await asyncio.gather(
+            foundry_call("PracticePlan.iterate", lambda: list(palantir_client.ontology.objects.PracticePlan.iterate())),
+            foundry_call("PracticeTask.iterate", lambda: list(palantir_client.ontology.objects.PracticeTask.iterate()))
+        )
 
-        practice_plan_list: List[PracticePlanSchema] = list(practice_plan_iterator)
-        practice_task_list: List[PracticeTaskSchema] = list(practice_task_iterator)
+        practice_plan_list: List[PracticePlanSchema] = practice_plan_projector.project_many(practice_plans)
+        practice_task_list: List[PracticeTaskSchema] = practice_task_projector.project_many(practice_tasks)
 
     else:
         practice_plan_object_sets: PracticePlanObjectSet = (
@@ -146,50 +135,9 @@ async def get_all_practice_details(request: Request,
                 where(PracticePlan.object_type.uid == user_id)
             )
 
-        practice_plan_list: List[PracticePlanSchema] = []
-        practice_task_list: List[PracticeTaskSchema] = []
-
-        for each_practice_plan in practice_plan_object_sets.iterate():
-
-            practice_plan_schema = PracticePlanSchema(
-                iid=each_practice_plan.iid,
-                uid=each_practice_plan.uid,
-                ppid= each_practice_plan.ppid,
-                overall_goal= each_practice_plan.overall_goal,
-                approved_at= each_practice_plan.approved_at,
-                approved_by= each_practice_plan.approved_by,
-                created_at= each_practice_plan.created_at,
-                created_by= each_practice_plan.created_by,
-                decline_reason= each_practice_plan.decline_reason,
-                motivation_note= each_practice_plan.motivation_note,
-                next_session_suggested_days= each_practice_plan.next_session_suggestion_days,
-                plan_version= each_practice_plan.plan_version,
-                reading_list= each_practice_plan.reading_list,
-                status= each_practice_plan.status,
-                updated_at= each_practice_plan.updated_at
-            )
-
-            each_practice_task: PracticeTask = each_practice_plan.practice_task()
-
-            practice_task_schema = PracticeTaskSchema(
-                ptid= each_practice_task.ptid,
-                competency= each_practice_task.competency,
-                actions= each_practice_task.actions,
-                completed_at= each_practice_task.completed_at,
-                created_at= each_practice_task.created_at,
-                description= each_practice_task.description,
-                due_date=datetime.combine(each_practice_task.due_date, time(23, 59)),
-                est_minutes= each_practice_task.est_minutes,
-                ppid= each_practice_task.ppid,
-                priority= each_practice_task.priority,
-                status= each_practice_task.status,
-                success_criteria= each_practice_task.success_criteria,
-                uid= each_practice_plan.uid,
-                updated_at= each_practice_task.updated_at
-            )
+        practice_plans: List[PracticePlan] = await foundry_call("PracticePlan.iterate", lambda: list(practice_plan_object_sets.iterate()))
 
-            practice_plan_list.append(practice_plan_schema)
-            practice_task_list.append(practice_task_schema)
+        practice_plan_list, practice_task_list = await load_practice_details_page(palantir_client, practice_plans)
 
     if not practice_plan_list or not practice_task_list:
         raise HTTPException(
@@ -197,18 +145,104 @@ async def get_all_practice_details(request: Request,
             detail="Practice plan or tasks not found for the user."
         )
 
-    await redis_connection.hset(redis_cache_key, mapping={
-        "practice_plan": encode_for_cache(practice_plan_list),
-        "practice_tasks": encode_for_cache(practice_task_list)
-    })
+    #serialized once, the same JSON goes into the cache entry and the response body
+    json_fields = {
+        "practice_plan": to_json(practice_plan_list).decode(),
+        "practice_tasks": to_json(practice_task_list).decode(),
+    }
 
-    await redis_connection.expire(redis_cache_key, 3600)
+    await redis_connection.hset(redis_cache_key, mapping={field: encode_cache_json(json_text) for field, json_text in json_fields.items()})
 
-    return ResponseSchema(
-        success=True,
-        status_code=200,
-        message="Practice plan retrieved successfully.",
-        data={"practice_plan": practice_plan_list, "practice_tasks": practice_task_list}
+    await redis_connection.expire(redis_cache_key, settings.PRACTICE_DETAILS_CACHE_TTL_SECONDS)
+
+    #coaches see the plans and tasks of every user, candidates only their own
+    tag_uid = None if user_can(role, "all_view_practice_plans") and user_can(role, "all_view_practice_tasks") else user_id
+    await tag_cache_entry(
+        redis_connection,
+        redis_cache_key,
+        tags=[cache_tag(settings.PRACTICE_PLAN_API_NAME, tag_uid), cache_tag(settings.PRACTICE_TASK_API_NAME, tag_uid)],
+        ttl_seconds=settings.PRACTICE_DETAILS_CACHE_TTL_SECONDS
+    )
+
+    return EncodedJSONResponse(encode_envelope("Practice plan retrieved successfully.", json_fields))
+
+
+@practice_router.get("/get-all-practice-details")
+async def get_all_practice_details(request: Request,
+                                   principal: PrincipalSchema = Depends(get_current_principal),
+                                   page_params: PageParamsSchema = Depends(get_page_params),
+                                   redis_connection: Redis = Depends(get_redis_connection)):
+    """
+    Endpoint to retrieve the practice plan for the user.
+    With cursor/limit a single page of practice plans (with their tasks) is returned along with the next_cursor,
+    with stream=true the plans and tasks are streamed as NDJSON while the pages arrive from Palantir. Both bypass
+    the cache, and for coaches they are the only way to list every plan without loading all of them at once.
+    """
+    from ai_interviewer_sdk.ontology.objects import PracticePlan
+
+    user_id = principal.uid
+    role = principal.role
+
+    palantir_client: FoundryClient = request.app.state.foundry_client
+
+    if user_can(role, "all_view_practice_plans") and user_can(role, "all_view_practice_tasks"):
+        practice_plan_object_sets: PracticePlanObjectSet = palantir_client.ontology.objects.PracticePlan
+    else:
+        practice_plan_object_sets: PracticePlanObjectSet = (
+            palantir_client.ontology.objects.PracticePlan.where(PracticePlan.object_type.uid == user_id)
+        )
+
+    page_size = page_params.limit or settings.ONTOLOGY_PAGE_SIZE
+
+    if page_params.stream:
+        async def practice_records():
+            async for practice_plans in iterate_pages("PracticePlan.page", practice_plan_object_sets, page_size, page_params.cursor):
+                practice_plan_list, practice_task_list = await load_practice_details_page(palantir_client, practice_plans)
+
+                for practice_plan, practice_task in zip(practice_plan_list, practice_task_list):
+                    yield "practice_plan", practice_plan
+                    yield "practice_task", practice_task
+
+        return ndjson_response(practice_records())
+
+    if page_params.paginated:
+        practice_plan_page: OntologyPage = await fetch_page("PracticePlan.page", practice_plan_object_sets, page_size, page_params.cursor)
+        practice_plan_list, practice_task_list = await load_practice_details_page(palantir_client, practice_plan_page.objects)
+
+        return EncodedJSONResponse(ResponseEnvelope[PracticeDetailsPageDataSchema](
+            success=True,
+            status_code=200,
+            message="Practice plan retrieved successfully.",
+            data=PracticeDetailsPageDataSchema(
+                practice_plan=practice_plan_list,
+                practice_tasks=practice_task_list,
+                next_cursor=practice_plan_page.next_page_token
+            )
+        ))
+
+    redis_cache_key = f"all_practice_details_cache:{user_id}"
+
+    cached_data = await read_cache_hash(redis_connection, redis_cache_key, PRACTICE_DETAILS_CACHE_FIELDS)
+    record_cache_lookup(redis_cache_key, hit=cached_data is not None)
+
+    if cached_data:
+        try:
+            return practice_details_response_from_cache(cached_data)
+
+        #the cache entry is stale or from an older deploy, so we are deleting the cache and instead fetch the data again
+        except Exception:
+            await redis_connection.delete(redis_cache_key)
+
+    async def read_cached() -> Optional[EncodedJSONResponse]:
+        cached_data = await read_cache_hash(redis_connection, redis_cache_key, PRACTICE_DETAILS_CACHE_FIELDS)
+        return practice_details_response_from_cache(cached_data) if cached_data else None
+
+    #concurrent misses for the same key, in this worker or any other, share a single rebuild
+    return await cache_single_flight.run(
+        redis_connection,
+        redis_cache_key,
+        build=lambda: build_practice_details(palantir_client, redis_connection, user_id, role),
+        read_cached=read_cached
     )
 
 @practice_router.post("/review")
@@ -216,20 +250,25 @@ async def review_practice_item(
     request: Request,
     practice_plan_details: PracticePlanSchema = None,
     practice_task_details: PracticeTaskSchema = None,
-    jwt_payload: dict = Depends(authenticate_request),
+    principal: PrincipalSchema = Depends(get_current_principal),
+    redis_connection: Redis = Depends(get_redis_connection),
 ):
     """
     Endpoint for coaches to approve/decline a practice plan
     OR edit/approve a practice task.
     """
-    user_id = jwt_payload.get("sub")
-    role = jwt_payload.get("role")
+    from foundry_sdk_runtime.types import ActionConfig, ActionMode, ReturnEditsMode
+
+    user_id = principal.uid
+    role = principal.role
 
     if not user_can(role, "approve_practice_plans") and not user_can(role, "approve_practice_tasks"):
         raise HTTPException(status_code=403, detail="You are not authorized to perform this action.")
 
     palantir_client: FoundryClient = request.app.state.foundry_client
 
+    reviewed_at = datetime.utcnow()
+
     if practice_plan_details:
         if practice_plan_details.status not in ["approved", "declined"]:
             raise HTTPException(status_code=400, detail="Status must be approved or declined for plans.")
@@ -246,7 +285,9 @@ async def review_practice_item(
                 raise HTTPException(status_code=400, detail="Decline reason required for declined plans.")
             decline_reason = practice_plan_details.decline_reason
 
-        response: SyncApplyActionResponse = palantir_client.ontology.actions.edit_practice_plan(
+        response: SyncApplyActionResponse = await foundry_call(
+            "edit_practice_plan",
+            palantir_client.ontology.actions.edit_practice_plan,
             action_config=ActionConfig(
                 mode=ActionMode.VALIDATE_AND_EXECUTE,
                 return_edits=ReturnEditsMode.ALL
@@ -265,12 +306,21 @@ async def review_practice_item(
             approved_at=approved_at,
             decline_reason=decline_reason,
             created_at=practice_plan_details.created_at,
-            updated_at=datetime.utcnow()
+            updated_at=reviewed_at
         )
 
         if response.validation.result != "VALID":
             raise HTTPException(status_code=400, detail="Practice plan update failed validation.")
 
+        await upsert_practice_plan(redis_connection, practice_plan_details.model_copy(update={
+            "approved_at": approved_at,
+            "approved_by": approved_by,
+            "decline_reason": decline_reason,
+            "updated_at": reviewed_at,
+        }))
+
+        await invalidate_cache_tags(redis_connection, write_tags(settings.PRACTICE_PLAN_API_NAME, practice_plan_details.uid))
+
         return ResponseSchema(
             success=True,
             status_code=200,
@@ -280,7 +330,9 @@ async def review_practice_item(
 
     # Handle Practice Task review/edit
     if practice_task_details:
-        response: SyncApplyActionResponse = palantir_client.ontology.actions.edit_practice_task(
+        response: SyncApplyActionResponse = await foundry_call(
+            "edit_practice_task",
+            palantir_client.ontology.actions.edit_practice_task,
             action_config=ActionConfig(
                 mode=ActionMode.VALIDATE_AND_EXECUTE,
                 return_edits=ReturnEditsMode.ALL
@@ -298,12 +350,21 @@ async def review_practice_item(
             priority=practice_task_details.priority,
             completed_at=practice_task_details.completed_at,
             created_at=practice_task_details.created_at,
-            updated_at=datetime.utcnow()
+            updated_at=reviewed_at
         )
 
         if response.validation.result != "VALID":
             raise HTTPException(status_code=400, detail="Practice task update failed validation.")
 
+        #same shape as the dashboard projection of a practice task
+        await upsert_practice_task(redis_connection, practice_task_details.model_copy(update={
+            "due_date": datetime.combine(practice_task_details.due_date.date(), time(23, 59)),
+            "completed_at": practice_task_details.completed_at or datetime.today(),
+            "updated_at": reviewed_at,
+        }))
+
+        await invalidate_cache_tags(redis_connection, write_tags(settings.PRACTICE_TASK_API_NAME, practice_task_details.uid))
+
         return ResponseSchema(
             success=True,
             status_code=200,
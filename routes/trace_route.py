@@ -0,0 +1,34 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from dependency.auth_dependency import get_current_principal
+from permissions.user_permissions import user_can
+from pydantic_schemas.principal_pydantic import PrincipalSchema
+from pydantic_schemas.response_pydantic import ResponseSchema
+from services.tracing import tracer
+
+trace_router = APIRouter(
+    prefix="/api/traces",
+    tags=["Traces"]
+)
+
+
+@trace_router.get("/slowest")
+async def get_slowest_traces(limit: int = Query(20, ge=1, le=200),
+                             name: Optional[str] = Query(None),
+                             principal: PrincipalSchema = Depends(get_current_principal)):
+    """
+    Endpoint for admins to inspect the slowest of the recent request traces of this worker, with their nested
+    Foundry, AIP and redis spans.
+    :param name: Only traces of this endpoint, e.g. "GET /api/dashboard/get-dashboard-data".
+    """
+    if not user_can(principal.role, "view_traces"):
+        raise HTTPException(status_code=403, detail="You are not authorized to perform this action.")
+
+    return ResponseSchema(
+        success=True,
+        status_code=200,
+        message="Traces retrieved successfully.",
+        data={"traces": tracer.exporter.slowest(limit, name=name), "stats": tracer.exporter.stats()}
+    )
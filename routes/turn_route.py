@@ -1,17 +1,30 @@
-from typing import Iterator, List
+from typing import TYPE_CHECKING, Iterator, List
 
-from ai_interviewer_sdk import FoundryClient
+from pydantic_core import to_json
 from fastapi import APIRouter, Depends, HTTPException, Request
 from redis.asyncio import Redis
-from ai_interviewer_sdk.ontology.objects import User, Turn, InterviewSession
-from ai_interviewer_sdk.ontology.object_sets import TurnObjectSet
 
 from db.redisConnection import get_redis_connection
-from dependency.auth_dependency import authenticate_request
+from dependency.auth_dependency import get_current_principal
+from dependency.pagination_dependency import get_page_params
 from pydantic_schemas.interviewsession_pydantic import InterviewSessionSchema
-from pydantic_schemas.response_pydantic import ResponseSchema
+from pydantic_schemas.pagination_pydantic import PageParamsSchema
+from pydantic_schemas.principal_pydantic import PrincipalSchema
+from pydantic_schemas.response_pydantic import ResponseEnvelope, TurnsPageDataSchema
 from pydantic_schemas.turn_pydantic import TurnSchema
-from utils.utils import encode_for_cache, decode_from_cache
+from services.cache_tags import cache_tag, tag_cache_entry
+from services.foundry_executor import foundry_call
+from services.metrics import record_cache_lookup
+from services.ontology_pagination import fetch_page, iterate_pages, ndjson_response, OntologyPage
+from services.ontology_projection import turn_projector
+from utils.config import settings
+from utils.cache_codec import encode_cache_json
+from utils.json_response import cached_envelope, encode_envelope, EncodedJSONResponse
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk import FoundryClient
+    from ai_interviewer_sdk.ontology.objects import User, Turn, InterviewSession
+    from ai_interviewer_sdk.ontology.object_sets import TurnObjectSet
 
 turn_route = APIRouter(
     prefix="/api/turn",
@@ -21,30 +34,28 @@ turn_route = APIRouter(
 @turn_route.post("/get-turn-by-iid")
 async def get_turn_by_iid(request: Request,
                            interview_session_details: InterviewSessionSchema,
-                           jwt_payload: dict = Depends(authenticate_request),
+                           principal: PrincipalSchema = Depends(get_current_principal),
                            redis_connection: Redis = Depends(get_redis_connection)):
     """
     Endpoint to retrieve the current turn for the user.
     """
-    user_id = jwt_payload.get("sub")
+    from ai_interviewer_sdk.ontology.objects import Turn
 
-    palantir_client: FoundryClient = request.app.state.foundry_client
-
-    user: User = palantir_client.ontology.objects.User.get(user_id)
+    user_id = principal.uid
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found.")
+    palantir_client: FoundryClient = request.app.state.foundry_client
 
     redis_cache_key = f"turns_cache:{user_id}:{interview_session_details.iid}"
     cached_turns = await redis_connection.get(redis_cache_key)
+    record_cache_lookup(redis_cache_key, hit=cached_turns is not None)
 
     if cached_turns:
-        return ResponseSchema(
-            success=True,
-            status_code=200,
-            message="Current turn retrieved successfully from cache.",
-            data={"turn": decode_from_cache(cached_turns)}
-        )
+        try:
+            return cached_envelope("Current turn retrieved successfully from cache.", {"turn": cached_turns})
+
+        #the cache entry is stale or from an older deploy, so we are deleting the cache and instead fetch the data again
+        except Exception:
+            await redis_connection.delete(redis_cache_key)
 
     turn_object_set: TurnObjectSet = (
         palantir_client.ontology.objects.Turn
@@ -52,115 +63,78 @@ async def get_turn_by_iid(request: Request,
         .where(Turn.object_type.uid == user_id)
     )
 
-    turns_list: List[TurnSchema] = []
-
-    for turn in turn_object_set.iterate():
-        turn_schema = TurnSchema(
-            qaid=turn.qaid,
-            question=turn.question,
-            answer=turn.answer,
-            blocked=turn.blocked,
-            clarity=turn.clarity,
-            composite_star= turn.composite_star,
-            filler= turn.filler,
-            iid=interview_session_details.iid,
-            issues= turn.issues,
-            justification= turn.justification,
-            relevance= turn.relevance,
-            repair_attempts= turn.repair_attempts,
-            safety_flags= turn.safety_flags,
-            star_a=turn.star_a,
-            star_r= turn.star_r,
-            star_s= turn.star_s,
-            star_t= turn.star_t,
-            target_competency= turn.target_competency,
-            technical_depth= turn.technical_depth,
-            transcript_text=turn.transcript_text,
-            turn_index= turn.turn_index,
-            uid=user_id,
-            created_at= turn.created_at,
-            updated_at= turn.updated_at
-        )
-
-        turns_list.append(turn_schema)
-
-    await redis_connection.set(redis_cache_key, encode_for_cache(turns_list), ex=3600)
-
-    return ResponseSchema(
-        success=True,
-        status_code=200,
-        message="Current turn retrieved successfully.",
-        data={"turn": turns_list}
-    )
+    turns: List[Turn] = await foundry_call("Turn.iterate", lambda: list(turn_object_set.iterate()))
+
+    turns_list: List[TurnSchema] = turn_projector.project_many(turns, iid=interview_session_details.iid, uid=user_id)
+
+    #serialized once, the same JSON goes into the cache entry and the response body
+    turns_json = to_json(turns_list).decode()
+
+    await redis_connection.set(redis_cache_key, encode_cache_json(turns_json), ex=settings.TURNS_CACHE_TTL_SECONDS)
+    await tag_cache_entry(redis_connection, redis_cache_key, tags=[cache_tag(settings.TURN_API_NAME, user_id)], ttl_seconds=settings.TURNS_CACHE_TTL_SECONDS)
+
+    return EncodedJSONResponse(encode_envelope("Current turn retrieved successfully.", {"turn": turns_json}))
 
 @turn_route.get("/get-all-turns")
 async def get_all_turns(request: Request,
-                           jwt_payload: dict = Depends(authenticate_request),
+                           principal: PrincipalSchema = Depends(get_current_principal),
+                           page_params: PageParamsSchema = Depends(get_page_params),
                            redis_connection: Redis = Depends(get_redis_connection)):
     """
-    Endpoint to retrieve the current turn for the user.
+    Endpoint to retrieve all the turns of the user.
+    With cursor/limit a single page is returned along with the next_cursor, with stream=true every turn is streamed
+    as one NDJSON line while the pages arrive from Palantir. Both bypass the cache.
     """
-    user_id = jwt_payload.get("sub")
+    from ai_interviewer_sdk.ontology.objects import Turn
+
+    user_id = principal.uid
 
     palantir_client: FoundryClient = request.app.state.foundry_client
 
-    user: User = palantir_client.ontology.objects.User.get(user_id)
+    turn_object_set: TurnObjectSet = (
+        palantir_client.ontology.objects.Turn.where(Turn.object_type.uid == user_id)
+    )
+
+    page_size = page_params.limit or settings.ONTOLOGY_PAGE_SIZE
+
+    if page_params.stream:
+        async def turn_records():
+            async for turns in iterate_pages("Turn.page", turn_object_set, page_size, page_params.cursor):
+                for turn in turn_projector.project_many(turns, uid=user_id):
+                    yield "turn", turn
+
+        return ndjson_response(turn_records())
+
+    if page_params.paginated:
+        turn_page: OntologyPage = await fetch_page("Turn.page", turn_object_set, page_size, page_params.cursor)
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found.")
+        return EncodedJSONResponse(ResponseEnvelope[TurnsPageDataSchema](
+            success=True,
+            status_code=200,
+            message="Current turn retrieved successfully.",
+            data=TurnsPageDataSchema(turn=turn_projector.project_many(turn_page.objects, uid=user_id), next_cursor=turn_page.next_page_token)
+        ))
 
     redis_cache_key = f"all_turns_cache:{user_id}"
     cached_turns = await redis_connection.get(redis_cache_key)
+    record_cache_lookup(redis_cache_key, hit=cached_turns is not None)
 
     if cached_turns:
-        return ResponseSchema(
-            success=True,
-            status_code=200,
-            message="Current turn retrieved successfully from cache.",
-            data={"turn": decode_from_cache(cached_turns)}
-        )
+        try:
+            return cached_envelope("Current turn retrieved successfully from cache.", {"turn": cached_turns})
 
-    turn_object_set: TurnObjectSet = (
-        palantir_client.ontology.objects.Turn.where(Turn.object_type.uid == user_id)
-    )
+        #the cache entry is stale or from an older deploy, so we are deleting the cache and instead fetch the data again
+        except Exception:
+            await redis_connection.delete(redis_cache_key)
 
-    turns_list: List[TurnSchema] = []
-
-    for turn in turn_object_set.iterate():
-        turn_schema = TurnSchema(
-            qaid=turn.qaid,
-            question=turn.question,
-            answer=turn.answer,
-            blocked=turn.blocked,
-            clarity=turn.clarity,
-            composite_star=turn.composite_star,
-            filler=turn.filler,
-            iid=turn.iid,
-            issues=turn.issues,
-            justification=turn.justification,
-            relevance=turn.relevance,
-            repair_attempts=turn.repair_attempts,
-            safety_flags=turn.safety_flags,
-            star_a=turn.star_a,
-            star_r=turn.star_r,
-            star_s=turn.star_s,
-            star_t=turn.star_t,
-            target_competency=turn.target_competency,
-            technical_depth=turn.technical_depth,
-            transcript_text=turn.transcript_text,
-            turn_index=turn.turn_index,
-            uid=user_id,
-            created_at=turn.created_at,
-            updated_at=turn.updated_at
-        )
-
-        turns_list.append(turn_schema)
-
-    await redis_connection.set(redis_cache_key, encode_for_cache(turns_list), ex=3600)
-
-    return ResponseSchema(
-        success=True,
-        status_code=200,
-        message="Current turn retrieved successfully.",
-        data={"turn": turns_list}
-    )
+    turns: List[Turn] = await foundry_call("Turn.iterate", lambda: list(turn_object_set.iterate()))
+
+    turns_list: List[TurnSchema] = turn_projector.project_many(turns, uid=user_id)
+
+    #serialized once, the same JSON goes into the cache entry and the response body
+    turns_json = to_json(turns_list).decode()
+
+    await redis_connection.set(redis_cache_key, encode_cache_json(turns_json), ex=settings.TURNS_CACHE_TTL_SECONDS)
+    await tag_cache_entry(redis_connection, redis_cache_key, tags=[cache_tag(settings.TURN_API_NAME, user_id)], ttl_seconds=settings.TURNS_CACHE_TTL_SECONDS)
+
+    return EncodedJSONResponse(encode_envelope("Current turn retrieved successfully.", {"turn": turns_json}))
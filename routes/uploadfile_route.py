@@ -1,42 +1,50 @@
 import os.path
 from datetime import datetime
+from typing import TYPE_CHECKING
 
-from ai_interviewer_sdk.ontology.objects import User
+from redis.asyncio import Redis
 from fastapi import APIRouter, Depends, File, UploadFile, Request, HTTPException
-from ai_interviewer_sdk import FoundryClient
-from foundry_sdk_runtime.types import ReturnEditsMode, ActionConfig, ActionMode, SyncApplyActionResponse
 
-from dependency.auth_dependency import authenticate_request
+from db.redisConnection import get_redis_connection
+from dependency.auth_dependency import get_current_principal
+from services.foundry_executor import foundry_call
+from services.id_allocator import allocate_id
+from utils.config import settings
+from pydantic_schemas.principal_pydantic import PrincipalSchema
 from pydantic_schemas.response_pydantic import ResponseSchema
 from pydantic_schemas.uploaddata_pydantic import UploadDataSchema
 from utils.utils import sanitize_filename_base
 
+if TYPE_CHECKING:
+    from ai_interviewer_sdk.ontology.objects import User
+    from ai_interviewer_sdk import FoundryClient
+    from foundry_sdk_runtime.types import ReturnEditsMode, ActionConfig, ActionMode, SyncApplyActionResponse
+
 upload_router = APIRouter(
     prefix="/api/storage",
     tags=["Storage"]
 )
 
 @upload_router.post("/send-data")
-async def upload_file(request: Request, data: UploadDataSchema, jwt_payload: dict = Depends(authenticate_request)):
+async def upload_file(request: Request, data: UploadDataSchema, principal: PrincipalSchema = Depends(get_current_principal), redis_connection: Redis = Depends(get_redis_connection)):
     """
     Endpoint to upload a file to foundry.
     """
-    user_id = jwt_payload.get("sub").get("uid")
-
-    palantir_client: FoundryClient = request.app.state.foundry_client
+    from foundry_sdk_runtime.types import ActionConfig, ActionMode, ReturnEditsMode
 
-    user: User = palantir_client.ontology.objects.User.get(user_id)
+    user_id = principal.uid
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found.")
+    palantir_client: FoundryClient = request.app.state.foundry_client
 
     resume_raw = data.resumeSummary + "\n" + data.education + "\n" + data.workExperience + "\n" + data.projects + "\n" + data.skills
 
     try:
 
-        new_cvid = palantir_client.ontology.queries.next_resume_cvidas_api()
+        new_cvid = await allocate_id(redis_connection, palantir_client, settings.RESUME_API_NAME)
 
-        new_resume: SyncApplyActionResponse = palantir_client.ontology.actions.create_resume(
+        new_resume: SyncApplyActionResponse = await foundry_call(
+            "create_resume",
+            palantir_client.ontology.actions.create_resume,
             action_config=ActionConfig(
                 mode=ActionMode.VALIDATE_AND_EXECUTE,
                 return_edits=ReturnEditsMode.ALL
@@ -0,0 +1,122 @@
+"""
+Measure the cold start of an API worker, what an autoscaled worker pays before it serves its first request.
+
+Every run starts fresh Python processes and reports three times:
+    import          importing main, the routes and services with their settings
+    startup         the lifespan startup of the app, clients, collectors and background tasks
+    first response  launching uvicorn main:app until it answers its first HTTP request
+
+The settings come from the environment or .env as for the server, with --benchmark-environment the fixed settings
+of the benchmarks are used instead. The run fails if the median first response takes longer than --max-seconds.
+
+Run from the repository root:
+    python -m scripts.measure_cold_start
+    python -m scripts.measure_cold_start --runs 10 --max-seconds 1.0 --benchmark-environment
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List
+
+from benchmarks.environment import BENCHMARK_ENVIRONMENT
+
+#runs in the child process, the imports of this script must not be measured
+STARTUP_PROBE = """
+import asyncio, json, logging, time
+started = time.perf_counter()
+from main import app
+imported = time.perf_counter()
+logging.disable(logging.WARNING)
+
+async def startup():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+ready = asyncio.run(startup())
+print(json.dumps({"import": imported - started, "startup": ready - imported}))
+"""
+
+
+def measure_startup(environment: Dict[str, str]) -> Dict[str, float]:
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_PROBE], env=environment, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def measure_first_response(environment: Dict[str, str], timeout: float) -> float:
+    """
+    Launch uvicorn and poll it until it answers, any HTTP status counts as an answer.
+    :return: Seconds from the launch to the first response.
+    """
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/"
+
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {server.returncode} before answering, run it directly to see why")
+            try:
+                urllib.request.urlopen(url, timeout=1)
+            except urllib.error.HTTPError:
+                pass
+            except OSError:
+                time.sleep(0.005)
+                continue
+            return time.perf_counter() - started
+        raise RuntimeError(f"uvicorn did not answer within {timeout:g}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts measured.")
+    parser.add_argument("--max-seconds", type=float, default=1.0, help="Allowed median time to the first response.")
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for the first response of a run.")
+    parser.add_argument("--benchmark-environment", action="store_true", help="Use the fixed settings of the benchmarks instead of .env.")
+    args = parser.parse_args()
+
+    environment = dict(os.environ)
+    if args.benchmark_environment:
+        environment.update(BENCHMARK_ENVIRONMENT)
+
+    timings: Dict[str, List[float]] = {"import": [], "startup": [], "first response": []}
+    for run in range(args.runs):
+        for phase, seconds in measure_startup(environment).items():
+            timings[phase].append(seconds)
+        timings["first response"].append(measure_first_response(environment, args.timeout))
+        print(f"run {run + 1}: " + ", ".join(f"{phase} {seconds[-1] * 1000:,.0f} ms" for phase, seconds in timings.items()))
+
+    print(f"\n{'phase':<18}{'min ms':>10}{'median ms':>12}{'max ms':>10}")
+    for phase, seconds in timings.items():
+        print(f"{phase:<18}{min(seconds) * 1000:>10,.0f}{statistics.median(seconds) * 1000:>12,.0f}{max(seconds) * 1000:>10,.0f}")
+
+    first_response = statistics.median(timings["first response"])
+    if first_response > args.max_seconds:
+        print(f"\nThe median first response took {first_response:.2f}s, more than {args.max_seconds:g}s")
+        sys.exit(1)
+    print(f"\nThe median first response took {first_response:.2f}s, within {args.max_seconds:g}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Migrate the redis response caches from the old pickle + base64 format to the versioned cache codec.
+
+Entries that are not in the current format (legacy pickle entries and entries with an old schema version) are
+deleted by default, the routes rebuild them on the next request. With --reencode, legacy pickle entries are
+decoded and written back in the new format instead, keeping their TTL.
+
+Run from the repository root:
+    python -m scripts.migrate_cache_codec [--reencode] [--dry-run]
+"""
+import argparse
+import asyncio
+
+from redis.asyncio import Redis
+
+from db.redisConnection import get_redis_connection
+from services.response_cache import SOFT_EXPIRY_FIELD
+from utils.cache_codec import CACHE_HEADER_MAGIC, decode_legacy_pickle, encode_cache_payload, is_current_cache_entry
+
+#string entries
+STRING_CACHE_PATTERNS = ["turns_cache:*", "all_turns_cache:*", "allqna_cache:*"]
+
+#hash entries, every field except the stale-while-revalidate soft expiry holds one encoded payload
+HASH_CACHE_PATTERNS = ["dashboard_cache:*", "allinterview_cache:*", "all_practice_details_cache:*"]
+
+
+def _migrate_value(value: str, reencode: bool) -> str | None:
+    """
+    :return: The value to write back, or None if the entry has to be deleted.
+    """
+    if reencode and not value.startswith(f"{CACHE_HEADER_MAGIC}:"):
+        return encode_cache_payload(decode_legacy_pickle(value))
+    return None
+
+
+async def migrate(redis_connection: Redis, reencode: bool, dry_run: bool) -> dict[str, int]:
+    counts = {"current": 0, "reencoded": 0, "deleted": 0}
+
+    async def finish(key: str, new_value, ttl: int) -> None:
+        if new_value is None:
+            counts["deleted"] += 1
+            if not dry_run:
+                await redis_connection.delete(key)
+            return
+
+        counts["reencoded"] += 1
+        if not dry_run:
+            redis_pipe = redis_connection.pipeline()
+            if isinstance(new_value, dict):
+                await redis_pipe.delete(key)
+                await redis_pipe.hset(key, mapping=new_value)
+            else:
+                await redis_pipe.set(key, new_value)
+            if ttl > 0:
+                await redis_pipe.expire(key, ttl)
+            await redis_pipe.execute()
+
+    for pattern in STRING_CACHE_PATTERNS:
+        async for key in redis_connection.scan_iter(match=pattern, count=500):
+            value = await redis_connection.get(key)
+            if value is None or is_current_cache_entry(value):
+                counts["current"] += 1
+                continue
+
+            try:
+                new_value = _migrate_value(value, reencode)
+            except Exception:
+                new_value = None
+
+            await finish(key, new_value, await redis_connection.ttl(key))
+
+    for pattern in HASH_CACHE_PATTERNS:
+        async for key in redis_connection.scan_iter(match=pattern, count=500):
+            fields = await redis_connection.hgetall(key)
+            fields.pop(SOFT_EXPIRY_FIELD, None)
+            if all(is_current_cache_entry(value) for value in fields.values()):
+                counts["current"] += 1
+                continue
+
+            try:
+                new_fields = {field: value if is_current_cache_entry(value) else _migrate_value(value, reencode) for field, value in fields.items()}
+                new_value = None if any(value is None for value in new_fields.values()) else new_fields
+            except Exception:
+                new_value = None
+
+            await finish(key, new_value, await redis_connection.ttl(key))
+
+    return counts
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reencode", action="store_true", help="Re-encode legacy pickle entries instead of deleting them.")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the entries that would be changed.")
+    args = parser.parse_args()
+
+    redis_connection = await get_redis_connection()
+    counts = await migrate(redis_connection, reencode=args.reencode, dry_run=args.dry_run)
+    print(f"current: {counts['current']}, re-encoded: {counts['reencoded']}, deleted: {counts['deleted']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
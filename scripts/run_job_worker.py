@@ -0,0 +1,54 @@
+"""
+Run background job workers (services/job_queue.py) as a separate process, next to or instead of the
+JOB_QUEUE_IN_APP_WORKERS the API processes run.
+
+Run from the repository root:
+    python -m scripts.run_job_worker [--concurrency N]
+
+SIGINT / SIGTERM stop the workers after the job they are running.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from db.redisConnection import redis_client
+from services.foundry_client import LazyFoundryClient
+from services.foundry_executor import foundry_executor
+from services.job_queue import JobContext, job_queue
+
+#registers the job handlers
+import services.interview_finalization  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+async def run(concurrency: int) -> None:
+    context = JobContext(redis_connection=redis_client, palantir_client=LazyFoundryClient())
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stop_signal, stop_event.set)
+
+    logger.info("Starting %d job workers for %s", concurrency, ", ".join(job_queue.stats()["handlers"]))
+
+    try:
+        await asyncio.gather(*(job_queue.run_worker(context, stop_event=stop_event) for _ in range(concurrency)))
+    finally:
+        logger.info("Job workers stopped: %s", job_queue.stats())
+        foundry_executor.shutdown()
+        await redis_client.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of jobs run at the same time.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
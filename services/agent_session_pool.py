@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+from redis.asyncio import Redis
+
+from services.single_flight import SingleFlight
+from services.upstream_client import AGENT_SESSION_CREATE, UpstreamClient
+from utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+POOL_KEY = "agent_session_pool"
+
+REFILL_LOCK_KEY = "agent_session_pool:refill"
+
+#drops the sessions created before the cutoff and pops the oldest of the rest: {expired, rid or false, created at}
+POP_SCRIPT = """
+local expired = redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local popped = redis.call('ZPOPMIN', KEYS[1])
+return {expired, popped[1] or false, popped[2] or false}
+"""
+
+#drops the sessions created before the cutoff and returns {expired, size}
+PRUNE_SCRIPT = """
+local expired = redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+return {expired, redis.call('ZCARD', KEYS[1])}
+"""
+
+_scripts: Optional[Dict[str, Any]] = None
+
+
+def _get_scripts(redis_connection: Redis) -> Dict[str, Any]:
+    global _scripts
+
+    if _scripts is None:
+        _scripts = {
+            "pop": redis_connection.register_script(POP_SCRIPT),
+            "prune": redis_connection.register_script(PRUNE_SCRIPT),
+        }
+
+    return _scripts
+
+
+async def create_agent_session(http_client: UpstreamClient) -> str:
+    """
+    Create a session of the interviewer AIP agent.
+    :return: The session rid.
+    """
+    response = await http_client.request(
+        AGENT_SESSION_CREATE,
+        "POST",
+        f"{settings.PALANTIR_PROJECT_URL}/api/v2/aipAgents/agents/{settings.INTERVIEWER_AGENT_RID}/sessions?preview=true",
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {settings.PALANTIR_API_KEY}"
+        },
+        json={"agentVersion": "1.0"}
+    )
+
+    response.raise_for_status()
+
+    data = response.json()
+
+    if "rid" not in data:
+        logger.error("Palantir response does not contain 'rid': %s", data)
+        raise ValueError("Missing 'rid' in Palantir response")
+
+    return data["rid"]
+
+
+class AgentSession(NamedTuple):
+    """
+    An interviewer agent session taken from the pool or just created.
+    """
+    rid: str
+    created_at: float
+
+
+class AgentSessionPool:
+    """
+    Pool of pre-created interviewer agent sessions, shared by all workers:
+        agent_session_pool   zset of session rids scored by their creation time
+    Agent sessions are not tied to a user until the first message, so a new interview pops a ready one instead of
+    waiting for Palantir to create it. Sessions older than max_age_seconds are dropped unused, they might expire
+    upstream before the interview ends. A refiller task in every API process tops the pool up to target_size,
+    one worker at a time.
+    """
+
+    def __init__(self, target_size: int, max_age_seconds: int, refill_interval_seconds: float, refill_concurrency: int):
+        self.target_size = target_size
+        self.max_age_seconds = max_age_seconds
+        self.refill_interval_seconds = refill_interval_seconds
+        self.refill_concurrency = refill_concurrency
+
+        self._refill_lock = SingleFlight(
+            lock_seconds=settings.SINGLE_FLIGHT_LOCK_SECONDS,
+            wait_timeout_seconds=settings.SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS,
+            poll_interval_seconds=settings.SINGLE_FLIGHT_POLL_INTERVAL_SECONDS
+        )
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.created = 0
+        self.create_failures = 0
+        self.released = 0
+        self.refills = 0
+        self.last_refill_seconds = 0.0
+        self.last_size = 0
+
+    def _get_wakeup(self) -> asyncio.Event:
+        #created on first use so it binds to the running event loop
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def _cutoff(self) -> float:
+        return time.time() - self.max_age_seconds
+
+    async def acquire(self, redis_connection: Redis, http_client: UpstreamClient) -> AgentSession:
+        """
+        Take a ready agent session from the pool, or create one right away if the pool is empty or disabled.
+        """
+        if self.target_size > 0:
+            expired, rid, created_at = await _get_scripts(redis_connection)["pop"](
+                keys=[POOL_KEY], args=[self._cutoff()], client=redis_connection
+            )
+            self.expired += expired
+
+            #top the pool up again without waiting for the next refill interval
+            self._get_wakeup().set()
+
+            if rid:
+                self.hits += 1
+                return AgentSession(rid=rid, created_at=float(created_at))
+
+        self.misses += 1
+        created_at = time.time()
+        return AgentSession(rid=await create_agent_session(http_client), created_at=created_at)
+
+    async def release(self, redis_connection: Redis, agent_session: AgentSession) -> None:
+        """
+        Put back an agent session that was acquired but not used, e.g. the interview could not be created.
+        The session keeps its creation time, so it still expires from the pool on time.
+        """
+        if self.target_size <= 0 or agent_session.created_at <= self._cutoff():
+            return
+
+        await redis_connection.zadd(POOL_KEY, {agent_session.rid: agent_session.created_at})
+        self.released += 1
+
+    async def refill(self, redis_connection: Redis, http_client: UpstreamClient) -> int:
+        """
+        Drop the expired sessions and create the missing ones, at most refill_concurrency at a time.
+        :return: Number of sessions added to the pool.
+        """
+        started = time.perf_counter()
+
+        expired, size = await _get_scripts(redis_connection)["prune"](
+            keys=[POOL_KEY], args=[self._cutoff()], client=redis_connection
+        )
+        self.expired += expired
+
+        added = 0
+        while size + added < self.target_size:
+            results = await asyncio.gather(
+                *(create_agent_session(http_client) for _ in range(min(self.refill_concurrency, self.target_size - size - added))),
+                return_exceptions=True
+            )
+
+            rids = [result for result in results if isinstance(result, str)]
+            failures = [result for result in results if not isinstance(result, str)]
+
+            if rids:
+                now = time.time()
+                await redis_connection.zadd(POOL_KEY, {rid: now for rid in rids})
+                added += len(rids)
+                self.created += len(rids)
+
+            if failures:
+                self.create_failures += len(failures)
+                logger.warning("Could not create %d agent sessions for the pool: %r", len(failures), failures[0])
+                #palantir is struggling, try again on the next refill
+                break
+
+        self.refills += 1
+        self.last_size = size + added
+        self.last_refill_seconds = time.perf_counter() - started
+
+        if added:
+            logger.info("Added %d agent sessions to the pool in %.2fs, %d ready", added, self.last_refill_seconds, self.last_size)
+
+        return added
+
+    async def run_refiller(self, redis_connection: Redis, http_client: UpstreamClient, stop_event: Optional[asyncio.Event] = None) -> None:
+        """
+        Long running refill loop, refills every refill_interval_seconds and right after a session was taken.
+        Only one worker refills at a time, the others skip that round.
+        """
+        if self.target_size <= 0:
+            return
+
+        wakeup = self._get_wakeup()
+
+        while stop_event is None or not stop_event.is_set():
+            wakeup.clear()
+
+            try:
+                await self._refill_lock.run_if_idle(
+                    redis_connection, REFILL_LOCK_KEY, lambda: self.refill(redis_connection, http_client)
+                )
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception:
+                logger.exception("Could not refill the agent session pool, retrying")
+
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=self.refill_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "target_size": self.target_size,
+            "last_size": self.last_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "created": self.created,
+            "create_failures": self.create_failures,
+            "released": self.released,
+            "refills": self.refills,
+            "last_refill_seconds": self.last_refill_seconds,
+        }
+
+
+agent_session_pool = AgentSessionPool(
+    target_size=settings.AGENT_SESSION_POOL_SIZE,
+    max_age_seconds=settings.AGENT_SESSION_POOL_MAX_AGE_SECONDS,
+    refill_interval_seconds=settings.AGENT_SESSION_POOL_REFILL_INTERVAL_SECONDS,
+    refill_concurrency=settings.AGENT_SESSION_POOL_REFILL_CONCURRENCY
+)
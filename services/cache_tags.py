@@ -0,0 +1,231 @@
+import asyncio
+import json
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+#redis pub/sub channel every worker listens on, messages are {"tags": [...]}
+CACHE_INVALIDATION_CHANNEL = "cache_invalidation"
+
+#tag suffix for cache entries that depend on the objects of every user (coach views)
+ALL_USERS = "all"
+
+#adds the cache key to every tag set and makes sure the tag sets live at least as long as the entry
+TAG_SCRIPT = """
+local ttl = tonumber(ARGV[2])
+for _, tag_key in ipairs(KEYS) do
+    redis.call('SADD', tag_key, ARGV[1])
+    if redis.call('TTL', tag_key) < ttl then
+        redis.call('EXPIRE', tag_key, ttl)
+    end
+end
+return #KEYS
+"""
+
+#deletes every cache key registered under the tags, and the tag sets themselves, and bumps the generation of the tags
+#so entries built from reads made before the invalidation are not written anymore.
+#KEYS: pairs of tag set and tag generation
+INVALIDATE_SCRIPT = """
+local deleted = 0
+for i = 1, #KEYS, 2 do
+    local cache_keys = redis.call('SMEMBERS', KEYS[i])
+    for _, cache_key in ipairs(cache_keys) do
+        deleted = deleted + redis.call('DEL', cache_key)
+    end
+    redis.call('DEL', KEYS[i])
+    redis.call('INCR', KEYS[i + 1])
+end
+return deleted
+"""
+
+#writes a hash entry and registers it under its tags in one step, but only if none of the tags was invalidated since
+#the generations in ARGV were read, the entry would otherwise hold data from before the invalidation.
+#KEYS: cache key, then pairs of tag set and tag generation. ARGV: ttl, tag count, the generations, then field/value pairs
+WRITE_HASH_SCRIPT = """
+local ttl = tonumber(ARGV[1])
+local tag_count = tonumber(ARGV[2])
+for i = 1, tag_count do
+    if (redis.call('GET', KEYS[i * 2 + 1]) or '0') ~= ARGV[i + 2] then
+        return 0
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, tag_count + 3))
+redis.call('EXPIRE', KEYS[1], ttl)
+for i = 1, tag_count do
+    local tag_key = KEYS[i * 2]
+    redis.call('SADD', tag_key, KEYS[1])
+    if redis.call('TTL', tag_key) < ttl then
+        redis.call('EXPIRE', tag_key, ttl)
+    end
+end
+return 1
+"""
+
+InvalidationListener = Callable[[List[str]], None]
+
+_tag_script = None
+_invalidate_script = None
+_write_hash_script = None
+
+_invalidation_listeners: List[InvalidationListener] = []
+
+
+def _get_scripts(redis_connection: Redis):
+    global _tag_script, _invalidate_script, _write_hash_script
+
+    if _tag_script is None:
+        _tag_script = redis_connection.register_script(TAG_SCRIPT)
+        _invalidate_script = redis_connection.register_script(INVALIDATE_SCRIPT)
+        _write_hash_script = redis_connection.register_script(WRITE_HASH_SCRIPT)
+
+    return _tag_script, _invalidate_script, _write_hash_script
+
+
+def cache_tag(object_type: str, uid: Optional[int] = None) -> str:
+    """
+    Tag for the objects of one type, either of a single user or, without uid, of every user.
+    :param object_type: Ontology api name, e.g. settings.PRACTICE_PLAN_API_NAME.
+    """
+    return f"{object_type}:uid:{uid}" if uid is not None else f"{object_type}:{ALL_USERS}"
+
+
+def parse_cache_tag(tag: str) -> Tuple[str, Optional[int]]:
+    """
+    Inverse of cache_tag.
+    :return: (object type, uid), uid is None for all users tags.
+    """
+    object_type, _, rest = tag.partition(":")
+    if rest.startswith("uid:"):
+        return object_type, int(rest[len("uid:"):])
+    return object_type, None
+
+
+def write_tags(object_type: str, uid: int) -> List[str]:
+    """
+    Tags to invalidate after writing an object of the given user, their own entries and the all users views.
+    """
+    return [cache_tag(object_type, uid), cache_tag(object_type)]
+
+
+def _tag_key(tag: str) -> str:
+    return f"cache_tag:{tag}"
+
+
+def _generation_key(tag: str) -> str:
+    return f"cache_tag_generation:{tag}"
+
+
+async def read_tag_generations(redis_connection: Redis, tags: Iterable[str]) -> Dict[str, str]:
+    """
+    Read the generations of the tags, call it before reading the data of a cache entry written with write_tagged_hash.
+    :return: tag -> generation, the tags in their order.
+    """
+    tags = list(dict.fromkeys(tags))
+    generations = await redis_connection.mget([_generation_key(tag) for tag in tags]) if tags else []
+    return {tag: generation or "0" for tag, generation in zip(tags, generations)}
+
+
+async def tag_cache_entry(redis_connection: Redis, cache_key: str, tags: Iterable[str], ttl_seconds: int) -> None:
+    """
+    Register a cache entry under the tags it depends on, call it right after writing the entry.
+    :param cache_key: The redis key of the cache entry.
+    :param tags: Tags built with cache_tag.
+    :param ttl_seconds: TTL of the cache entry.
+    """
+    tag_script, _, _ = _get_scripts(redis_connection)
+    await tag_script(keys=[_tag_key(tag) for tag in tags], args=[cache_key, ttl_seconds], client=redis_connection)
+
+
+async def write_tagged_hash(
+    redis_connection: Redis,
+    cache_key: str,
+    mapping: Dict[str, str],
+    ttl_seconds: int,
+    tag_generations: Dict[str, str]
+) -> bool:
+    """
+    Replace a hash cache entry and register it under its tags atomically.
+    :param tag_generations: Generations of the tags the entry depends on, read with read_tag_generations before the
+                            data of the entry was read.
+    :return: False if one of the tags was invalidated in the meantime, the entry is then not written.
+    """
+    _, _, write_hash_script = _get_scripts(redis_connection)
+    return bool(await write_hash_script(
+        keys=[cache_key, *(key for tag in tag_generations for key in (_tag_key(tag), _generation_key(tag)))],
+        args=[
+            ttl_seconds, len(tag_generations), *tag_generations.values(),
+            *(item for field_value in mapping.items() for item in field_value)
+        ],
+        client=redis_connection
+    ))
+
+
+async def invalidate_cache_tags(redis_connection: Redis, tags: Iterable[str]) -> int:
+    """
+    Delete every cache entry registered under the tags and notify the other workers, call it after an ontology write.
+    :return: Number of deleted cache entries.
+    """
+    tags = list(dict.fromkeys(tags))
+    _, invalidate_script, _ = _get_scripts(redis_connection)
+
+    deleted = await invalidate_script(
+        keys=[key for tag in tags for key in (_tag_key(tag), _generation_key(tag))], client=redis_connection
+    )
+
+    #this worker drops its in-process state right away, the others when the message arrives
+    _notify_listeners(tags)
+    await redis_connection.publish(CACHE_INVALIDATION_CHANNEL, json.dumps({"tags": tags}))
+
+    return deleted
+
+
+def add_invalidation_listener(listener: InvalidationListener) -> None:
+    """
+    Register a callback for invalidated tags, used by in-process caches that redis can not delete for us.
+    """
+    _invalidation_listeners.append(listener)
+
+
+def _notify_listeners(tags: List[str]) -> None:
+    for listener in _invalidation_listeners:
+        try:
+            listener(tags)
+        except Exception:
+            logger.exception("Cache invalidation listener failed")
+
+
+async def run_invalidation_subscriber(redis_connection: Redis, reconnect_delay_seconds: float = 1.0) -> None:
+    """
+    Long running task that forwards invalidations published by other workers to the local listeners.
+    Runs until it is cancelled, reconnecting whenever the pub/sub connection drops.
+    """
+    while True:
+        pubsub = redis_connection.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+
+                try:
+                    tags = json.loads(message["data"])["tags"]
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Ignoring malformed cache invalidation message: %r", message.get("data"))
+                    continue
+
+                _notify_listeners(tags)
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception:
+            logger.exception("Cache invalidation subscriber lost its connection, reconnecting")
+            await asyncio.sleep(reconnect_delay_seconds)
+
+        finally:
+            await pubsub.aclose()
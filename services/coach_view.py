@@ -0,0 +1,341 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional
+
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import WatchError
+
+from pydantic_schemas.interviewsession_pydantic import InterviewSessionSchema
+from pydantic_schemas.practiceplan_pydantic import PracticePlanSchema
+from pydantic_schemas.practicetask_pydantic import PracticeTaskSchema
+from services.foundry_executor import foundry_call
+from services.ontology_loader import load_session_bundle, SessionBundle
+from services.ontology_projection import (
+    combined_result_projector,
+    dashboard_practice_task_projector,
+    interview_session_projector,
+    practice_plan_projector
+)
+from services.single_flight import cache_single_flight, keep_lock
+from utils.cache_codec import decode_cache_json, encode_cache_payload, StaleCacheEntryError
+from utils.config import settings
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk import FoundryClient
+    from ai_interviewer_sdk.ontology.objects import InterviewSession
+
+logger = logging.getLogger(__name__)
+
+#one hash per object type, every field is one encoded object
+INTERVIEW_SESSIONS_KEY = "coach_view:interview_sessions"   #iid -> InterviewSessionSchema
+COMBINED_RESULTS_KEY = "coach_view:combined_results"       #iid -> CombinedResultSchema
+PRACTICE_PLANS_KEY = "coach_view:practice_plans"           #ppid -> PracticePlanSchema
+PRACTICE_TASKS_KEY = "coach_view:practice_tasks"           #ppid -> PracticeTaskSchema
+
+#exists while the view is materialized, its TTL forces a periodic full rebuild to pick up edits made outside this service
+META_KEY = "coach_view:meta"
+
+#completed sessions whose combined result / practice plan the Foundry automations have not produced yet
+PENDING_IIDS_KEY = "coach_view:pending_iids"
+
+#holds the token of the running rebuild from before its scan until its snapshot is swapped in, renewed while the scan
+#runs so it only expires when the rebuild died
+REBUILD_KEY = "coach_view:rebuilding"
+
+#upserts made while a rebuild runs are also recorded here and replayed after the swap, a write that happened after
+#the scan began would otherwise be overwritten by the older snapshot. one journal per view key, last write wins.
+#the journals live as long as the view, their TTL only bounds what a rebuild that died leaves behind
+JOURNAL_SUFFIX = ":journal"
+
+VIEW_KEYS = (INTERVIEW_SESSIONS_KEY, COMBINED_RESULTS_KEY, PRACTICE_PLANS_KEY, PRACTICE_TASKS_KEY)
+
+#only touch the view while it is materialized, a missing view is built from scratch on the next read anyway.
+#while a rebuild runs the upsert is journaled as well, so it survives the swap (and is not lost while META is missing)
+UPSERT_SCRIPT = """
+local built = redis.call('EXISTS', KEYS[1]) == 1
+local rebuilding = redis.call('EXISTS', KEYS[4]) == 1
+if not built and not rebuilding then
+    return 0
+end
+if built then
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+    if ARGV[3] ~= '' then
+        redis.call('SADD', KEYS[3], ARGV[3])
+    end
+end
+if rebuilding then
+    redis.call('HSET', KEYS[5], ARGV[1], ARGV[2])
+    redis.call('EXPIRE', KEYS[5], ARGV[4])
+    if ARGV[3] ~= '' then
+        redis.call('SADD', KEYS[6], ARGV[3])
+        redis.call('EXPIRE', KEYS[6], ARGV[4])
+    end
+end
+return 1
+"""
+
+#starts a rebuild unless another one is live. journals left by a rebuild that died predate this scan, replaying them
+#could undo newer writes, the journals of a live rebuild must survive until it replays them.
+#KEYS: REBUILD, then the journals
+BEGIN_SCRIPT = """
+if not redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 0
+end
+if #KEYS > 1 then
+    redis.call('DEL', unpack(KEYS, 2))
+end
+return 1
+"""
+
+#applies the journaled upserts to the swapped in view, ends the rebuild and marks the view as materialized.
+#runs in the transaction of the swap, which is only executed while REBUILD still holds the token of the rebuild.
+#KEYS: META, REBUILD, PENDING, PENDING journal, then pairs of view key and its journal
+REPLAY_SCRIPT = """
+local pending = redis.call('SMEMBERS', KEYS[4])
+if #pending > 0 then
+    redis.call('SADD', KEYS[3], unpack(pending))
+end
+for i = 5, #KEYS, 2 do
+    local journal = redis.call('HGETALL', KEYS[i + 1])
+    if #journal > 0 then
+        redis.call('HSET', KEYS[i], unpack(journal))
+    end
+end
+for i = 6, #KEYS, 2 do
+    redis.call('DEL', KEYS[i])
+end
+redis.call('DEL', KEYS[2], KEYS[4])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return #pending
+"""
+
+_scripts: Optional[Dict[str, Any]] = None
+
+
+class CoachView(NamedTuple):
+    """
+    Decoded coach view, objects are the JSON dicts of their schemas.
+    """
+    interview_sessions: List[Dict[str, Any]]
+    combined_results: Dict[int, Dict[str, Any]]
+    practice_plans: Dict[int, List[Dict[str, Any]]]
+    practice_tasks: Dict[int, Dict[str, Any]]
+
+
+def _get_scripts(redis_connection: Redis) -> Dict[str, Any]:
+    global _scripts
+
+    if _scripts is None:
+        _scripts = {
+            "upsert": redis_connection.register_script(UPSERT_SCRIPT),
+            "begin": redis_connection.register_script(BEGIN_SCRIPT),
+            "replay": redis_connection.register_script(REPLAY_SCRIPT),
+        }
+
+    return _scripts
+
+
+def _journal_key(key: str) -> str:
+    return f"{key}{JOURNAL_SUFFIX}"
+
+
+def _bundle_fields(session_bundle: SessionBundle) -> Dict[str, Dict[str, str]]:
+    practice_plans = [plan for plans in session_bundle.practice_plans.values() for plan in plans]
+
+    return {
+        COMBINED_RESULTS_KEY: {
+            str(iid): encode_cache_payload(combined_result_projector.project(combined_result))
+            for iid, combined_result in session_bundle.combined_results.items()
+        },
+        PRACTICE_PLANS_KEY: {
+            str(plan.ppid): encode_cache_payload(practice_plan_projector.project(plan))
+            for plan in practice_plans
+        },
+        PRACTICE_TASKS_KEY: {
+            str(plan.ppid): encode_cache_payload(dashboard_practice_task_projector.project(session_bundle.practice_tasks[plan.ppid]))
+            for plan in practice_plans
+            if plan.ppid in session_bundle.practice_tasks
+        },
+    }
+
+
+async def _rebuild_once(redis_connection: Redis, palantir_client: "FoundryClient", token: str) -> bool:
+    """
+    Scan and swap in a new snapshot while holding the rebuild marker.
+    :return: False if the marker was lost before the swap, the snapshot is then dropped.
+    """
+    interview_session_list: List[InterviewSession] = await foundry_call("InterviewSession.iterate", lambda: list(palantir_client.ontology.objects.InterviewSession.iterate()))
+
+    session_bundle: SessionBundle = await load_session_bundle(
+        palantir_client,
+        iids=[each_interview_session.iid for each_interview_session in interview_session_list],
+        full_scan=True
+    )
+
+    fields = _bundle_fields(session_bundle)
+    fields[INTERVIEW_SESSIONS_KEY] = {
+        str(each_interview_session.iid): encode_cache_payload(interview_session_projector.project(each_interview_session))
+        for each_interview_session in interview_session_list
+    }
+
+    #the swap and the replay only go through while the marker is still ours, a rebuild that took over after it
+    #expired may have cleared the journals this snapshot depends on
+    async with redis_connection.pipeline(transaction=True) as redis_pipe:
+        await redis_pipe.watch(REBUILD_KEY)
+        if await redis_pipe.get(REBUILD_KEY) != token:
+            return False
+
+        redis_pipe.multi()
+        await redis_pipe.delete(*fields.keys(), PENDING_IIDS_KEY)
+        for key, mapping in fields.items():
+            if mapping:
+                await redis_pipe.hset(key, mapping=mapping)
+        await _get_scripts(redis_connection)["replay"](
+            keys=[
+                META_KEY, REBUILD_KEY, PENDING_IIDS_KEY, _journal_key(PENDING_IIDS_KEY),
+                *(journal_pair for key in VIEW_KEYS for journal_pair in (key, _journal_key(key)))
+            ],
+            args=[json.dumps({"sessions": len(interview_session_list)}), settings.COACH_VIEW_TTL_SECONDS],
+            client=redis_pipe
+        )
+
+        try:
+            await redis_pipe.execute()
+        except WatchError:
+            return False
+
+    return True
+
+
+async def rebuild_coach_view(redis_connection: Redis, palantir_client: "FoundryClient") -> None:
+    """
+    Materialize the whole view with one full scan per object type, replacing the old view in a single transaction.
+    Upserts made from the start of the scan until the swap are journaled and replayed on top of the new snapshot.
+    If another rebuild is live, waits for it instead of starting a second one.
+    """
+    lock_seconds = settings.SINGLE_FLIGHT_LOCK_SECONDS
+    journal_keys = [_journal_key(key) for key in (*VIEW_KEYS, PENDING_IIDS_KEY)]
+
+    while True:
+        token = uuid.uuid4().hex
+        if await _get_scripts(redis_connection)["begin"](
+            keys=[REBUILD_KEY, *journal_keys], args=[token, lock_seconds * 1000], client=redis_connection
+        ):
+            keep_marker_task = asyncio.create_task(keep_lock(redis_connection, REBUILD_KEY, token, lock_seconds))
+            try:
+                if await _rebuild_once(redis_connection, palantir_client, token):
+                    return
+            finally:
+                keep_marker_task.cancel()
+
+            logger.warning("Coach view rebuild lost its marker before the swap, waiting for the rebuild that took over")
+
+        #another rebuild is live, it either swaps in its view or its marker expires and this one takes over
+        while await redis_connection.exists(REBUILD_KEY) and not await redis_connection.exists(META_KEY):
+            await asyncio.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL_SECONDS)
+
+        if await redis_connection.exists(META_KEY):
+            return
+
+
+async def _refresh_pending(redis_connection: Redis, palantir_client: "FoundryClient") -> None:
+    """
+    Look up the results and plans of the pending sessions with a filtered query and add what exists by now.
+    """
+    pending_iids = [int(iid) for iid in await redis_connection.smembers(PENDING_IIDS_KEY)]
+    if not pending_iids:
+        return
+
+    session_bundle: SessionBundle = await load_session_bundle(palantir_client, iids=pending_iids)
+
+    redis_pipe = redis_connection.pipeline(transaction=True)
+    for key, mapping in _bundle_fields(session_bundle).items():
+        if mapping:
+            await redis_pipe.hset(key, mapping=mapping)
+
+    #a session is done once the automations produced both its combined result and its practice plan
+    done_iids = [iid for iid in pending_iids if iid in session_bundle.combined_results and iid in session_bundle.practice_plans]
+    if done_iids:
+        await redis_pipe.srem(PENDING_IIDS_KEY, *done_iids)
+
+    await redis_pipe.execute()
+
+
+def _decode_hash(fields: Dict[str, str]) -> Dict[int, Dict[str, Any]]:
+    return {int(field): json.loads(decode_cache_json(value)) for field, value in fields.items()}
+
+
+async def _read_coach_view(redis_connection: Redis) -> CoachView:
+    redis_pipe = redis_connection.pipeline(transaction=False)
+    for key in VIEW_KEYS:
+        await redis_pipe.hgetall(key)
+    interview_sessions, combined_results, practice_plans, practice_tasks = await redis_pipe.execute()
+
+    practice_plans_by_iid: Dict[int, List[Dict[str, Any]]] = {}
+    for _, plan in sorted(_decode_hash(practice_plans).items()):
+        practice_plans_by_iid.setdefault(plan["iid"], []).append(plan)
+
+    return CoachView(
+        interview_sessions=[session for _, session in sorted(_decode_hash(interview_sessions).items())],
+        combined_results=_decode_hash(combined_results),
+        practice_plans=practice_plans_by_iid,
+        practice_tasks=_decode_hash(practice_tasks)
+    )
+
+
+async def load_coach_view(redis_connection: Redis, palantir_client: "FoundryClient") -> CoachView:
+    """
+    Read the coach view, materializing it first if it does not exist (or was written by an older deploy).
+    """
+    async def rebuild() -> bool:
+        await rebuild_coach_view(redis_connection, palantir_client)
+        return True
+
+    async def is_built():
+        return True if await redis_connection.exists(META_KEY) else None
+
+    for _ in range(2):
+        if not await redis_connection.exists(META_KEY):
+            await cache_single_flight.run(redis_connection, META_KEY, build=rebuild, read_cached=is_built)
+
+        await cache_single_flight.run_if_idle(redis_connection, PENDING_IIDS_KEY, lambda: _refresh_pending(redis_connection, palantir_client))
+
+        try:
+            return await _read_coach_view(redis_connection)
+
+        #the view was written with an older cache schema version, drop it and build it again
+        except StaleCacheEntryError:
+            await redis_connection.delete(META_KEY)
+
+    raise StaleCacheEntryError("Coach view could not be rebuilt with the current cache schema version")
+
+
+async def _upsert(redis_connection: Redis, key: str, field: int, obj: BaseModel, pending_iid: str = "") -> None:
+    await _get_scripts(redis_connection)["upsert"](
+        keys=[META_KEY, key, PENDING_IIDS_KEY, REBUILD_KEY, _journal_key(key), _journal_key(PENDING_IIDS_KEY)],
+        args=[str(field), encode_cache_payload(obj), pending_iid, settings.COACH_VIEW_TTL_SECONDS],
+        client=redis_connection
+    )
+
+
+async def upsert_interview_session(redis_connection: Redis, interview_session: InterviewSessionSchema, completed: bool = False) -> None:
+    """
+    Add or replace an interview session in the view.
+    :param completed: Set when the session was just finalized, its combined result and practice plan are then picked up
+                      by the next coach view read.
+    """
+    await _upsert(
+        redis_connection, INTERVIEW_SESSIONS_KEY, interview_session.iid, interview_session,
+        pending_iid=str(interview_session.iid) if completed else ""
+    )
+
+
+async def upsert_practice_plan(redis_connection: Redis, practice_plan: PracticePlanSchema) -> None:
+    await _upsert(redis_connection, PRACTICE_PLANS_KEY, practice_plan.ppid, practice_plan)
+
+
+async def upsert_practice_task(redis_connection: Redis, practice_task: PracticeTaskSchema) -> None:
+    await _upsert(redis_connection, PRACTICE_TASKS_KEY, practice_task.ppid, practice_task)
@@ -1,9 +1,11 @@
-from ai_interviewer_sdk import FoundryClient
+from typing import TYPE_CHECKING
 
-from foundry_sdk_runtime.attachments import Attachment
+if TYPE_CHECKING:
+    from ai_interviewer_sdk import FoundryClient
+    from foundry_sdk_runtime.attachments import Attachment
 
 
-def upload_file_to_foundry(palantir_client: FoundryClient, file_path: str) -> Attachment | None:
+def upload_file_to_foundry(palantir_client: "FoundryClient", file_path: str) -> "Attachment | None":
     attachment_name = "resume_file"
     try:
         attachment = palantir_client.ontology.attachments.upload(file_path, attachment_name)
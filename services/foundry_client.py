@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from utils.config import settings
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk import FoundryClient
+
+logger = logging.getLogger(__name__)
+
+
+def build_foundry_client() -> "FoundryClient":
+    """
+    Build the Foundry client from the settings. Importing the generated SDK loads every object type, object set and
+    action type module, which is most of the start time of a worker, so it is only imported here.
+    """
+    from ai_interviewer_sdk import FoundryClient, UserTokenAuth
+
+    return FoundryClient(auth=UserTokenAuth(token=settings.FOUNDRY_TOKEN), hostname=settings.PALANTIR_PROJECT_URL)
+
+
+class LazyFoundryClient:
+    """
+    Stands in for the FoundryClient and builds it on first use, so a worker starts without importing the SDK.
+    Attribute access is forwarded to the real client, e.g. palantir_client.ontology.objects.User.
+    The first use may come from the event loop or from a Foundry pool thread, the client is only built once.
+    """
+
+    def __init__(self):
+        self._client: Optional["FoundryClient"] = None
+        self._lock = threading.Lock()
+
+        self.init_seconds = 0.0
+
+    def get(self) -> "FoundryClient":
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    started = time.perf_counter()
+                    self._client = build_foundry_client()
+                    self.init_seconds = time.perf_counter() - started
+                    logger.info("Foundry client ready in %.2fs", self.init_seconds)
+        return self._client
+
+    async def preload(self) -> None:
+        """
+        Build the client in a thread, so the first request does not wait for the SDK import.
+        A failure is only logged, the first use builds the client again and raises it.
+        """
+        try:
+            await asyncio.to_thread(self.get)
+        except Exception:
+            logger.exception("Preloading the Foundry client failed")
+
+    @property
+    def initialized(self) -> bool:
+        return self._client is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"initialized": int(self.initialized), "init_seconds": self.init_seconds}
@@ -0,0 +1,155 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from services.metrics import foundry_call_duration, foundry_call_wait
+from services.tracing import tracer
+from utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class FoundryExecutor:
+    """
+    Bounded thread pool for the synchronous ai_interviewer_sdk FoundryClient calls.
+    Every ontology object get, iterate, action and query goes through here so a slow Foundry call
+    only blocks one pool thread instead of the whole event loop.
+    """
+
+    def __init__(self, max_workers: int, slow_wait_seconds: float):
+        self.max_workers = max_workers
+        self.slow_wait_seconds = slow_wait_seconds
+
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.operations: Dict[str, Dict[str, float]] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        #the pool is created on first use, threads are only spawned when calls are actually submitted
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="foundry")
+        return self._executor
+
+    async def run(self, operation: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Run a blocking Foundry call on the pool and await its result.
+        :param operation: Name of the Foundry operation, e.g. "User.get" or "create_turn".
+        :param fn: The synchronous SDK callable.
+        :return: Whatever the SDK call returns.
+        """
+        loop = asyncio.get_running_loop()
+        submitted_at = time.perf_counter()
+
+        #copy the caller's context so context variables set in the request are visible inside the pool thread
+        context = contextvars.copy_context()
+
+        with self._lock:
+            self.queue_depth += 1
+
+        #the call leaves the queue when a pool thread picks it up, or when it is done without having run (cancelled,
+        #or dropped by a pool shutdown), whichever comes first
+        dequeued = False
+
+        def _dequeue() -> None:
+            nonlocal dequeued
+            if not dequeued:
+                dequeued = True
+                self.queue_depth -= 1
+
+        def _on_done(_: asyncio.Future) -> None:
+            with self._lock:
+                _dequeue()
+
+        def _call() -> T:
+            started_at = time.perf_counter()
+            wait_seconds = started_at - submitted_at
+
+            with self._lock:
+                _dequeue()
+                self.in_flight += 1
+                self.total_wait_seconds += wait_seconds
+                self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+            if span is not None:
+                span.set_attribute("wait_ms", round(wait_seconds * 1000, 3))
+
+            if wait_seconds > self.slow_wait_seconds:
+                logger.warning("Foundry call %s waited %.3fs for a pool thread", operation, wait_seconds)
+
+            failed = False
+            try:
+                return context.run(fn, *args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                run_seconds = time.perf_counter() - started_at
+                with self._lock:
+                    self.in_flight -= 1
+                    if failed:
+                        self.failed += 1
+                    else:
+                        self.completed += 1
+
+                    operation_stats = self.operations.setdefault(operation, {"count": 0, "wait_seconds": 0.0, "run_seconds": 0.0})
+                    operation_stats["count"] += 1
+                    operation_stats["wait_seconds"] += wait_seconds
+                    operation_stats["run_seconds"] += run_seconds
+
+                foundry_call_wait.observe(wait_seconds, operation)
+                foundry_call_duration.observe(run_seconds, operation, "error" if failed else "ok")
+
+        with tracer.span(operation, kind="foundry") as span:
+            future = loop.run_in_executor(self._get_executor(), _call)
+            future.add_done_callback(_on_done)
+            return await future
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of the pool counters.
+        :return: Dictionary with queue depth, in-flight calls and wait times.
+        """
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queue_depth,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_seconds": self.total_wait_seconds / finished if finished else 0.0,
+                "max_wait_seconds": self.max_wait_seconds,
+                "operations": {name: dict(values) for name, values in self.operations.items()},
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+foundry_executor = FoundryExecutor(
+    max_workers=settings.FOUNDRY_EXECUTOR_MAX_WORKERS,
+    slow_wait_seconds=settings.FOUNDRY_EXECUTOR_SLOW_WAIT_SECONDS
+)
+
+async def foundry_call(operation: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Dispatch a synchronous FoundryClient call onto the Foundry thread pool.
+    """
+    return await foundry_executor.run(operation, fn, *args, **kwargs)
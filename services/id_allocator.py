@@ -0,0 +1,120 @@
+import asyncio
+from typing import TYPE_CHECKING, Dict
+
+from redis.asyncio import Redis
+
+from services.foundry_executor import foundry_call
+from services.single_flight import acquire_lock, release_lock
+from utils.config import settings
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk import FoundryClient
+
+#ontology query that returns the next free primary key for each object type
+ID_QUERIES: Dict[str, str] = {
+    settings.USER_API_NAME: "next_user_id_api",
+    settings.JOB_DESCRIPTION_API_NAME: "next_job_description_id_api",
+    settings.INTERVIEW_SESSION_API_NAME: "next_interview_session_id_api",
+    settings.TURN_API_NAME: "next_turn_id_api",
+    settings.RESUME_API_NAME: "next_resume_cvidas_api",
+}
+
+#hands out ids from the currently leased block, returns -1 when the block is missing or exhausted
+ALLOCATE_SCRIPT = """
+local ceiling = tonumber(redis.call('GET', KEYS[2]))
+if not ceiling then
+    return -1
+end
+local last_id = redis.call('INCRBY', KEYS[1], ARGV[1])
+if last_id > ceiling then
+    redis.call('DECRBY', KEYS[1], ARGV[1])
+    return -1
+end
+return last_id
+"""
+
+#leases a new block starting at whichever is higher, the last id we handed out or the floor palantir reported
+LEASE_SCRIPT = """
+local floor = tonumber(ARGV[1]) - 1
+local last_id = tonumber(redis.call('GET', KEYS[1]) or '0')
+if floor > last_id then
+    last_id = floor
+    redis.call('SET', KEYS[1], last_id)
+end
+redis.call('SET', KEYS[2], last_id + tonumber(ARGV[2]))
+return last_id
+"""
+
+_allocate_script = None
+_lease_script = None
+
+
+def _get_scripts(redis_connection: Redis):
+    global _allocate_script, _lease_script
+
+    if _allocate_script is None:
+        _allocate_script = redis_connection.register_script(ALLOCATE_SCRIPT)
+        _lease_script = redis_connection.register_script(LEASE_SCRIPT)
+
+    return _allocate_script, _lease_script
+
+
+async def _lease_block(redis_connection: Redis, palantir_client: "FoundryClient", object_type: str, count: int) -> None:
+    """
+    Lease a new block of ids for the object type from Palantir. Only one worker leases at a time,
+    the others wait for the lock to be released and then allocate from the new block.
+    """
+    lock_key = f"id_allocator:{object_type}:lock"
+
+    #token owned, a leaseholder that overran the lock does not release the lock of the worker leasing after it
+    token = await acquire_lock(redis_connection, lock_key, settings.ID_ALLOCATOR_LEASE_LOCK_MS / 1000)
+    if token is None:
+        while await redis_connection.exists(lock_key):
+            await asyncio.sleep(0.01)
+        return
+
+    try:
+        query_name = ID_QUERIES[object_type]
+        next_id = await foundry_call(query_name, getattr(palantir_client.ontology.queries, query_name))
+
+        _, lease_script = _get_scripts(redis_connection)
+        await lease_script(
+            keys=[f"id_allocator:{object_type}:last", f"id_allocator:{object_type}:ceiling"],
+            args=[int(next_id), max(settings.ID_ALLOCATOR_BLOCK_SIZE, count)],
+            client=redis_connection
+        )
+    finally:
+        await release_lock(redis_connection, lock_key, token)
+
+
+async def allocate_ids(redis_connection: Redis, palantir_client: "FoundryClient", object_type: str, count: int = 1) -> int:
+    """
+    Allocate a contiguous range of primary keys for an ontology object type.
+    Ids are handed out from a block leased from Palantir with a single redis INCRBY, so this is safe across workers
+    and only goes to Palantir once per ID_ALLOCATOR_BLOCK_SIZE ids.
+    :param redis_connection: Redis connection.
+    :param palantir_client: Foundry client used to lease a new block when the current one is used up.
+    :param object_type: Ontology api name of the object type, e.g. settings.TURN_API_NAME.
+    :param count: Number of ids to allocate.
+    :return: The first id of the allocated range.
+    """
+    if object_type not in ID_QUERIES:
+        raise ValueError(f"No id query configured for object type {object_type}")
+
+    allocate_script, _ = _get_scripts(redis_connection)
+    keys = [f"id_allocator:{object_type}:last", f"id_allocator:{object_type}:ceiling"]
+
+    while True:
+        last_id = await allocate_script(keys=keys, args=[count], client=redis_connection)
+
+        if last_id != -1:
+            return int(last_id) - count + 1
+
+        await _lease_block(redis_connection, palantir_client, object_type, count)
+
+
+async def allocate_id(redis_connection: Redis, palantir_client: "FoundryClient", object_type: str) -> int:
+    """
+    Allocate a single primary key for an ontology object type.
+    """
+    return await allocate_ids(redis_connection, palantir_client, object_type, count=1)
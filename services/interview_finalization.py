@@ -0,0 +1,162 @@
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, List, Optional
+
+from redis.asyncio import Redis
+
+from services.cache_tags import invalidate_cache_tags, write_tags
+from services.coach_view import upsert_interview_session
+from services.foundry_executor import foundry_call
+from services.id_allocator import allocate_ids
+from services.interview_state import FinishedInterview, interview_state_store
+from services.job_queue import Job, JobContext, job_queue, PermanentJobError
+from services.ontology_projection import interview_session_projector
+from services.turn_persistence import (
+    build_turn_request,
+    create_turns,
+    turn_persistence_lock,
+    turn_persistence_lock_key,
+    TurnPersistenceBusyError,
+)
+from utils.config import settings
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk.ontology.objects import InterviewSession, Turn
+    from foundry_sdk_runtime.types import ReturnEditsMode, ActionConfig, ActionMode, SyncApplyActionResponse
+
+FINALIZE_INTERVIEW_JOB = "finalize_interview"
+
+
+class InterviewNotActiveError(RuntimeError):
+    """
+    The interview to finalize has no live state, it expired or was already finalized.
+    """
+
+
+def finalize_interview_job_id(iid: int) -> str:
+    #one finalization per interview session, a repeated last answer can not enqueue it twice
+    return f"{FINALIZE_INTERVIEW_JOB}:{iid}"
+
+
+async def enqueue_interview_finalization(user_id: int, redis_connection: Redis, answer: Optional[str]) -> str:
+    """
+    Record the last answer, snapshot the turns not flushed yet into a finalize job and clear the live interview state.
+    The job carries those turns, so the user can start a new interview right away while they are still being persisted.
+    :param answer: The user's last answer, None if the last message was not an answer.
+    :return: The job id.
+    """
+    finished_interview: Optional[FinishedInterview] = await interview_state_store.finish(redis_connection, user_id, answer)
+
+    if (
+        finished_interview is None
+        or not finished_interview.iid
+        or not (finished_interview.questions or finished_interview.first_turn_index)
+        or len(finished_interview.questions) != len(finished_interview.answers)
+    ):
+        raise InterviewNotActiveError(f"No active interview to finalize for user {user_id}")
+
+    job_id = finalize_interview_job_id(finished_interview.iid)
+
+    await job_queue.enqueue(
+        redis_connection,
+        FINALIZE_INTERVIEW_JOB,
+        payload={
+            "uid": user_id,
+            "iid": finished_interview.iid,
+            "first_turn_index": finished_interview.first_turn_index,
+            "questions": finished_interview.questions,
+            "answers": finished_interview.answers,
+        },
+        job_id=job_id
+    )
+
+    #only cleared once the job is safely in redis
+    await interview_state_store.clear(redis_connection, user_id, finished_interview.iid)
+
+    return job_id
+
+
+async def finalize_interview(job: Job, context: JobContext) -> None:
+    """
+    Job handler: persist the turns that were not flushed during the interview (usually just the last one) and mark the
+    interview session as completed. The allocated turn ids are saved on the job, so a retry does not allocate new ones.
+    """
+    from foundry_sdk_runtime.types import ActionConfig, ActionMode, ReturnEditsMode
+
+    redis_connection, palantir_client = context
+    payload = job.payload
+
+    user_id: int = payload["uid"]
+    iid: int = payload["iid"]
+    first_turn_index: int = payload.get("first_turn_index", 0)
+    questions: List[str] = payload["questions"]
+    answers: List[str] = payload["answers"]
+
+    if questions and "first_qaid" not in job.progress:
+        first_qaid = await allocate_ids(redis_connection, palantir_client, settings.TURN_API_NAME, count=len(questions))
+        job = await job_queue.save_progress(redis_connection, job, first_qaid=first_qaid)
+
+    async def persist_remaining_turns() -> bool:
+        #a flush that was running when the interview finished, or an earlier attempt, may have created some of them
+        from ai_interviewer_sdk.ontology.objects import Turn
+
+        existing_turns = await foundry_call("Turn.iterate", lambda: list(
+            palantir_client.ontology.objects.Turn.where(Turn.object_type.iid == iid).iterate()
+        ))
+        existing_turn_indexes = {turn.turn_index for turn in existing_turns}
+
+        batch_requests = [
+            build_turn_request(job.progress["first_qaid"] + offset, iid, user_id, first_turn_index + offset, question, answer)
+            for offset, (question, answer) in enumerate(zip(questions, answers))
+            if first_turn_index + offset not in existing_turn_indexes
+        ]
+
+        if batch_requests:
+            await create_turns(palantir_client, batch_requests)
+
+        return True
+
+    if questions and not job.progress.get("turns_created"):
+        if await turn_persistence_lock.run_if_idle(redis_connection, turn_persistence_lock_key(iid), persist_remaining_turns) is None:
+            raise TurnPersistenceBusyError(f"Turns of interview session {iid} are being persisted by another worker")
+
+        job = await job_queue.save_progress(redis_connection, job, turns_created=True)
+
+    current_interview_data: InterviewSession = await foundry_call("InterviewSession.get", palantir_client.ontology.objects.InterviewSession.get, iid)
+
+    completed_at = datetime.now(timezone.utc)
+
+    edit_interview_session: SyncApplyActionResponse = await foundry_call(
+        "edit_interview_session",
+        palantir_client.ontology.actions.edit_interview_session,
+        action_config=ActionConfig(
+            mode=ActionMode.VALIDATE_AND_EXECUTE,
+            return_edits=ReturnEditsMode.ALL),
+        interview_session=iid,
+        uid=user_id,
+        jid=current_interview_data.jid,
+        started_at=current_interview_data.started_at,
+        ended_at=completed_at,
+        status="completed",
+        rubric_version="v1",
+        phase_log=current_interview_data.phase_log,
+        created_at=current_interview_data.created_at,
+        updated_at=completed_at
+    )
+
+    if edit_interview_session.validation.result != "VALID":
+        raise PermanentJobError("Failed to mark interview session as completed")
+
+    #the coach view picks up the combined result and practice plan once the Foundry automations produced them
+    await upsert_interview_session(
+        redis_connection,
+        interview_session_projector.project(current_interview_data, status="completed", ended_at=completed_at, updated_at=completed_at),
+        completed=True
+    )
+
+    await invalidate_cache_tags(
+        redis_connection,
+        write_tags(settings.TURN_API_NAME, user_id) + write_tags(settings.INTERVIEW_SESSION_API_NAME, user_id)
+    )
+
+
+job_queue.register(FINALIZE_INTERVIEW_JOB, finalize_interview)
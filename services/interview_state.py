@@ -0,0 +1,417 @@
+import base64
+import time
+import uuid
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from redis.asyncio import Redis
+
+from utils.config import settings
+
+#prefixes of the question and answer list entries, entries without one were written before compression was added
+COMPRESSED_TEXT_PREFIX = "z:"
+PLAIN_TEXT_PREFIX = "p:"
+
+#resets the interview progress of a session (new or reused) and stores the job description the agent is primed with.
+#flushed_turns is kept, so the turns of a restarted session continue the turn_index of the turns already persisted,
+#and a flush reservation (and a turn reservation) of the earlier run is dropped so it can not write to the new run.
+#the flush holding the reservation may already have created its turns, so flushed_turns skips past the reserved
+#turn_index range, a gap is harmless but a turn_index used twice would hide the new turns from the finalization.
+#run counts the starts of the session, it tells the turns of a restarted run apart from the earlier ones
+START_SCRIPT = """
+redis.call('DEL', KEYS[2], KEYS[3])
+local reserved = redis.call('HGET', KEYS[1], 'flush_count')
+if reserved then
+    redis.call('HINCRBY', KEYS[1], 'flushed_turns', reserved)
+end
+redis.call('HDEL', KEYS[1], 'flush_qaid', 'flush_count', 'turn_token', 'turn_lease_until')
+redis.call('HINCRBY', KEYS[1], 'run', 1)
+for i = 3, #ARGV - 1, 2 do
+    if i <= tonumber(ARGV[1]) * 2 + 1 then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    else
+        redis.call('HSET', KEYS[4], ARGV[i], ARGV[i + 1])
+    end
+end
+redis.call('HSET', KEYS[1], 'current_qna_pointer', 0)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[4], tonumber(ARGV[#ARGV]))
+return 1
+"""
+
+#reserves the next turn of the run for one message: compare-and-set on the run and the pointer the message was
+#read at, so of two concurrent messages at the same pointer only one gets the turn. The reservation expires after
+#ARGV[5], a worker that died while streaming does not block the interview.
+#returns 1 if reserved, 0 if another message holds the turn or the pointer moved on, -1 if the session is gone
+RESERVE_TURN_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local fields = redis.call('HMGET', KEYS[1], 'run', 'current_qna_pointer', 'turn_token', 'turn_lease_until')
+if (fields[1] or '0') ~= ARGV[1] or (fields[2] or '0') ~= ARGV[2] then
+    return 0
+end
+if fields[3] and tonumber(fields[4]) > tonumber(ARGV[4]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'turn_token', ARGV[3], 'turn_lease_until', tonumber(ARGV[4]) + tonumber(ARGV[5]))
+return 1
+"""
+
+#appends the answer (if any) and the question the agent asked next, advances the pointer, releases the turn
+#reservation and slides every TTL. returns the new pointer, or -1 if the session is gone (expired or already
+#finalized) or the reservation was lost to a restart
+APPEND_TURN_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'turn_token') ~= ARGV[6] then
+    return -1
+end
+if ARGV[1] == '1' then
+    redis.call('RPUSH', KEYS[3], ARGV[2])
+end
+redis.call('RPUSH', KEYS[2], ARGV[3])
+local pointer = redis.call('HINCRBY', KEYS[1], 'current_qna_pointer', 1)
+redis.call('HDEL', KEYS[1], 'turn_token', 'turn_lease_until')
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+redis.call('EXPIRE', KEYS[4], ARGV[5])
+return pointer
+"""
+
+#releases a turn reservation whose message was not answered, so the next message can take the turn
+RELEASE_TURN_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'turn_token') ~= ARGV[1] then
+    return 0
+end
+redis.call('HDEL', KEYS[1], 'turn_token', 'turn_lease_until')
+return 1
+"""
+
+#appends the last answer and returns everything the finalization needs: {iid, flushed_turns, questions, answers}
+#with the turns not flushed yet (a reserved batch included, its flush may still fail).
+#a resubmitted last answer is not appended twice
+FINISH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+if ARGV[1] == '1' and redis.call('LLEN', KEYS[3]) < redis.call('LLEN', KEYS[2]) then
+    redis.call('RPUSH', KEYS[3], ARGV[2])
+end
+local fields = redis.call('HMGET', KEYS[1], 'iid', 'flushed_turns')
+return {fields[1], fields[2] or '0', redis.call('LRANGE', KEYS[2], 0, -1), redis.call('LRANGE', KEYS[3], 0, -1)}
+"""
+
+#reserves the oldest answered turns for a flush to Foundry and returns {1, first turn_index, first qaid, questions, answers}.
+#an existing reservation (of a flush that failed or died) is returned as is with a leading 2, so the retry reuses its qaids.
+#without a reservation and ARGV[3] empty it returns {0, count} and the caller allocates count qaids and calls again.
+#returns nil if the state belongs to another session or there is nothing to flush
+RESERVE_TURNS_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'iid') ~= ARGV[1] then
+    return nil
+end
+local start = redis.call('HGET', KEYS[1], 'flushed_turns') or '0'
+local reserved = redis.call('HMGET', KEYS[1], 'flush_qaid', 'flush_count')
+local qaid = reserved[1]
+local count = tonumber(reserved[2])
+local status = 2
+if not qaid then
+    count = math.min(redis.call('LLEN', KEYS[3]), tonumber(ARGV[2]))
+    if count == 0 then
+        return nil
+    end
+    if ARGV[3] == '' then
+        return {0, count}
+    end
+    qaid = ARGV[3]
+    redis.call('HSET', KEYS[1], 'flush_qaid', qaid, 'flush_count', count)
+    status = 1
+end
+return {status, start, qaid, redis.call('LRANGE', KEYS[2], 0, count - 1), redis.call('LRANGE', KEYS[3], 0, count - 1)}
+"""
+
+#drops the flushed turns from the lists once they are in Foundry, fenced on the reservation so a stale flush is a no-op
+COMMIT_TURNS_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'iid') ~= ARGV[1] or redis.call('HGET', KEYS[1], 'flush_qaid') ~= ARGV[2] then
+    return 0
+end
+local count = tonumber(redis.call('HGET', KEYS[1], 'flush_count'))
+redis.call('LTRIM', KEYS[2], count, -1)
+redis.call('LTRIM', KEYS[3], count, -1)
+redis.call('HINCRBY', KEYS[1], 'flushed_turns', count)
+redis.call('HDEL', KEYS[1], 'flush_qaid', 'flush_count')
+return count
+"""
+
+#drops the interview state, but only if it still belongs to the given session and not to one started since
+CLEAR_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'iid') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[4])
+return 1
+"""
+
+_scripts: Optional[Dict[str, Any]] = None
+
+
+def _get_scripts(redis_connection: Redis) -> Dict[str, Any]:
+    global _scripts
+
+    if _scripts is None:
+        _scripts = {
+            "start": redis_connection.register_script(START_SCRIPT),
+            "reserve_turn": redis_connection.register_script(RESERVE_TURN_SCRIPT),
+            "append_turn": redis_connection.register_script(APPEND_TURN_SCRIPT),
+            "release_turn": redis_connection.register_script(RELEASE_TURN_SCRIPT),
+            "finish": redis_connection.register_script(FINISH_SCRIPT),
+            "reserve_turns": redis_connection.register_script(RESERVE_TURNS_SCRIPT),
+            "commit_turns": redis_connection.register_script(COMMIT_TURNS_SCRIPT),
+            "clear": redis_connection.register_script(CLEAR_SCRIPT),
+        }
+
+    return _scripts
+
+
+def _pack_text(text: str, min_compress_bytes: int) -> str:
+    encoded = text.encode("utf-8")
+    if len(encoded) >= min_compress_bytes:
+        compressed = zlib.compress(encoded)
+        #short or incompressible texts are kept as they are
+        if len(compressed) < len(encoded):
+            return COMPRESSED_TEXT_PREFIX + base64.b64encode(compressed).decode("ascii")
+    return PLAIN_TEXT_PREFIX + text
+
+
+def _unpack_text(value: str) -> str:
+    if value.startswith(COMPRESSED_TEXT_PREFIX):
+        return zlib.decompress(base64.b64decode(value[len(COMPRESSED_TEXT_PREFIX):])).decode("utf-8")
+    if value.startswith(PLAIN_TEXT_PREFIX):
+        return value[len(PLAIN_TEXT_PREFIX):]
+    return value
+
+
+class InterviewState(NamedTuple):
+    """
+    The live state of a user's interview.
+    """
+    agent_session_id: Optional[str]
+    current_qna_pointer: int
+    jid: Optional[int]
+    iid: Optional[int]
+    run: int
+    job_description: Dict[str, str]
+
+
+class FinishedInterview(NamedTuple):
+    """
+    Everything the finalization of an interview needs, read in the same script that recorded the last answer.
+    Only the turns that were not flushed to Foundry during the interview are included.
+    """
+    iid: Optional[int]
+    first_turn_index: int
+    questions: List[str]
+    answers: List[str]
+
+
+class TurnBatch(NamedTuple):
+    """
+    Answered turns reserved for a flush to Foundry, turn i gets qaid first_qaid + i and turn_index first_turn_index + i.
+    resumed is set when the reservation was left by an earlier flush, which may have created the turns already.
+    """
+    resumed: bool
+    first_turn_index: int
+    first_qaid: int
+    questions: List[str]
+    answers: List[str]
+
+
+class InterviewStateStore:
+    """
+    Redis state of the running interviews:
+        interview_agent:{uid}             hash with agent_session_id, current_qna_pointer, jid, iid, run, flushed_turns
+                                          the reservation (flush_qaid, flush_count) of the flush in progress
+                                          and the reservation (turn_token, turn_lease_until) of the message answered
+        interview_agent:{uid}:questions   list of the questions the agent asked that are not flushed yet
+        interview_agent:{uid}:answers     list of the user's answers that are not flushed yet
+        jobdescription:{uid}              hash with the job description the agent is primed with
+    Every mutation is a single Lua script, so concurrent requests or workers can not interleave between the list
+    pushes, the pointer update and the TTL refresh. A message reserves its turn before the agent is asked and records
+    it once the agent answered, so two concurrent messages can not both answer the same question.
+    Answered turns are flushed to Foundry while the interview runs and trimmed from the lists, so a live interview
+    only keeps a turn or two in redis. Long questions and answers are stored zlib compressed.
+    """
+
+    def __init__(self, state_ttl_seconds: int, job_description_ttl_seconds: int, compress_min_bytes: int, turn_lease_seconds: int):
+        self.state_ttl_seconds = state_ttl_seconds
+        self.job_description_ttl_seconds = job_description_ttl_seconds
+        self.compress_min_bytes = compress_min_bytes
+        self.turn_lease_seconds = turn_lease_seconds
+
+    def _keys(self, user_id: int) -> List[str]:
+        redis_hash_key = f"interview_agent:{user_id}"
+        return [redis_hash_key, f"{redis_hash_key}:questions", f"{redis_hash_key}:answers", f"jobdescription:{user_id}"]
+
+    async def start(self, redis_connection: Redis, user_id: int, session_fields: Dict[str, Any], job_description: Dict[str, Any]) -> None:
+        """
+        Start (or restart) an interview: the unflushed questions and answers of any earlier run are dropped and the
+        pointer is reset.
+        :param session_fields: Fields to set on the session hash, e.g. agent_session_id, jid and iid. Empty when an
+                               existing agent session is reused.
+        :param job_description: Job description fields the agent is primed with on <start>.
+        """
+        args: List[Any] = [len(session_fields), self.state_ttl_seconds]
+        for field, value in list(session_fields.items()) + list(job_description.items()):
+            args.extend([field, "" if value is None else str(value)])
+        args.append(self.job_description_ttl_seconds)
+
+        await _get_scripts(redis_connection)["start"](keys=self._keys(user_id), args=args, client=redis_connection)
+
+    async def load(self, redis_connection: Redis, user_id: int, include_job_description: bool = False) -> InterviewState:
+        """
+        Read the interview state in one round trip.
+        :param include_job_description: Also read the job description hash, only needed on <start>.
+        """
+        redis_hash_key, _, _, job_description_key = self._keys(user_id)
+
+        redis_pipe = redis_connection.pipeline(transaction=False)
+        await redis_pipe.hmget(redis_hash_key, ["agent_session_id", "current_qna_pointer", "jid", "iid", "run"])
+        if include_job_description:
+            await redis_pipe.hgetall(job_description_key)
+        results = await redis_pipe.execute()
+
+        agent_session_id, current_qna_pointer, jid, iid, run = results[0]
+
+        return InterviewState(
+            agent_session_id=agent_session_id,
+            current_qna_pointer=int(current_qna_pointer or 0),
+            jid=int(jid) if jid else None,
+            iid=int(iid) if iid else None,
+            run=int(run or 0),
+            job_description=results[1] if include_job_description else {}
+        )
+
+    async def reserve_turn(self, redis_connection: Redis, user_id: int, interview_state: InterviewState) -> Optional[str]:
+        """
+        Reserve the next turn for a message before the agent is asked, the state has to be the one the message was
+        handled with. Of two concurrent messages at the same pointer only the first one gets the turn.
+        :return: The reservation token for append_turn, None if another message holds the turn, the pointer moved on
+                 or the interview state is gone.
+        """
+        turn_token = uuid.uuid4().hex
+
+        reserved = await _get_scripts(redis_connection)["reserve_turn"](
+            keys=self._keys(user_id),
+            args=[interview_state.run, interview_state.current_qna_pointer, turn_token, time.time(), self.turn_lease_seconds],
+            client=redis_connection
+        )
+        return turn_token if reserved == 1 else None
+
+    async def append_turn(self, redis_connection: Redis, user_id: int, turn_token: str, question: str, answer: Optional[str] = None) -> int:
+        """
+        Record the user's answer (None for the <start> message) and the question the agent asked next,
+        advancing the pointer, releasing the turn and refreshing the TTLs atomically.
+        :param turn_token: Token returned by reserve_turn.
+        :return: The new pointer, -1 if the interview state expired, was finalized or restarted in the meantime.
+        """
+        return await _get_scripts(redis_connection)["append_turn"](
+            keys=self._keys(user_id),
+            args=[
+                "0" if answer is None else "1",
+                "" if answer is None else _pack_text(answer, self.compress_min_bytes),
+                _pack_text(question, self.compress_min_bytes),
+                self.state_ttl_seconds,
+                self.job_description_ttl_seconds,
+                turn_token
+            ],
+            client=redis_connection
+        )
+
+    async def release_turn(self, redis_connection: Redis, user_id: int, turn_token: str) -> bool:
+        """
+        Release the turn reserved for a message that was not answered, e.g. the agent call failed.
+        :return: False if the reservation is gone already.
+        """
+        return bool(await _get_scripts(redis_connection)["release_turn"](keys=self._keys(user_id), args=[turn_token], client=redis_connection))
+
+    async def finish(self, redis_connection: Redis, user_id: int, answer: Optional[str]) -> Optional[FinishedInterview]:
+        """
+        Record the last answer and read the turns that are not flushed yet in the same round trip.
+        :return: The finished interview, None if there is no interview state.
+        """
+        result = await _get_scripts(redis_connection)["finish"](
+            keys=self._keys(user_id),
+            args=["0" if answer is None else "1", "" if answer is None else _pack_text(answer, self.compress_min_bytes)],
+            client=redis_connection
+        )
+        if not result:
+            return None
+
+        iid, flushed_turns, questions, answers = result
+        return FinishedInterview(
+            iid=int(iid) if iid else None,
+            first_turn_index=int(flushed_turns),
+            questions=[_unpack_text(question) for question in questions],
+            answers=[_unpack_text(answer) for answer in answers]
+        )
+
+    async def reserve_turns(
+        self,
+        redis_connection: Redis,
+        user_id: int,
+        iid: int,
+        max_turns: int,
+        allocate_qaids: Callable[[int], Awaitable[int]]
+    ) -> Optional[TurnBatch]:
+        """
+        Reserve the oldest answered turns of the session for a flush to Foundry.
+        A reservation stays until it is committed, a retried flush gets the same turns with the same qaids.
+        :param max_turns: Upper bound of the batch size.
+        :param allocate_qaids: Coroutine function allocating a contiguous range of the given number of qaids.
+        :return: The reserved batch, None if the state belongs to another session or every answered turn is flushed.
+        """
+        script = _get_scripts(redis_connection)["reserve_turns"]
+        keys = self._keys(user_id)
+
+        result = await script(keys=keys, args=[iid, max_turns, ""], client=redis_connection)
+        if result and result[0] == 0:
+            first_qaid = await allocate_qaids(result[1])
+            #a concurrent flush may have reserved in the meantime, then its reservation wins and these ids are skipped
+            result = await script(keys=keys, args=[iid, max_turns, first_qaid], client=redis_connection)
+
+        if not result:
+            return None
+
+        status, first_turn_index, first_qaid, questions, answers = result
+        return TurnBatch(
+            resumed=status == 2,
+            first_turn_index=int(first_turn_index),
+            first_qaid=int(first_qaid),
+            questions=[_unpack_text(question) for question in questions],
+            answers=[_unpack_text(answer) for answer in answers]
+        )
+
+    async def commit_turns(self, redis_connection: Redis, user_id: int, iid: int, batch: TurnBatch) -> int:
+        """
+        Drop a flushed batch from redis and release its reservation.
+        :return: Number of turns dropped, 0 if the session finished or restarted since the reservation.
+        """
+        return await _get_scripts(redis_connection)["commit_turns"](
+            keys=self._keys(user_id),
+            args=[iid, batch.first_qaid],
+            client=redis_connection
+        )
+
+    async def clear(self, redis_connection: Redis, user_id: int, iid: int) -> bool:
+        """
+        Drop the interview state of a finished session.
+        :return: False if the state belongs to another session by now (or is already gone).
+        """
+        return bool(await _get_scripts(redis_connection)["clear"](keys=self._keys(user_id), args=[iid], client=redis_connection))
+
+
+interview_state_store = InterviewStateStore(
+    state_ttl_seconds=settings.INTERVIEW_STATE_TTL_SECONDS,
+    job_description_ttl_seconds=settings.INTERVIEW_JOB_DESCRIPTION_TTL_SECONDS,
+    compress_min_bytes=settings.INTERVIEW_TEXT_COMPRESS_MIN_BYTES,
+    turn_lease_seconds=settings.INTERVIEW_TURN_LEASE_SECONDS
+)
@@ -0,0 +1,498 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set
+
+from redis.asyncio import Redis
+
+from services.tracing import tracer
+from utils.config import settings
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk import FoundryClient
+
+logger = logging.getLogger(__name__)
+
+#job id -> time the job becomes due, a claimed job stays in here with its lease expiry as score
+PENDING_KEY = "job_queue:pending"
+
+#job id -> time the job was dead lettered
+DEAD_KEY = "job_queue:dead"
+
+JOB_KEY_PREFIX = "job_queue:job:"
+
+#creates the job unless a job with the same id exists, which makes enqueueing idempotent
+ENQUEUE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1],
+    'id', ARGV[1], 'name', ARGV[2], 'payload', ARGV[3], 'status', 'queued',
+    'attempts', 0, 'max_attempts', ARGV[4], 'progress', '{}', 'created_at', ARGV[5], 'updated_at', ARGV[5])
+redis.call('ZADD', KEYS[2], ARGV[6], ARGV[1])
+return 1
+"""
+
+#claims the oldest due job by pushing its score to the lease expiry, if the worker dies the job becomes due again
+CLAIM_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+if #due == 0 then
+    return nil
+end
+local job_key = ARGV[4] .. due[1]
+if redis.call('EXISTS', job_key) == 0 then
+    redis.call('ZREM', KEYS[1], due[1])
+    return nil
+end
+redis.call('ZADD', KEYS[1], tonumber(ARGV[1]) + tonumber(ARGV[2]), due[1])
+redis.call('HINCRBY', job_key, 'attempts', 1)
+redis.call('HSET', job_key, 'status', 'running', 'lease', ARGV[3], 'updated_at', ARGV[1])
+return redis.call('HGETALL', job_key)
+"""
+
+#every script below only acts while the caller still holds the lease, a worker whose lease expired can not
+#complete or fail a job that another worker already claimed again
+EXTEND_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'lease') ~= ARGV[2] then
+    return 0
+end
+redis.call('ZADD', KEYS[2], 'XX', ARGV[3], ARGV[1])
+return 1
+"""
+
+PROGRESS_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'lease') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'progress', ARGV[2], 'updated_at', ARGV[3])
+return 1
+"""
+
+ACK_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'lease') ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[1], 'lease')
+redis.call('HSET', KEYS[1], 'status', 'done', 'updated_at', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+#returns 1 if the job was scheduled for a retry, 2 if it was dead lettered
+FAIL_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'lease') ~= ARGV[2] then
+    return 0
+end
+redis.call('HDEL', KEYS[1], 'lease')
+redis.call('HSET', KEYS[1], 'last_error', ARGV[5], 'updated_at', ARGV[3])
+local attempts = tonumber(redis.call('HGET', KEYS[1], 'attempts'))
+local max_attempts = tonumber(redis.call('HGET', KEYS[1], 'max_attempts'))
+if ARGV[6] == '1' or attempts >= max_attempts then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('ZADD', KEYS[3], ARGV[3], ARGV[1])
+    redis.call('HSET', KEYS[1], 'status', 'dead')
+    return 2
+end
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[1])
+redis.call('HSET', KEYS[1], 'status', 'retrying')
+return 1
+"""
+
+RETRY_DEAD_SCRIPT = """
+if redis.call('ZREM', KEYS[3], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', 'queued', 'attempts', 0, 'updated_at', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+return 1
+"""
+
+_scripts: Optional[Dict[str, Any]] = None
+
+
+def _get_scripts(redis_connection: Redis) -> Dict[str, Any]:
+    global _scripts
+
+    if _scripts is None:
+        _scripts = {
+            "enqueue": redis_connection.register_script(ENQUEUE_SCRIPT),
+            "claim": redis_connection.register_script(CLAIM_SCRIPT),
+            "extend": redis_connection.register_script(EXTEND_SCRIPT),
+            "progress": redis_connection.register_script(PROGRESS_SCRIPT),
+            "ack": redis_connection.register_script(ACK_SCRIPT),
+            "fail": redis_connection.register_script(FAIL_SCRIPT),
+            "retry_dead": redis_connection.register_script(RETRY_DEAD_SCRIPT),
+        }
+
+    return _scripts
+
+
+def _job_key(job_id: str) -> str:
+    return f"{JOB_KEY_PREFIX}{job_id}"
+
+
+class PermanentJobError(RuntimeError):
+    """
+    Raised by a job handler when retrying can not help, the job goes straight to the dead letter set.
+    """
+
+
+class Job(NamedTuple):
+    """
+    A job as stored in redis.
+    progress holds whatever the handler saved with JobQueue.save_progress, so a retry can skip the steps
+    an earlier attempt already completed.
+    """
+    id: str
+    name: str
+    payload: Dict[str, Any]
+    status: str
+    attempts: int
+    max_attempts: int
+    progress: Dict[str, Any]
+    created_at: float
+    updated_at: float
+    last_error: Optional[str] = None
+    lease: Optional[str] = None
+
+
+class JobContext(NamedTuple):
+    """
+    Connections a job handler works with, owned by the worker running it.
+    """
+    redis_connection: Redis
+    palantir_client: "FoundryClient"
+
+
+JobHandler = Callable[[Job, JobContext], Awaitable[Any]]
+
+
+def _parse_job(fields: Dict[str, str]) -> Job:
+    return Job(
+        id=fields["id"],
+        name=fields["name"],
+        payload=json.loads(fields["payload"]),
+        status=fields["status"],
+        attempts=int(fields["attempts"]),
+        max_attempts=int(fields["max_attempts"]),
+        progress=json.loads(fields.get("progress") or "{}"),
+        created_at=float(fields["created_at"]),
+        updated_at=float(fields["updated_at"]),
+        last_error=fields.get("last_error"),
+        lease=fields.get("lease")
+    )
+
+
+class JobQueue:
+    """
+    Durable at-least-once job queue in redis.
+    A worker claims a job by leasing it for the visibility timeout, and keeps extending the lease while the handler
+    runs. Jobs whose worker died become due again once the lease runs out. Failed jobs are retried with exponential
+    backoff and land in the dead letter set after max_attempts, where they can be inspected and retried by hand.
+    Handlers have to be idempotent, a job can run more than once.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int,
+        backoff_base_seconds: float,
+        backoff_max_seconds: float,
+        visibility_timeout_seconds: int,
+        poll_interval_seconds: float,
+        retention_seconds: int
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.visibility_timeout_seconds = visibility_timeout_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.retention_seconds = retention_seconds
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker_tasks: Set["asyncio.Task[None]"] = set()
+
+        self.enqueued = 0
+        self.duplicates = 0
+        self.succeeded = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.lost_leases = 0
+        self.worker_restarts = 0
+
+    def register(self, name: str, handler: JobHandler) -> None:
+        """
+        Register the handler for a job name, every process running workers has to register the same handlers.
+        """
+        self._handlers[name] = handler
+
+    def _get_wakeup(self) -> asyncio.Event:
+        #created on first use so it binds to the running event loop
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def _backoff_seconds(self, attempts: int) -> float:
+        backoff = min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** (attempts - 1))
+        return backoff * random.uniform(0.5, 1.0)
+
+    async def enqueue(
+        self,
+        redis_connection: Redis,
+        name: str,
+        payload: Dict[str, Any],
+        job_id: str,
+        max_attempts: Optional[int] = None,
+        delay_seconds: float = 0.0
+    ) -> bool:
+        """
+        Add a job to the queue.
+        :param job_id: Idempotency key, enqueueing a job id that already exists (queued, running, done within the
+                       retention period or dead) is a no-op.
+        :param payload: JSON serializable job arguments.
+        :param delay_seconds: Only hand the job to a worker after this delay.
+        :return: True if the job was created, False if it already existed.
+        """
+        if name not in self._handlers:
+            raise ValueError(f"No handler registered for job {name}")
+
+        now = time.time()
+        created = await _get_scripts(redis_connection)["enqueue"](
+            keys=[_job_key(job_id), PENDING_KEY],
+            args=[job_id, name, json.dumps(payload), max_attempts or self.max_attempts, now, now + delay_seconds],
+            client=redis_connection
+        )
+
+        if not created:
+            self.duplicates += 1
+            return False
+
+        self.enqueued += 1
+        #workers of this process pick the job up right away, the others on their next poll
+        if not delay_seconds:
+            self._get_wakeup().set()
+        return True
+
+    async def get_job(self, redis_connection: Redis, job_id: str) -> Optional[Job]:
+        fields = await redis_connection.hgetall(_job_key(job_id))
+        return _parse_job(fields) if fields else None
+
+    async def save_progress(self, redis_connection: Redis, job: Job, **progress: Any) -> Job:
+        """
+        Persist the steps a handler completed, merged into job.progress.
+        :return: The job with the updated progress.
+        """
+        merged = {**job.progress, **progress}
+        saved = await _get_scripts(redis_connection)["progress"](
+            keys=[_job_key(job.id)],
+            args=[job.lease, json.dumps(merged), time.time()],
+            client=redis_connection
+        )
+
+        if not saved:
+            raise RuntimeError(f"Lost the lease of job {job.id}")
+
+        return job._replace(progress=merged)
+
+    async def dead_jobs(self, redis_connection: Redis, offset: int = 0, limit: int = 50) -> List[Job]:
+        """
+        Dead lettered jobs, most recent first.
+        """
+        job_ids = await redis_connection.zrevrange(DEAD_KEY, offset, offset + limit - 1)
+
+        redis_pipe = redis_connection.pipeline(transaction=False)
+        for job_id in job_ids:
+            await redis_pipe.hgetall(_job_key(job_id))
+
+        return [_parse_job(fields) for fields in await redis_pipe.execute() if fields]
+
+    async def retry_dead_job(self, redis_connection: Redis, job_id: str) -> bool:
+        """
+        Move a dead lettered job back into the queue with a fresh attempt budget, its progress is kept.
+        :return: False if the job is not dead lettered.
+        """
+        requeued = await _get_scripts(redis_connection)["retry_dead"](
+            keys=[_job_key(job_id), PENDING_KEY, DEAD_KEY],
+            args=[job_id, time.time()],
+            client=redis_connection
+        )
+
+        if requeued:
+            self._get_wakeup().set()
+
+        return bool(requeued)
+
+    async def _claim(self, redis_connection: Redis) -> Optional[Job]:
+        fields = await _get_scripts(redis_connection)["claim"](
+            keys=[PENDING_KEY],
+            args=[time.time(), self.visibility_timeout_seconds, uuid.uuid4().hex, JOB_KEY_PREFIX],
+            client=redis_connection
+        )
+
+        if not fields:
+            return None
+
+        return _parse_job(dict(zip(fields[::2], fields[1::2])))
+
+    async def _keep_lease(self, redis_connection: Redis, job: Job) -> None:
+        extend_script = _get_scripts(redis_connection)["extend"]
+
+        while True:
+            await asyncio.sleep(self.visibility_timeout_seconds / 3)
+
+            extended = await extend_script(
+                keys=[_job_key(job.id), PENDING_KEY],
+                args=[job.id, job.lease, time.time() + self.visibility_timeout_seconds],
+                client=redis_connection
+            )
+
+            if not extended:
+                logger.warning("Lost the lease of job %s while it was running", job.id)
+                return
+
+    async def _run_job(self, job: Job, context: JobContext) -> None:
+        redis_connection = context.redis_connection
+        scripts = _get_scripts(redis_connection)
+
+        lease_task = asyncio.create_task(self._keep_lease(redis_connection, job))
+        try:
+            handler = self._handlers.get(job.name)
+            if handler is None:
+                raise PermanentJobError(f"No handler registered for job {job.name}")
+
+            with tracer.trace(f"job {job.name}", kind="job", job_id=job.id, attempt=job.attempts):
+                await handler(job, context)
+
+        except Exception as e:
+            permanent = isinstance(e, PermanentJobError)
+            logger.exception("Job %s (%s) failed on attempt %d/%d", job.id, job.name, job.attempts, job.max_attempts)
+
+            now = time.time()
+            outcome = await scripts["fail"](
+                keys=[_job_key(job.id), PENDING_KEY, DEAD_KEY],
+                args=[job.id, job.lease, now, now + self._backoff_seconds(job.attempts), f"{type(e).__name__}: {e}", "1" if permanent else "0"],
+                client=redis_connection
+            )
+
+            if outcome == 2:
+                self.dead_lettered += 1
+                logger.error("Job %s (%s) moved to the dead letter set", job.id, job.name)
+            elif outcome == 1:
+                self.retried += 1
+            else:
+                self.lost_leases += 1
+
+        else:
+            acked = await scripts["ack"](
+                keys=[_job_key(job.id), PENDING_KEY],
+                args=[job.id, job.lease, time.time(), self.retention_seconds],
+                client=redis_connection
+            )
+
+            if acked:
+                self.succeeded += 1
+            else:
+                self.lost_leases += 1
+
+        finally:
+            lease_task.cancel()
+
+    async def run_worker(self, context: JobContext, stop_event: Optional[asyncio.Event] = None) -> None:
+        """
+        Long running worker loop, runs one job at a time until it is cancelled or stop_event is set.
+        Start several of them for concurrency. A worker cancelled mid job leaves it to be retried once its lease expires.
+        """
+        wakeup = self._get_wakeup()
+
+        while stop_event is None or not stop_event.is_set():
+            try:
+                job = await self._claim(context.redis_connection)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception:
+                logger.exception("Could not claim a job, retrying")
+                await asyncio.sleep(self.poll_interval_seconds)
+                continue
+
+            if job is not None:
+                try:
+                    await self._run_job(job, context)
+
+                except asyncio.CancelledError:
+                    raise
+
+                except Exception:
+                    #acking or failing the job did not reach redis, the job is retried once its lease expires
+                    logger.exception("Could not complete job %s (%s), continuing", job.id, job.name)
+                    await asyncio.sleep(self.poll_interval_seconds)
+                continue
+
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=self.poll_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def start_workers(self, context: JobContext, count: int) -> None:
+        """
+        Start count run_worker tasks on the running loop. A worker task that ends with an error is logged and
+        replaced, so a process never keeps serving without its job workers.
+        """
+        for _ in range(count):
+            self._start_worker(context)
+
+    def _start_worker(self, context: JobContext) -> None:
+        worker_task = asyncio.create_task(self.run_worker(context))
+        self._worker_tasks.add(worker_task)
+
+        def on_worker_done(task: "asyncio.Task[None]") -> None:
+            self._worker_tasks.discard(task)
+            if task.cancelled():
+                return
+
+            error = task.exception()
+            if error is None:
+                logger.warning("Job worker stopped")
+                return
+
+            self.worker_restarts += 1
+            logger.error("Job worker crashed, restarting it", exc_info=error)
+            self._start_worker(context)
+
+        worker_task.add_done_callback(on_worker_done)
+
+    def stop_workers(self) -> None:
+        """
+        Cancel the workers started with start_workers, the jobs they are running are retried once their lease expires.
+        """
+        for worker_task in list(self._worker_tasks):
+            worker_task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "handlers": sorted(self._handlers),
+            "enqueued": self.enqueued,
+            "duplicates": self.duplicates,
+            "succeeded": self.succeeded,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "lost_leases": self.lost_leases,
+            "worker_restarts": self.worker_restarts,
+            "workers": len(self._worker_tasks),
+        }
+
+
+job_queue = JobQueue(
+    max_attempts=settings.JOB_QUEUE_MAX_ATTEMPTS,
+    backoff_base_seconds=settings.JOB_QUEUE_BACKOFF_BASE_SECONDS,
+    backoff_max_seconds=settings.JOB_QUEUE_BACKOFF_MAX_SECONDS,
+    visibility_timeout_seconds=settings.JOB_QUEUE_VISIBILITY_TIMEOUT_SECONDS,
+    poll_interval_seconds=settings.JOB_QUEUE_POLL_INTERVAL_SECONDS,
+    retention_seconds=settings.JOB_QUEUE_RETENTION_SECONDS
+)
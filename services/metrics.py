@@ -0,0 +1,262 @@
+import bisect
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter
+
+#latency buckets in seconds, from cache hits to a full interview answer stream
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter per label combination.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets per label combination. An observation is a bisect and three additions under a lock,
+    cheap enough to record every request and upstream call. Observations may come from the Foundry pool threads.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+
+        self._lock = threading.Lock()
+        #label values -> [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[label_values] = series
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = {label_values: (list(counts), total[0]) for label_values, (counts, total) in self._series.items()}
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, label_values, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics of this process, rendered in the Prometheus text format by GET /metrics.
+    Components with a stats() method can be registered as collectors, their numeric stats are exported as gauges
+    read at scrape time, so they cost nothing between scrapes.
+    """
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str]) -> Counter:
+        metric = Counter(name, documentation, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, component: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        """
+        Export the numeric values of a stats() dictionary as component_stat{component, stat} gauges.
+        Nested dictionaries are flattened with dots, e.g. breakers.agent_stream.opened.
+        """
+        self._collectors[component] = stats
+
+    def _render_collectors(self) -> List[str]:
+        lines = [
+            "# HELP component_stat Counters and gauges reported by the stats() of the services.",
+            "# TYPE component_stat gauge",
+        ]
+
+        def flatten(prefix: str, values: Dict[str, Any]) -> Iterable[Tuple[str, float]]:
+            for key, value in values.items():
+                stat = f"{prefix}.{key}" if prefix else str(key)
+                if isinstance(value, dict):
+                    yield from flatten(stat, value)
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield stat, value
+
+        for component, stats in sorted(self._collectors.items()):
+            for stat, value in flatten("", stats()):
+                lines.append(f"component_stat{_format_labels(('component', 'stat'), (component, stat))} {_format_value(value)}")
+
+        return lines
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.extend(_render_cache_hit_ratios())
+        lines.extend(self._render_collectors())
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+http_request_duration = metrics_registry.histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of the response.",
+    ("router", "method", "route", "status")
+)
+
+foundry_call_duration = metrics_registry.histogram(
+    "foundry_call_duration_seconds",
+    "Run time of the Foundry SDK calls on the Foundry thread pool, by operation.",
+    ("operation", "outcome")
+)
+
+foundry_call_wait = metrics_registry.histogram(
+    "foundry_call_wait_seconds",
+    "Time the Foundry SDK calls waited for a thread of the Foundry pool, by operation.",
+    ("operation",)
+)
+
+upstream_request_duration = metrics_registry.histogram(
+    "upstream_request_duration_seconds",
+    "Duration of every attempt of the calls to the Palantir AIP APIs until the response headers arrived.",
+    ("endpoint", "outcome")
+)
+
+cache_lookups = metrics_registry.counter(
+    "cache_lookups_total",
+    "Lookups of the redis response caches by key family and result (hit or miss).",
+    ("family", "result")
+)
+
+
+#route endpoint -> name of the router it was included from, e.g. dashboard_router
+_router_names: Dict[Callable[..., Any], str] = {}
+
+
+def register_router(name: str, router: APIRouter) -> None:
+    """
+    Label the requests handled by the routes of this router with its name.
+    """
+    for route in router.routes:
+        endpoint = getattr(route, "endpoint", None)
+        if endpoint is not None:
+            _router_names[endpoint] = name
+
+
+def cache_key_family(cache_key: str) -> str:
+    #dashboard_cache:12 -> dashboard_cache, the user and session ids would explode the number of series
+    return cache_key.split(":", 1)[0]
+
+
+def record_cache_lookup(cache_key: str, hit: bool) -> None:
+    cache_lookups.inc(cache_key_family(cache_key), "hit" if hit else "miss")
+
+
+def _render_cache_hit_ratios() -> List[str]:
+    totals: Dict[str, Dict[str, float]] = {}
+    for (family, result), value in cache_lookups.values().items():
+        totals.setdefault(family, {})[result] = value
+
+    lines = ["# HELP cache_hit_ratio Share of the redis response cache lookups that were hits, by key family.", "# TYPE cache_hit_ratio gauge"]
+    for family, results in sorted(totals.items()):
+        lookups = results.get("hit", 0) + results.get("miss", 0)
+        if lookups:
+            lines.append(f"cache_hit_ratio{_format_labels(('family',), (family,))} {_format_value(results.get('hit', 0) / lookups)}")
+    return lines
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request into http_request_duration_seconds.
+    Requests are labelled with the name of the router and the path template of the matched route, so the number of
+    series stays bounded. Streaming responses are timed until their last chunk.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable[..., Any], send: Callable[..., Any]) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status: List[int] = [500]
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            endpoint: Optional[Callable[..., Any]] = getattr(route, "endpoint", None)
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                _router_names.get(endpoint, "app") if endpoint is not None else "unmatched",
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status[0])
+            )
@@ -0,0 +1,109 @@
+import asyncio
+import functools
+import operator
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, NamedTuple
+
+from services.foundry_executor import foundry_call
+from utils.config import settings
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk import FoundryClient
+    from ai_interviewer_sdk.ontology.objects import CombinedResult, PracticePlan, PracticeTask
+
+
+class SessionBundle(NamedTuple):
+    """
+    Objects linked to a set of interview sessions, joined in memory.
+    """
+    combined_results: "Dict[int, CombinedResult]"
+    practice_plans: "Dict[int, List[PracticePlan]]"
+    practice_tasks: "Dict[int, PracticeTask]"
+
+
+def _any_of(object_property: Any, values: List[int]) -> Any:
+    """
+    Build a single object set filter matching any of the given values, e.g. iid == 1 | iid == 2 | ...
+    """
+    return functools.reduce(operator.or_, (object_property == value for value in values))
+
+
+async def _load_by_keys(object_type: str, object_property: Any, keys: Iterable[int], palantir_client: "FoundryClient") -> List[Any]:
+    """
+    Fetch every object of a type whose property is in keys, using one object set query per chunk of keys
+    instead of one link traversal per key.
+    """
+    unique_keys = sorted(set(keys))
+    if not unique_keys:
+        return []
+
+    object_set = getattr(palantir_client.ontology.objects, object_type)
+    chunk_size = settings.ONTOLOGY_BULK_CHUNK_SIZE
+    chunks = [unique_keys[i:i + chunk_size] for i in range(0, len(unique_keys), chunk_size)]
+
+    pages: List[List[Any]] = await asyncio.gather(*(
+        foundry_call(f"{object_type}.iterate", lambda chunk=chunk: list(object_set.where(_any_of(object_property, chunk)).iterate()))
+        for chunk in chunks
+    ))
+
+    return [each_object for page in pages for each_object in page]
+
+
+async def _load_all(object_type: str, palantir_client: "FoundryClient") -> List[Any]:
+    object_set = getattr(palantir_client.ontology.objects, object_type)
+    return await foundry_call(f"{object_type}.iterate", lambda: list(object_set.iterate()))
+
+
+async def load_practice_tasks(palantir_client: "FoundryClient", ppids: Iterable[int]) -> "Dict[int, PracticeTask]":
+    """
+    Load the practice task of every practice plan in ppids.
+    :return: Practice tasks keyed by ppid.
+    """
+    from ai_interviewer_sdk.ontology.objects import PracticeTask
+
+    practice_tasks = await _load_by_keys(settings.PRACTICE_TASK_API_NAME, PracticeTask.object_type.ppid, ppids, palantir_client)
+    return {task.ppid: task for task in practice_tasks}
+
+
+async def load_session_bundle(palantir_client: "FoundryClient", iids: Iterable[int], full_scan: bool = False) -> SessionBundle:
+    """
+    Load the CombinedResult, PracticePlans and PracticeTasks of a set of interview sessions with a few set based queries.
+    :param palantir_client: Foundry client.
+    :param iids: Interview session ids to load the linked objects for.
+    :param full_scan: Set when iids covers every session in the ontology (coach views), the objects are then
+                      fetched with one iterate per type instead of filtered queries.
+    :return: SessionBundle with the objects keyed by iid / ppid.
+    """
+    from ai_interviewer_sdk.ontology.objects import CombinedResult, PracticePlan
+
+    iids = set(iids)
+
+    if full_scan:
+        combined_result_list, practice_plan_list, practice_task_list = await asyncio.gather(
+            _load_all(settings.COMBINED_RESULT_API_NAME, palantir_client),
+            _load_all(settings.PRACTICE_PLAN_API_NAME, palantir_client),
+            _load_all(settings.PRACTICE_TASK_API_NAME, palantir_client)
+        )
+        practice_tasks = {task.ppid: task for task in practice_task_list}
+
+    else:
+        combined_result_list, practice_plan_list = await asyncio.gather(
+            _load_by_keys(settings.COMBINED_RESULT_API_NAME, CombinedResult.object_type.iid, iids, palantir_client),
+            _load_by_keys(settings.PRACTICE_PLAN_API_NAME, PracticePlan.object_type.iid, iids, palantir_client)
+        )
+        practice_tasks = await load_practice_tasks(palantir_client, [plan.ppid for plan in practice_plan_list])
+
+    combined_results: Dict[int, CombinedResult] = {}
+    for each_combined_result in combined_result_list:
+        if each_combined_result.iid in iids:
+            combined_results[each_combined_result.iid] = each_combined_result
+
+    practice_plans: Dict[int, List[PracticePlan]] = {}
+    for plan in practice_plan_list:
+        if plan.iid in iids:
+            practice_plans.setdefault(plan.iid, []).append(plan)
+
+    return SessionBundle(
+        combined_results=combined_results,
+        practice_plans=practice_plans,
+        practice_tasks=practice_tasks
+    )
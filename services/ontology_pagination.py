@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, List, NamedTuple, Optional, Tuple
+
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
+
+from services.foundry_executor import foundry_call
+from utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+#one NDJSON record, (record type, object)
+NdjsonRecord = Tuple[str, Any]
+
+
+class OntologyPage(NamedTuple):
+    """
+    One page of an object set, next_page_token is None on the last page.
+    """
+    objects: List[Any]
+    next_page_token: Optional[str]
+
+
+async def fetch_page(operation: str, object_set: Any, page_size: int, page_token: Optional[str] = None) -> OntologyPage:
+    """
+    Fetch a single page of an object set using the Foundry page tokens.
+    :param operation: Name of the Foundry operation, e.g. "Turn.page".
+    :param object_set: The (filtered) object set to page through.
+    :param page_token: next_page_token of the previous page, None for the first page.
+    """
+    page = await foundry_call(operation, lambda: object_set.page(page_size=page_size, page_token=page_token))
+    return OntologyPage(objects=list(page.data), next_page_token=page.next_page_token or None)
+
+
+async def iterate_pages(
+    operation: str,
+    object_set: Any,
+    page_size: int = settings.ONTOLOGY_PAGE_SIZE,
+    page_token: Optional[str] = None
+) -> AsyncIterator[List[Any]]:
+    """
+    Yield an object set page by page, the next page is already being fetched while the caller handles the current one.
+    Only one page is held in memory at a time no matter how large the object set is.
+    :param page_token: Resume from this page instead of the first one.
+    """
+    next_fetch: Optional[asyncio.Task] = asyncio.create_task(fetch_page(operation, object_set, page_size, page_token))
+    try:
+        while next_fetch is not None:
+            page: OntologyPage = await next_fetch
+            next_fetch = None
+
+            if page.next_page_token:
+                next_fetch = asyncio.create_task(fetch_page(operation, object_set, page_size, page.next_page_token))
+
+            yield page.objects
+
+    finally:
+        #the client went away mid stream, the prefetched page is not needed anymore
+        if next_fetch is not None:
+            next_fetch.cancel()
+
+
+def ndjson_line(record_type: str, obj: Any) -> bytes:
+    """
+    Serialize one record as {"type": ..., "data": ...} followed by a newline.
+    """
+    return b'{"type":' + to_json(record_type) + b',"data":' + to_json(obj) + b'}\n'
+
+
+def ndjson_response(records: AsyncIterator[NdjsonRecord]) -> StreamingResponse:
+    """
+    Stream records as NDJSON while they are produced.
+    The stream ends with an "end" record carrying the record count, or an "error" record if producing the records
+    failed, so clients can tell a complete stream from a truncated one.
+    """
+    async def body() -> AsyncIterator[bytes]:
+        count = 0
+        try:
+            async for record_type, obj in records:
+                count += 1
+                yield ndjson_line(record_type, obj)
+
+        except Exception as e:
+            #the status line is already sent, the error can only be reported inside the stream
+            logger.exception("NDJSON stream failed after %d records", count)
+            yield ndjson_line("error", {"detail": str(e)})
+            return
+
+        yield ndjson_line("end", {"count": count})
+
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,153 @@
+from datetime import datetime, time
+from operator import attrgetter
+from typing import Any, Callable, Dict, Generic, Iterable, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+
+from pydantic_schemas.combinedresults_pydantic import CombinedResultSchema
+from pydantic_schemas.interviewsession_pydantic import InterviewSessionSchema
+from pydantic_schemas.practiceplan_pydantic import PracticePlanSchema
+from pydantic_schemas.practicetask_pydantic import PracticeTaskSchema
+from pydantic_schemas.turn_pydantic import TurnSchema
+
+SchemaT = TypeVar("SchemaT", bound=BaseModel)
+
+Converter = Callable[[Any], Any]
+
+_object_setattr = object.__setattr__
+
+
+class ObjectProjector(Generic[SchemaT]):
+    """
+    Precompiled mapper from a Foundry ontology object to one of our pydantic schemas.
+    The getter of every field is resolved once per schema, and objects coming straight from the ontology (trusted)
+    skip pydantic validation entirely.
+    """
+
+    def __init__(self, schema: Type[SchemaT], renames: Optional[Dict[str, str]] = None, converters: Optional[Dict[str, Converter]] = None):
+        """
+        :param schema: The pydantic schema to build.
+        :param renames: Schema field name -> ontology property name, for properties named differently in the ontology.
+        :param converters: Schema field name -> function that takes the ontology object and returns the field value.
+        """
+        self.schema = schema
+        self.renames = dict(renames or {})
+        self.converters = dict(converters or {})
+        self._fields_set = set(schema.model_fields)
+        self._getters = self._resolve_getters()
+
+        #model_construct is slower than validating with pydantic-core, so for plain schemas (no private attributes,
+        #no post init) we set the instance dict directly, which is all model_construct ends up doing for them
+        if schema.__private_attributes__ or schema.__pydantic_post_init__:
+            self._construct = lambda values: schema.model_construct(_fields_set=self._fields_set, **values)
+        else:
+            self._construct = self._fast_construct
+
+    def _resolve_getters(self) -> Tuple[Tuple[str, Converter], ...]:
+        #(field, getter) in schema field order, the converter of the field or an attrgetter of its ontology property
+        return tuple(
+            (field_name, self.converters.get(field_name) or attrgetter(self.renames.get(field_name, field_name)))
+            for field_name in self.schema.model_fields
+        )
+
+    def _mapper(self, obj: Any) -> Dict[str, Any]:
+        return {field_name: getter(obj) for field_name, getter in self._getters}
+
+    def _fast_construct(self, values: Dict[str, Any]) -> SchemaT:
+        instance = self.schema.__new__(self.schema)
+        _object_setattr(instance, "__dict__", values)
+        _object_setattr(instance, "__pydantic_fields_set__", self._fields_set)
+        _object_setattr(instance, "__pydantic_extra__", None)
+        _object_setattr(instance, "__pydantic_private__", None)
+        return instance
+
+    def with_converters(self, **converters: Converter) -> "ObjectProjector[SchemaT]":
+        """
+        Copy of this projector with some field converters replaced.
+        """
+        return ObjectProjector(self.schema, renames=self.renames, converters={**self.converters, **converters})
+
+    def project(self, obj: Any, trusted: bool = True, **overrides: Any) -> SchemaT:
+        """
+        Project a single ontology object.
+        :param obj: Ontology object.
+        :param trusted: Skip pydantic validation, only use this for data read from the ontology.
+        :param overrides: Field values that replace the ones read from the object.
+        :return: Schema instance.
+        """
+        values = self._mapper(obj)
+        if overrides:
+            values.update(overrides)
+
+        if trusted:
+            return self._construct(values)
+
+        return self.schema(**values)
+
+    def project_many(self, objects: Iterable[Any], trusted: bool = True, **overrides: Any) -> List[SchemaT]:
+        """
+        Project a list of ontology objects, see project.
+        """
+        mapper = self._mapper
+
+        if trusted:
+            construct = self._construct
+        else:
+            schema = self.schema
+            construct = lambda values: schema(**values)
+
+        projected: List[SchemaT] = []
+        for obj in objects:
+            values = mapper(obj)
+            if overrides:
+                values.update(overrides)
+            projected.append(construct(values))
+
+        return projected
+
+
+def _end_of_day(property_name: str) -> Converter:
+    return lambda obj: datetime.combine(getattr(obj, property_name), time(23, 59))
+
+def _blank_to_none(property_name: str) -> Converter:
+    return lambda obj: getattr(obj, property_name) if getattr(obj, property_name) not in ("", None) else None
+
+def _or_today(property_name: str) -> Converter:
+    return lambda obj: getattr(obj, property_name) if getattr(obj, property_name) not in ("", None) else datetime.today()
+
+def _or_now(property_name: str) -> Converter:
+    return lambda obj: getattr(obj, property_name) if getattr(obj, property_name) else datetime.now()
+
+
+combined_result_projector: ObjectProjector[CombinedResultSchema] = ObjectProjector(
+    CombinedResultSchema,
+    renames={"total_score_25": "total_score25"},
+    converters={"rid": lambda obj: int(obj.rid if isinstance(obj.rid, int) else 0)}
+)
+
+interview_session_projector: ObjectProjector[InterviewSessionSchema] = ObjectProjector(InterviewSessionSchema)
+
+practice_plan_projector: ObjectProjector[PracticePlanSchema] = ObjectProjector(
+    PracticePlanSchema,
+    renames={"next_session_suggested_days": "next_session_suggestion_days"}
+)
+
+practice_task_projector: ObjectProjector[PracticeTaskSchema] = ObjectProjector(
+    PracticeTaskSchema,
+    converters={
+        "due_date": _end_of_day("due_date"),
+        "completed_at": _blank_to_none("completed_at"),
+    }
+)
+
+#the ontology returns '' instead of null for the completed_at of open practice tasks, the dashboard shows today for them
+dashboard_practice_task_projector: ObjectProjector[PracticeTaskSchema] = practice_task_projector.with_converters(
+    completed_at=_or_today("completed_at")
+)
+
+turn_projector: ObjectProjector[TurnSchema] = ObjectProjector(TurnSchema)
+
+qna_turn_projector: ObjectProjector[TurnSchema] = turn_projector.with_converters(
+    created_at=_or_now("created_at"),
+    updated_at=_or_now("updated_at")
+)
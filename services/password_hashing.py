@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, TypeVar
+
+from utils.config import settings
+from utils.utils import encrypt_string, verify_string
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class PasswordHashingOverloadedError(RuntimeError):
+    """
+    Raised when too many hash/verify calls are already waiting for a slot, callers should answer with a 503.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs the bcrypt hashing and verification in a small process pool.
+    bcrypt is deliberately CPU expensive, in the request threadpool a login spike would hold the GIL and starve every
+    other route, in separate processes it only costs the cores we give it.
+    At most max_concurrency calls are submitted to the pool at once, up to max_queue more wait for a slot and
+    everything beyond that is rejected instead of piling up.
+    """
+
+    def __init__(self, max_workers: int, max_concurrency: int, max_queue: int, slow_wait_seconds: float):
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.slow_wait_seconds = slow_wait_seconds
+
+        self._executor: ProcessPoolExecutor | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.operations: Dict[str, Dict[str, float]] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        #the worker processes are only started when the first password is hashed. by then this process runs the
+        #Foundry threads and the event loop, a forked child could deadlock on a lock another thread held, so the
+        #workers are started from a clean forkserver (spawn where that is not available)
+        if self._executor is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context(start_method))
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        #created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def run(self, operation: str, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Run a CPU bound password function in the process pool.
+        :param operation: Name used in the metrics, "hash" or "verify".
+        :param fn: Module level function, it has to be picklable.
+        :raises PasswordHashingOverloadedError: If the wait queue is full.
+        """
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise PasswordHashingOverloadedError("Too many password operations in progress")
+
+        loop = asyncio.get_running_loop()
+        submitted_at = time.perf_counter()
+
+        self.queue_depth += 1
+        try:
+            await self._get_semaphore().acquire()
+        finally:
+            self.queue_depth -= 1
+
+        started_at = time.perf_counter()
+        wait_seconds = started_at - submitted_at
+
+        self.in_flight += 1
+        self.total_wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+        if wait_seconds > self.slow_wait_seconds:
+            logger.warning("Password %s waited %.3fs for a hashing slot", operation, wait_seconds)
+
+        failed = False
+        executor = self._get_executor()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            #a worker died (e.g. OOM killed), shut the broken pool down and start a fresh one for the next call
+            failed = True
+            if self._executor is executor:
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._get_semaphore().release()
+            run_seconds = time.perf_counter() - started_at
+
+            self.in_flight -= 1
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+            operation_stats = self.operations.setdefault(operation, {"count": 0, "wait_seconds": 0.0, "run_seconds": 0.0})
+            operation_stats["count"] += 1
+            operation_stats["wait_seconds"] += wait_seconds
+            operation_stats["run_seconds"] += run_seconds
+
+    async def hash(self, plain_string: str) -> str:
+        return await self.run("hash", encrypt_string, plain_string)
+
+    async def verify(self, plain_string: str, hashed_string: str) -> bool:
+        return await self.run("verify", verify_string, plain_string, hashed_string)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of the pool counters.
+        :return: Dictionary with queue depth, in-flight calls, rejections and wait times.
+        """
+        finished = self.completed + self.failed
+        return {
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": self.total_wait_seconds / finished if finished else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+            "operations": {name: dict(values) for name, values in self.operations.items()},
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASHING_MAX_WORKERS,
+    max_concurrency=settings.PASSWORD_HASHING_MAX_CONCURRENCY,
+    max_queue=settings.PASSWORD_HASHING_MAX_QUEUE,
+    slow_wait_seconds=settings.PASSWORD_HASHING_SLOW_WAIT_SECONDS
+)
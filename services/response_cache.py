@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from redis.asyncio import Redis
+
+from services.cache_tags import write_tagged_hash
+from services.metrics import cache_key_family
+from services.single_flight import cache_single_flight
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+#hash field holding the epoch time after which a stale-while-revalidate entry should be rebuilt
+SOFT_EXPIRY_FIELD = "_soft_expires_at"
+
+#keys this worker is currently refreshing in the background
+_refreshing: Set[str] = set()
+
+#strong references to the refresh tasks, the event loop only keeps weak ones
+_refresh_tasks: Set[asyncio.Task] = set()
+
+
+async def write_cache_hash(
+    redis_connection: Redis,
+    cache_key: str,
+    mapping: Dict[str, str],
+    soft_ttl_seconds: int,
+    hard_ttl_seconds: int,
+    tag_generations: Dict[str, str]
+) -> bool:
+    """
+    Write a stale-while-revalidate hash entry.
+    Until the soft expiry the entry is fresh, between the soft and the hard expiry (the redis TTL) it is still served
+    but rebuilt in the background.
+    :param mapping: Encoded cache fields.
+    :param tag_generations: Cache tags the entry depends on with their generations, read with read_tag_generations
+                            before the data was loaded, see services/cache_tags.py.
+    :return: False if the entry was not written because one of its tags was invalidated while it was built.
+    """
+    return await write_tagged_hash(
+        redis_connection,
+        cache_key,
+        mapping={**mapping, SOFT_EXPIRY_FIELD: str(time.time() + soft_ttl_seconds)},
+        ttl_seconds=hard_ttl_seconds,
+        tag_generations=tag_generations
+    )
+
+
+async def read_cache_hash(redis_connection: Redis, cache_key: str, fields: Iterable[str]) -> Optional[Dict[str, str]]:
+    """
+    Read a cached hash entry.
+    :return: All fields of the entry, or None if it is missing or incomplete.
+    """
+    cached_data = await redis_connection.hgetall(cache_key)
+    if cached_data and all(field in cached_data for field in fields):
+        return cached_data
+    return None
+
+
+def is_stale(cached_data: Dict[str, str]) -> bool:
+    """
+    True if the entry is past its soft expiry, entries written without one always count as stale.
+    """
+    soft_expires_at = cached_data.get(SOFT_EXPIRY_FIELD)
+    return soft_expires_at is None or float(soft_expires_at) < time.time()
+
+
+def schedule_cache_refresh(redis_connection: Redis, cache_key: str, rebuild: Callable[[], Awaitable[object]]) -> bool:
+    """
+    Rebuild a stale entry in the background while the caller serves the stale payload.
+    At most one refresh per key runs in this worker, and the refresh is skipped while any worker is already
+    rebuilding the key (see services/single_flight.py).
+    :param rebuild: Coroutine function that fetches the data and writes the cache entry again.
+    :return: True if a refresh task was started by this call.
+    """
+    if cache_key in _refreshing:
+        return False
+
+    _refreshing.add(cache_key)
+
+    async def refresh() -> None:
+        try:
+            #a trace of its own, the request that scheduled the refresh has most likely finished by now
+            with tracer.trace(f"refresh {cache_key_family(cache_key)}", kind="background", cache_key=cache_key):
+                await cache_single_flight.run_if_idle(redis_connection, cache_key, rebuild)
+
+        except Exception:
+            logger.exception("Background refresh of %s failed", cache_key)
+
+        finally:
+            _refreshing.discard(cache_key)
+
+    task = asyncio.create_task(refresh())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+    return True
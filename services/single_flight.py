@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from redis.asyncio import Redis
+
+from utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+#deletes the lock only if it still holds our token, so a leader that overran its lock can not release someone else's
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+#pushes the expiry of the lock out, only while it still holds our token
+EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_scripts: Optional[Dict[str, Any]] = None
+
+
+def _get_scripts(redis_connection: Redis) -> Dict[str, Any]:
+    global _scripts
+
+    if _scripts is None:
+        _scripts = {
+            "release": redis_connection.register_script(RELEASE_SCRIPT),
+            "extend": redis_connection.register_script(EXTEND_SCRIPT),
+        }
+
+    return _scripts
+
+
+async def acquire_lock(redis_connection: Redis, lock_key: str, lock_seconds: float) -> Optional[str]:
+    """
+    Take a redis lock owned by a random token.
+    :return: The token, None if the lock is held by someone else.
+    """
+    token = uuid.uuid4().hex
+    if await redis_connection.set(lock_key, token, nx=True, px=int(lock_seconds * 1000)):
+        return token
+    return None
+
+
+async def release_lock(redis_connection: Redis, lock_key: str, token: str) -> bool:
+    """
+    Release a lock taken with acquire_lock, a lock that expired and was taken by someone else is left alone.
+    """
+    return bool(await _get_scripts(redis_connection)["release"](keys=[lock_key], args=[token], client=redis_connection))
+
+
+async def keep_lock(redis_connection: Redis, lock_key: str, token: str, lock_seconds: float) -> None:
+    """
+    Renew a lock every third of its lifetime until cancelled, so it outlives a slow holder but still expires soon
+    after the holder died. Returns if the lock was lost.
+    """
+    while True:
+        await asyncio.sleep(lock_seconds / 3)
+
+        try:
+            extended = await _get_scripts(redis_connection)["extend"](
+                keys=[lock_key], args=[token, int(lock_seconds * 1000)], client=redis_connection
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            #the next round tries again, the lock only expires after two more failed renewals
+            logger.exception("Could not renew the lock %s", lock_key)
+            continue
+
+        if not extended:
+            logger.warning("Lost the lock %s while holding it", lock_key)
+            return
+
+
+class SingleFlight:
+    """
+    Makes sure only one rebuild runs per cache key.
+    Inside a worker, concurrent callers for the same key share one in-flight build, which runs as its own task so a
+    caller that is cancelled (e.g. the client disconnected) does not fail the others. Across workers a redis lock
+    elects the leader and is renewed while the build runs. The other workers poll the cache until the leader has
+    written it, and only build themselves once the lock is free again, e.g. because the leader died.
+    """
+
+    def __init__(self, lock_seconds: int, wait_timeout_seconds: float, poll_interval_seconds: float):
+        self.lock_seconds = lock_seconds
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+
+        self._flights: Dict[str, asyncio.Task] = {}
+
+        self.leaders = 0
+        self.local_followers = 0
+        self.remote_followers = 0
+        self.wait_timeouts = 0
+
+    def _lock_key(self, key: str) -> str:
+        return f"single_flight:{key}"
+
+    async def _lead(self, redis_connection: Redis, key: str, token: str, build: Callable[[], Awaitable[T]]) -> T:
+        self.leaders += 1
+        lock_key = self._lock_key(key)
+        keep_lock_task = asyncio.create_task(keep_lock(redis_connection, lock_key, token, self.lock_seconds))
+        try:
+            return await build()
+        finally:
+            keep_lock_task.cancel()
+            try:
+                await release_lock(redis_connection, lock_key, token)
+            except Exception:
+                #the lock expires on its own, a failed release only delays the next rebuild
+                logger.exception("Could not release the single flight lock of %s", key)
+
+    async def _run_flight(
+        self,
+        redis_connection: Redis,
+        key: str,
+        build: Callable[[], Awaitable[T]],
+        read_cached: Callable[[], Awaitable[Optional[T]]]
+    ) -> T:
+        started = time.monotonic()
+        waited = False
+        warned = False
+
+        while True:
+            token = await acquire_lock(redis_connection, self._lock_key(key), self.lock_seconds)
+            if token is not None:
+                return await self._lead(redis_connection, key, token, build)
+
+            #another worker is rebuilding this key and keeps its lock alive, pick up its result as soon as it lands
+            if not waited:
+                self.remote_followers += 1
+                waited = True
+
+            if not warned and time.monotonic() - started >= self.wait_timeout_seconds:
+                self.wait_timeouts += 1
+                warned = True
+                logger.warning("Still waiting after %.1fs for the rebuild of %s by another worker", self.wait_timeout_seconds, key)
+
+            await asyncio.sleep(self.poll_interval_seconds)
+
+            cached = await read_cached()
+            if cached is not None:
+                return cached
+
+    async def run(
+        self,
+        redis_connection: Redis,
+        key: str,
+        build: Callable[[], Awaitable[T]],
+        read_cached: Callable[[], Awaitable[Optional[T]]]
+    ) -> T:
+        """
+        Rebuild a cache entry, coalescing concurrent callers.
+        :param key: The cache key being rebuilt.
+        :param build: Coroutine function that fetches the data, writes the cache entry and returns the result.
+        :param read_cached: Coroutine function returning the cached result, or None while it is not there yet.
+        :return: The result of whichever build ran.
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.local_followers += 1
+        else:
+            #the flight owns the build, cancelling one of the callers does not cancel it for the others
+            flight = asyncio.create_task(self._run_flight(redis_connection, key, build, read_cached))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda finished: self._end_flight(key, finished))
+
+        return await asyncio.shield(flight)
+
+    def _end_flight(self, key: str, flight: asyncio.Task) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        #mark the exception as retrieved, every caller may have been cancelled
+        if not flight.cancelled():
+            flight.exception()
+
+    async def run_if_idle(self, redis_connection: Redis, key: str, build: Callable[[], Awaitable[T]]) -> Optional[T]:
+        """
+        Run the build only if no other rebuild of the key is in flight, in this worker or any other.
+        Used for background refreshes, where skipping is better than waiting.
+        :return: The build result, or None if it was skipped.
+        """
+        if key in self._flights:
+            return None
+
+        token = await acquire_lock(redis_connection, self._lock_key(key), self.lock_seconds)
+        if token is None:
+            return None
+
+        return await self._lead(redis_connection, key, token, build)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "local_followers": self.local_followers,
+            "remote_followers": self.remote_followers,
+            "wait_timeouts": self.wait_timeouts,
+        }
+
+
+cache_single_flight = SingleFlight(
+    lock_seconds=settings.SINGLE_FLIGHT_LOCK_SECONDS,
+    wait_timeout_seconds=settings.SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS,
+    poll_interval_seconds=settings.SINGLE_FLIGHT_POLL_INTERVAL_SECONDS
+)
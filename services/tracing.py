@@ -0,0 +1,236 @@
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """
+    A timed operation within a trace. Spans started while another span is current become its children.
+    """
+
+    __slots__ = ("trace", "name", "kind", "attributes", "children", "started_at", "ended_at", "error")
+
+    def __init__(self, trace: "Trace", name: str, kind: str, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.children: List["Span"] = []
+        self.started_at = time.perf_counter()
+        self.ended_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration_seconds(self) -> float:
+        return (self.ended_at or time.perf_counter()) - self.started_at
+
+    def to_dict(self, trace_started_at: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "start_ms": round((self.started_at - trace_started_at) * 1000, 3),
+            "duration_ms": round(self.duration_seconds * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+            "children": [child.to_dict(trace_started_at) for child in self.children],
+        }
+
+
+class Trace:
+    """
+    The spans of one request (or job run), rooted in a single span.
+    """
+
+    def __init__(self, name: str, kind: str, attributes: Dict[str, Any], max_spans: int):
+        self.trace_id = "%016x" % random.getrandbits(64)
+        self.wall_started_at = time.time()
+        self.max_spans = max_spans
+        self.span_count = 1
+        self.dropped_spans = 0
+        self.root = Span(self, name, kind, attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "started_at": self.wall_started_at,
+            "duration_ms": round(self.root.duration_seconds * 1000, 3),
+            "span_count": self.span_count,
+            "dropped_spans": self.dropped_spans,
+            "root": self.root.to_dict(self.root.started_at),
+        }
+
+
+class TraceExporter:
+    """
+    Keeps the last buffer_size finished traces in memory for GET /api/traces/slowest, and optionally appends the
+    traces slower than file_min_duration_ms to a JSON lines file. No outside collector is involved.
+    """
+
+    def __init__(self, buffer_size: int, file_path: str, file_min_duration_ms: float):
+        self.file_path = file_path
+        self.file_min_duration_ms = file_min_duration_ms
+
+        self._lock = threading.Lock()
+        self._traces: Deque[Trace] = deque(maxlen=buffer_size)
+
+        self.exported = 0
+        self.written = 0
+
+    def export(self, trace: Trace) -> None:
+        with self._lock:
+            self._traces.append(trace)
+            self.exported += 1
+
+        if self.file_path and trace.root.duration_seconds * 1000 >= self.file_min_duration_ms:
+            try:
+                with open(self.file_path, "a", encoding="utf-8") as trace_file:
+                    trace_file.write(json.dumps(trace.to_dict(), default=str) + "\n")
+                self.written += 1
+            except OSError:
+                logger.exception("Could not write trace %s to %s", trace.trace_id, self.file_path)
+
+    def slowest(self, limit: int, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        The slowest of the buffered traces, slowest first.
+        :param name: Only traces whose root span has this name, e.g. "GET /api/dashboard/get-dashboard-data".
+        """
+        with self._lock:
+            traces = [trace for trace in self._traces if name is None or trace.root.name == name]
+
+        traces.sort(key=lambda trace: trace.root.duration_seconds, reverse=True)
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buffered = len(self._traces)
+        return {"buffered": buffered, "exported": self.exported, "written": self.written}
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Per-request tracing with nested spans, carried in a context variable.
+    Outside of a sampled trace span() does nothing but a context variable lookup, so the instrumented Foundry, AIP and
+    redis calls of untraced work (unsampled requests, background tasks) pay close to nothing.
+    Spans survive asyncio.gather and the Foundry thread pool, both copy the context of the caller.
+    """
+
+    def __init__(self, enabled: bool, sample_rate: float, max_spans_per_trace: int, exporter: TraceExporter):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.max_spans_per_trace = max_spans_per_trace
+        self.exporter = exporter
+
+    @contextmanager
+    def trace(self, name: str, kind: str = "request", **attributes: Any) -> Iterator[Optional[Span]]:
+        """
+        Start a new trace, the root span is yielded (None if the trace is not sampled) and exported when it ends.
+        """
+        if not self.enabled or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            yield None
+            return
+
+        trace = Trace(name, kind, attributes, self.max_spans_per_trace)
+        token = _current_span.set(trace.root)
+        try:
+            yield trace.root
+        except BaseException as e:
+            trace.root.error = type(e).__name__
+            raise
+        finally:
+            trace.root.ended_at = time.perf_counter()
+            _current_span.reset(token)
+            self.exporter.export(trace)
+
+    @contextmanager
+    def span(self, name: str, kind: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """
+        Time a block as a child of the current span, yields None when there is no current trace.
+        """
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        trace = parent.trace
+        if trace.span_count >= trace.max_spans:
+            trace.dropped_spans += 1
+            yield None
+            return
+
+        span = Span(trace, name, kind, attributes)
+        trace.span_count += 1
+        parent.children.append(span)
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.ended_at = time.perf_counter()
+            _current_span.reset(token)
+
+    def is_tracing(self) -> bool:
+        return _current_span.get() is not None
+
+
+tracer = Tracer(
+    enabled=settings.TRACING_ENABLED,
+    sample_rate=settings.TRACING_SAMPLE_RATE,
+    max_spans_per_trace=settings.TRACING_MAX_SPANS_PER_TRACE,
+    exporter=TraceExporter(
+        buffer_size=settings.TRACING_BUFFER_SIZE,
+        file_path=settings.TRACING_FILE_PATH,
+        file_min_duration_ms=settings.TRACING_FILE_MIN_DURATION_MS
+    )
+)
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware running every HTTP request in a trace named after its method and route template.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status: List[int] = [500]
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        with tracer.trace(f"{scope['method']} {scope['path']}", kind="request") as root:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                if root is not None:
+                    route = scope.get("route")
+                    #the route template instead of the raw path, so traces of the same endpoint share a name
+                    if route is not None:
+                        root.name = f"{scope['method']} {route.path}"
+                    root.set_attribute("path", scope["path"])
+                    root.set_attribute("status", status[0])
@@ -0,0 +1,142 @@
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, List
+
+from redis.asyncio import Redis
+
+from services.cache_tags import invalidate_cache_tags, write_tags
+from services.foundry_executor import foundry_call
+from services.id_allocator import allocate_ids
+from services.interview_state import interview_state_store
+from services.job_queue import Job, JobContext, job_queue
+from services.single_flight import SingleFlight
+from utils.config import settings
+
+if TYPE_CHECKING:
+    from ai_interviewer_sdk import FoundryClient
+    from ai_interviewer_sdk.ontology.action_types import CreateTurnBatchRequest
+    from ai_interviewer_sdk.ontology.objects import Turn
+    from foundry_sdk_runtime.types import BatchActionConfig, ReturnEditsMode
+
+FLUSH_TURNS_JOB = "flush_interview_turns"
+
+#serializes the flushes and the finalization of an interview session across workers
+turn_persistence_lock = SingleFlight(
+    lock_seconds=settings.SINGLE_FLIGHT_LOCK_SECONDS,
+    wait_timeout_seconds=settings.SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS,
+    poll_interval_seconds=settings.SINGLE_FLIGHT_POLL_INTERVAL_SECONDS
+)
+
+
+class TurnPersistenceBusyError(RuntimeError):
+    """
+    Another worker is persisting turns of the same interview session, the job is retried after a backoff.
+    """
+
+
+def turn_persistence_lock_key(iid: int) -> str:
+    return f"interview_turns:{iid}"
+
+
+def build_turn_request(qaid: int, iid: int, user_id: int, turn_index: int, question: str, answer: str) -> "CreateTurnBatchRequest":
+    from ai_interviewer_sdk.ontology.action_types import CreateTurnBatchRequest
+
+    now = datetime.now(timezone.utc)
+
+    return CreateTurnBatchRequest(
+        qaid=qaid, iid=iid, uid=user_id,
+        turn_index=turn_index,
+        question=question, answer=answer,
+        target_competency="phone-interview",
+        audio_url="", transcript_text=answer,
+        created_at=now,
+        updated_at=now,
+        repair_attempts=0,
+        relevance=0,
+        star_a= 0,
+        clarity=0,
+        filler=0.0,
+        issues="",
+        technical_depth=0,
+        blocked=False,
+        composite_star=0.0,
+        star_r=0,
+        star_s=0,
+        justification="",
+        star_t=0,
+        safety_flags=""
+    )
+
+
+async def create_turns(palantir_client: "FoundryClient", batch_requests: "List[CreateTurnBatchRequest]") -> None:
+    from foundry_sdk_runtime.types import BatchActionConfig, ReturnEditsMode
+
+    await foundry_call(
+        "create_turn",
+        palantir_client.ontology.batch_actions.create_turn,
+        batch_action_config=BatchActionConfig(return_edits=ReturnEditsMode.ALL),
+        requests=batch_requests
+    )
+
+
+async def enqueue_turn_flush(redis_connection: Redis, user_id: int, iid: int, run: int, current_qna_pointer: int) -> None:
+    """
+    Schedule the flush of the answered turns of a running interview.
+    A flush persists every answered turn that is still in redis, so when answers arrive faster than the flushes run
+    the later jobs find nothing left to do and the turns go out in one batch.
+    :param run: Run of the session the answer belongs to, a restart on the same session resets the pointer.
+    :param current_qna_pointer: Pointer after the answer was recorded, together with run it makes the job id unique
+                                per answer. A reused job id would be a no-op for as long as the done job is retained.
+    """
+    await job_queue.enqueue(
+        redis_connection,
+        FLUSH_TURNS_JOB,
+        payload={"uid": user_id, "iid": iid},
+        job_id=f"{FLUSH_TURNS_JOB}:{iid}:{run}:{current_qna_pointer}",
+        delay_seconds=settings.TURN_FLUSH_DELAY_SECONDS
+    )
+
+
+async def flush_interview_turns(job: Job, context: JobContext) -> None:
+    """
+    Job handler: persist the answered turns of a running interview in batches of TURN_FLUSH_BATCH_SIZE and drop
+    them from redis. The reservation in the interview state keeps the qaids of a batch stable across retries.
+    """
+    redis_connection, palantir_client = context
+    user_id: int = job.payload["uid"]
+    iid: int = job.payload["iid"]
+
+    async def allocate_qaids(count: int) -> int:
+        return await allocate_ids(redis_connection, palantir_client, settings.TURN_API_NAME, count=count)
+
+    async def flush() -> bool:
+        from ai_interviewer_sdk.ontology.objects import Turn
+
+        while True:
+            batch = await interview_state_store.reserve_turns(
+                redis_connection, user_id, iid, settings.TURN_FLUSH_BATCH_SIZE, allocate_qaids
+            )
+            #finished, restarted or nothing left to flush
+            if batch is None:
+                return True
+
+            #the flush that reserved the batch may have created the turns and died before committing
+            already_created = batch.resumed and await foundry_call("Turn.iterate", lambda: list(
+                palantir_client.ontology.objects.Turn.where(Turn.object_type.qaid == batch.first_qaid).iterate()
+            ))
+
+            if not already_created:
+                await create_turns(palantir_client, [
+                    build_turn_request(batch.first_qaid + offset, iid, user_id, batch.first_turn_index + offset, question, answer)
+                    for offset, (question, answer) in enumerate(zip(batch.questions, batch.answers))
+                ])
+
+            if not await interview_state_store.commit_turns(redis_connection, user_id, iid, batch):
+                return True
+
+            await invalidate_cache_tags(redis_connection, write_tags(settings.TURN_API_NAME, user_id))
+
+    if await turn_persistence_lock.run_if_idle(redis_connection, turn_persistence_lock_key(iid), flush) is None:
+        raise TurnPersistenceBusyError(f"Turns of interview session {iid} are being persisted by another worker")
+
+
+job_queue.register(FLUSH_TURNS_JOB, flush_interview_turns)
@@ -0,0 +1,381 @@
+import asyncio
+import importlib.util
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Set
+
+import httpx
+
+from services.metrics import upstream_request_duration
+from services.tracing import tracer
+from utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+AGENT_SESSION_CREATE = "agent_session_create"
+AGENT_STREAM = "agent_stream"
+
+#upstream statuses that mean palantir is overloaded or down, not that the request was wrong
+RETRYABLE_STATUS_CODES = frozenset({429, 502, 503, 504})
+
+#failures where the request never reached palantir, safe to retry even for calls that are not idempotent
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    The circuit breaker of an upstream endpoint is open, the call failed fast without reaching palantir.
+    """
+
+
+class EndpointPolicy(NamedTuple):
+    """
+    How the calls to one upstream endpoint are made.
+    :param timeout: Read timeout, for streams the longest gap between two chunks.
+    :param max_retries: Retries on top of the first attempt, each one also needs a token from the retry budget.
+    :param idempotent: Whether a call that may have reached palantir can be sent again (retried or hedged).
+    :param hedge_after_seconds: Send a second copy of an idempotent call that has not answered after this long, 0 disables it.
+    """
+    timeout: float
+    max_retries: int
+    idempotent: bool
+    hedge_after_seconds: float = 0.0
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and fails every call fast for open_seconds.
+    Then a single probe call is let through (half open), its success closes the breaker and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.open_seconds:
+            return "open"
+        return "half_open"
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+
+        self.rejected += 1
+        raise CircuitOpenError("Palantir is not responding, try again shortly")
+
+    def record_success(self) -> None:
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    def abandon_call(self) -> None:
+        #the call was cancelled or failed locally, it says nothing about palantir but must not keep the probe slot
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._consecutive_failures += 1
+        if self._probe_in_flight or (self._opened_at is None and self._consecutive_failures >= self.failure_threshold):
+            self._opened_at = time.monotonic()
+            self.opened += 1
+        self._probe_in_flight = False
+
+
+class RetryBudget:
+    """
+    Token bucket limiting the retries to a share of the calls: every call deposits ratio tokens and every retry takes one.
+    When palantir is down the retries stop once the budget is spent, instead of multiplying the load.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+
+        self.exhausted = 0
+
+    def deposit(self) -> None:
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self._tokens < 1:
+            self.exhausted += 1
+            return False
+        self._tokens -= 1
+        return True
+
+
+class UpstreamClient:
+    """
+    The HTTP client for the palantir AIP agent APIs, handed to the routes by get_http_client.
+    Wraps one pooled httpx.AsyncClient and applies the policy of the endpoint to every call: timeouts, retries within
+    the shared retry budget, a circuit breaker per endpoint and hedging of slow idempotent calls. Pool timeouts are
+    short, so during a palantir slowdown calls fail fast instead of queueing for a socket.
+    """
+
+    def __init__(
+        self,
+        policies: Dict[str, EndpointPolicy],
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry_seconds: float,
+        connect_timeout_seconds: float,
+        pool_timeout_seconds: float,
+        http2: bool,
+        retry_budget: RetryBudget,
+        breaker_failure_threshold: int,
+        breaker_open_seconds: float,
+        retry_backoff_seconds: float
+    ):
+        self.policies = policies
+        self.connect_timeout_seconds = connect_timeout_seconds
+        self.pool_timeout_seconds = pool_timeout_seconds
+        self.retry_budget = retry_budget
+        self.retry_backoff_seconds = retry_backoff_seconds
+
+        #http2 needs the optional h2 package (pip install httpx[http2])
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("UPSTREAM_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry_seconds
+            ),
+            timeout=httpx.Timeout(10.0, connect=connect_timeout_seconds, pool=pool_timeout_seconds)
+        )
+        self._breakers = {
+            endpoint: CircuitBreaker(breaker_failure_threshold, breaker_open_seconds)
+            for endpoint in policies
+        }
+
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+
+        #closes of the responses of hedged copies that lost, kept referenced until they finished
+        self._closing_tasks: Set["asyncio.Task[None]"] = set()
+
+    def _timeout(self, policy: EndpointPolicy) -> httpx.Timeout:
+        return httpx.Timeout(policy.timeout, connect=self.connect_timeout_seconds, pool=self.pool_timeout_seconds)
+
+    def _can_retry(self, policy: EndpointPolicy, attempt: int, error: Optional[Exception]) -> bool:
+        if attempt >= policy.max_retries:
+            return False
+        if not policy.idempotent and not isinstance(error, NOT_SENT_ERRORS):
+            return False
+        return self.retry_budget.withdraw()
+
+    def _discard(self, task: "asyncio.Task[httpx.Response]") -> None:
+        """
+        Cancel a hedged copy that is not needed anymore, a response it already got is closed so its connection goes
+        back to the pool right away instead of on garbage collection.
+        """
+        def close_response(finished: "asyncio.Task[httpx.Response]") -> None:
+            if finished.cancelled() or finished.exception() is not None:
+                return
+            closing_task = asyncio.create_task(finished.result().aclose())
+            self._closing_tasks.add(closing_task)
+            closing_task.add_done_callback(self._closing_tasks.discard)
+
+        task.add_done_callback(close_response)
+        task.cancel()
+
+    async def _hedged(self, send: Callable[[], Awaitable[httpx.Response]], hedge_after_seconds: float) -> httpx.Response:
+        primary = asyncio.create_task(send())
+        copies = [primary]
+        winner: Optional["asyncio.Task[httpx.Response]"] = None
+
+        try:
+            done, _ = await asyncio.wait(copies, timeout=hedge_after_seconds)
+            if done:
+                winner = primary
+                return primary.result()
+
+            self.hedges += 1
+            hedge = asyncio.create_task(send())
+            copies.append(hedge)
+            pending = set(copies)
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        winner = task
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            #the slower copy (or both, if the caller was cancelled) is not needed anymore, also when both answered
+            for task in copies:
+                if task is not winner:
+                    self._discard(task)
+
+    async def _timed(self, endpoint: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        started = time.perf_counter()
+        outcome = "cancelled"
+        with tracer.span(endpoint, kind="http") as span:
+            try:
+                response = await send()
+                outcome = str(response.status_code)
+                return response
+            except Exception as e:
+                outcome = type(e).__name__
+                raise
+            finally:
+                upstream_request_duration.observe(time.perf_counter() - started, endpoint, outcome)
+                if span is not None:
+                    span.set_attribute("outcome", outcome)
+
+    async def _call(
+        self,
+        endpoint: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        hedge: bool
+    ) -> httpx.Response:
+        policy = self.policies[endpoint]
+        breaker = self._breakers[endpoint]
+
+        async def timed_send() -> httpx.Response:
+            return await self._timed(endpoint, send)
+
+        self.calls += 1
+        self.retry_budget.deposit()
+
+        attempt = 0
+        while True:
+            breaker.before_call()
+
+            try:
+                if hedge and policy.idempotent and policy.hedge_after_seconds > 0:
+                    response = await self._hedged(timed_send, policy.hedge_after_seconds)
+                else:
+                    response = await timed_send()
+
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                if not self._can_retry(policy, attempt, e):
+                    self.failures += 1
+                    raise
+
+            except BaseException:
+                breaker.abandon_call()
+                raise
+
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    breaker.record_success()
+                    return response
+
+                breaker.record_failure()
+                if not self._can_retry(policy, attempt, None):
+                    self.failures += 1
+                    return response
+
+                await response.aclose()
+
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(self.retry_backoff_seconds * 2 ** (attempt - 1) * random.uniform(0.5, 1.0))
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Make a call and read the whole response.
+        :param endpoint: Name of the endpoint policy, e.g. AGENT_SESSION_CREATE.
+        :raises CircuitOpenError: If the breaker of the endpoint is open.
+        """
+        timeout = self._timeout(self.policies[endpoint])
+        return await self._call(
+            endpoint,
+            lambda: self._client.request(method, url, timeout=timeout, **kwargs),
+            hedge=True
+        )
+
+    async def stream(self, endpoint: str, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Make a streaming call, returns once the response headers arrived. The caller has to close the response.
+        Streams are never hedged.
+        :raises CircuitOpenError: If the breaker of the endpoint is open.
+        """
+        timeout = self._timeout(self.policies[endpoint])
+        return await self._call(
+            endpoint,
+            lambda: self._client.send(self._client.build_request(method, url, timeout=timeout, **kwargs), stream=True),
+            hedge=False
+        )
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failures": self.failures,
+            "retry_budget_exhausted": self.retry_budget.exhausted,
+            "breakers": {
+                endpoint: {"state": breaker.state, "opened": breaker.opened, "rejected": breaker.rejected}
+                for endpoint, breaker in self._breakers.items()
+            },
+        }
+
+
+def build_upstream_client() -> UpstreamClient:
+    """
+    Build the upstream client from the settings, called once per process on startup.
+    """
+    return UpstreamClient(
+        policies={
+            #an extra agent session is harmless, so session creation is retried and may be hedged
+            AGENT_SESSION_CREATE: EndpointPolicy(
+                timeout=settings.AGENT_SESSION_CREATE_TIMEOUT_SECONDS,
+                max_retries=settings.AGENT_SESSION_CREATE_MAX_RETRIES,
+                idempotent=True,
+                hedge_after_seconds=settings.AGENT_SESSION_CREATE_HEDGE_AFTER_SECONDS
+            ),
+            #sending the user's message twice would confuse the agent, only retried if it never left this process
+            AGENT_STREAM: EndpointPolicy(
+                timeout=settings.AGENT_STREAM_READ_TIMEOUT_SECONDS,
+                max_retries=settings.AGENT_STREAM_MAX_RETRIES,
+                idempotent=False
+            ),
+        },
+        max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry_seconds=settings.UPSTREAM_KEEPALIVE_EXPIRY_SECONDS,
+        connect_timeout_seconds=settings.UPSTREAM_CONNECT_TIMEOUT_SECONDS,
+        pool_timeout_seconds=settings.UPSTREAM_POOL_TIMEOUT_SECONDS,
+        http2=settings.UPSTREAM_HTTP2,
+        retry_budget=RetryBudget(
+            ratio=settings.UPSTREAM_RETRY_BUDGET_RATIO,
+            max_tokens=settings.UPSTREAM_RETRY_BUDGET_MAX_TOKENS
+        ),
+        breaker_failure_threshold=settings.UPSTREAM_BREAKER_FAILURE_THRESHOLD,
+        breaker_open_seconds=settings.UPSTREAM_BREAKER_OPEN_SECONDS,
+        retry_backoff_seconds=settings.UPSTREAM_RETRY_BACKOFF_SECONDS
+    )
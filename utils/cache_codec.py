@@ -0,0 +1,169 @@
+import base64
+import hashlib
+import json
+import pickle
+import zlib
+from typing import Any, Dict, Type
+
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+from pydantic_schemas.combinedresults_pydantic import CombinedResultSchema
+from pydantic_schemas.interviewsession_pydantic import InterviewSessionSchema
+from pydantic_schemas.practiceplan_pydantic import PracticePlanSchema
+from pydantic_schemas.practicetask_pydantic import PracticeTaskSchema
+from pydantic_schemas.turn_pydantic import TurnSchema
+from utils.config import settings
+
+#every cache entry starts with "<magic>:<schema version>:<codec name>:" followed by the codec payload
+CACHE_HEADER_MAGIC = "cc1"
+
+#schemas that end up in the redis caches, any change to their fields changes the schema version
+CACHED_SCHEMAS: tuple[Type[BaseModel], ...] = (
+    CombinedResultSchema,
+    InterviewSessionSchema,
+    PracticePlanSchema,
+    PracticeTaskSchema,
+    TurnSchema,
+)
+
+
+class StaleCacheEntryError(ValueError):
+    """
+    Raised when a cache entry was written by an older deploy (different schema version) or in the legacy pickle format.
+    Callers should treat it as a cache miss and rebuild the entry.
+    """
+
+
+class CacheCodec:
+    """
+    Turns the JSON text of a cache payload into the string stored in redis and back.
+    """
+    name: str = ""
+
+    def encode(self, json_text: str) -> str:
+        raise NotImplementedError
+
+    def decode(self, payload: str) -> str:
+        raise NotImplementedError
+
+
+class JsonCacheCodec(CacheCodec):
+    """
+    Stores the JSON text as is, the cheapest option for small entries.
+    """
+    name = "json"
+
+    def encode(self, json_text: str) -> str:
+        return json_text
+
+    def decode(self, payload: str) -> str:
+        return payload
+
+
+class ZlibJsonCacheCodec(CacheCodec):
+    """
+    zlib compressed JSON. The redis connection uses decode_responses, so the compressed bytes still have to be
+    base64 encoded, but for the list payloads we cache that is a lot smaller than the raw JSON.
+    """
+    name = "zlib"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def encode(self, json_text: str) -> str:
+        return base64.b64encode(zlib.compress(json_text.encode(), self.level)).decode()
+
+    def decode(self, payload: str) -> str:
+        return zlib.decompress(base64.b64decode(payload)).decode()
+
+
+CACHE_CODECS: Dict[str, CacheCodec] = {}
+
+def register_cache_codec(codec: CacheCodec) -> None:
+    """
+    Make a codec available for encoding (selected with settings.CACHE_CODEC) and for decoding entries that name it.
+    """
+    CACHE_CODECS[codec.name] = codec
+
+register_cache_codec(JsonCacheCodec())
+register_cache_codec(ZlibJsonCacheCodec())
+
+
+def _schema_fingerprint() -> str:
+    fields = [
+        (schema.__name__, name, repr(field.annotation))
+        for schema in CACHED_SCHEMAS
+        for name, field in schema.model_fields.items()
+    ]
+    return hashlib.sha1(repr(fields).encode()).hexdigest()[:8]
+
+#the manual version can be bumped to drop every entry on deploy, the fingerprint changes on its own with the schemas
+CACHE_SCHEMA_VERSION = f"{settings.CACHE_SCHEMA_VERSION}.{_schema_fingerprint()}"
+
+
+def encode_cache_payload(obj: Any) -> str:
+    """
+    Encode a cache payload (pydantic models, lists and dicts of them, primitives) into a versioned cache entry.
+    :param obj: The payload to cache.
+    :return: String to store in redis.
+    """
+    return encode_cache_json(to_json(obj).decode())
+
+
+def encode_cache_json(json_text: str) -> str:
+    """
+    Encode the already serialized JSON text of a cache payload into a versioned cache entry.
+    Lets callers serialize a payload once and use the same JSON for the cache entry and the response body.
+    """
+    codec = CACHE_CODECS[settings.CACHE_CODEC]
+    if len(json_text) < settings.CACHE_COMPRESSION_MIN_BYTES:
+        codec = CACHE_CODECS[JsonCacheCodec.name]
+
+    return f"{CACHE_HEADER_MAGIC}:{CACHE_SCHEMA_VERSION}:{codec.name}:{codec.encode(json_text)}"
+
+
+def decode_cache_json(data: str) -> str:
+    """
+    Decode a cache entry back into the JSON text of its payload, without parsing it.
+    :raises StaleCacheEntryError: If the entry has an old schema version or uses the legacy pickle format.
+    """
+    magic, _, rest = data.partition(":")
+    if magic != CACHE_HEADER_MAGIC:
+        raise StaleCacheEntryError("Legacy cache entry")
+
+    schema_version, _, rest = rest.partition(":")
+    if schema_version != CACHE_SCHEMA_VERSION:
+        raise StaleCacheEntryError(f"Cache entry has schema version {schema_version}, expected {CACHE_SCHEMA_VERSION}")
+
+    codec_name, _, payload = rest.partition(":")
+    codec = CACHE_CODECS.get(codec_name)
+    if codec is None:
+        raise StaleCacheEntryError(f"Unknown cache codec {codec_name}")
+
+    return codec.decode(payload)
+
+
+def decode_cache_payload(data: str) -> Any:
+    """
+    Decode a cache entry. Models come back as plain dicts, which serialize to the same response JSON.
+    :raises StaleCacheEntryError: If the entry has an old schema version or uses the legacy pickle format.
+    """
+    try:
+        return json.loads(decode_cache_json(data))
+
+    except StaleCacheEntryError:
+        if settings.CACHE_ACCEPT_LEGACY_PICKLE and not data.startswith(f"{CACHE_HEADER_MAGIC}:"):
+            return decode_legacy_pickle(data)
+        raise
+
+
+def decode_legacy_pickle(data: str) -> Any:
+    """
+    Decode an entry written by the old pickle + base64 encode_for_cache. Only used while migrating.
+    """
+    return pickle.loads(base64.b64decode(data.encode()))
+
+
+def is_current_cache_entry(data: str) -> bool:
+    return data.startswith(f"{CACHE_HEADER_MAGIC}:{CACHE_SCHEMA_VERSION}:")
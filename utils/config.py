@@ -36,6 +36,91 @@ class Settings(BaseSettings):
     JWT_TOKEN_EXPIRATION_MINUTES: int
     JWT_REFRESH_TOKEN_EXPIRATION_DAYS: int
 
+    FOUNDRY_EXECUTOR_MAX_WORKERS: int = 32
+    FOUNDRY_EXECUTOR_SLOW_WAIT_SECONDS: float = 1.0
+    FOUNDRY_SDK_PRELOAD: bool = True
+
+    ID_ALLOCATOR_BLOCK_SIZE: int = 100
+    ID_ALLOCATOR_LEASE_LOCK_MS: int = 5000
+
+    ONTOLOGY_BULK_CHUNK_SIZE: int = 200
+    ONTOLOGY_PAGE_SIZE: int = 100
+    ONTOLOGY_MAX_PAGE_SIZE: int = 500
+
+    CACHE_SCHEMA_VERSION: str = "1"
+    CACHE_CODEC: str = "zlib"
+    CACHE_COMPRESSION_MIN_BYTES: int = 1024
+    CACHE_ACCEPT_LEGACY_PICKLE: bool = False
+
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10000
+
+    PASSWORD_HASHING_MAX_WORKERS: int = 2
+    PASSWORD_HASHING_MAX_CONCURRENCY: int = 2
+    PASSWORD_HASHING_MAX_QUEUE: int = 64
+    PASSWORD_HASHING_SLOW_WAIT_SECONDS: float = 1.0
+
+    DASHBOARD_CACHE_TTL_SECONDS: int = 60 * 60 * 2
+    DASHBOARD_CACHE_SOFT_TTL_SECONDS: int = 60 * 10
+    INTERVIEW_RUNS_CACHE_TTL_SECONDS: int = 60 * 60 * 2
+    INTERVIEW_RUNS_CACHE_SOFT_TTL_SECONDS: int = 60 * 10
+
+    SINGLE_FLIGHT_LOCK_SECONDS: int = 60
+    SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS: float = 10.0
+    SINGLE_FLIGHT_POLL_INTERVAL_SECONDS: float = 0.1
+
+    COACH_VIEW_TTL_SECONDS: int = 60 * 60 * 6
+    PRACTICE_DETAILS_CACHE_TTL_SECONDS: int = 60 * 60 * 2
+    TURNS_CACHE_TTL_SECONDS: int = 60 * 60 * 6
+    QNA_CACHE_TTL_SECONDS: int = 60 * 60
+
+    INTERVIEW_STATE_TTL_SECONDS: int = 60 * 60 * 2
+    INTERVIEW_JOB_DESCRIPTION_TTL_SECONDS: int = 60 * 60
+    INTERVIEW_TEXT_COMPRESS_MIN_BYTES: int = 512
+    INTERVIEW_TURN_LEASE_SECONDS: int = 60 * 5
+
+    METRICS_TOKEN: str = ""
+
+    TRACING_ENABLED: bool = True
+    TRACING_SAMPLE_RATE: float = 1.0
+    TRACING_MAX_SPANS_PER_TRACE: int = 1000
+    TRACING_BUFFER_SIZE: int = 500
+    TRACING_FILE_PATH: str = ""
+    TRACING_FILE_MIN_DURATION_MS: float = 1000.0
+
+    UPSTREAM_MAX_CONNECTIONS: int = 100
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    UPSTREAM_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    UPSTREAM_CONNECT_TIMEOUT_SECONDS: float = 3.0
+    UPSTREAM_POOL_TIMEOUT_SECONDS: float = 1.0
+    UPSTREAM_HTTP2: bool = False
+    UPSTREAM_RETRY_BUDGET_RATIO: float = 0.2
+    UPSTREAM_RETRY_BUDGET_MAX_TOKENS: float = 10.0
+    UPSTREAM_RETRY_BACKOFF_SECONDS: float = 0.2
+    UPSTREAM_BREAKER_FAILURE_THRESHOLD: int = 5
+    UPSTREAM_BREAKER_OPEN_SECONDS: float = 15.0
+    AGENT_SESSION_CREATE_TIMEOUT_SECONDS: float = 10.0
+    AGENT_SESSION_CREATE_MAX_RETRIES: int = 2
+    AGENT_SESSION_CREATE_HEDGE_AFTER_SECONDS: float = 0.0
+    AGENT_STREAM_READ_TIMEOUT_SECONDS: float = 60.0
+    AGENT_STREAM_MAX_RETRIES: int = 1
+
+    AGENT_SESSION_POOL_SIZE: int = 3
+    AGENT_SESSION_POOL_MAX_AGE_SECONDS: int = 60 * 30
+    AGENT_SESSION_POOL_REFILL_INTERVAL_SECONDS: float = 30.0
+    AGENT_SESSION_POOL_REFILL_CONCURRENCY: int = 2
+
+    TURN_FLUSH_DELAY_SECONDS: float = 1.0
+    TURN_FLUSH_BATCH_SIZE: int = 5
+
+    JOB_QUEUE_MAX_ATTEMPTS: int = 8
+    JOB_QUEUE_BACKOFF_BASE_SECONDS: float = 2.0
+    JOB_QUEUE_BACKOFF_MAX_SECONDS: float = 60 * 5
+    JOB_QUEUE_VISIBILITY_TIMEOUT_SECONDS: int = 60 * 2
+    JOB_QUEUE_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_QUEUE_RETENTION_SECONDS: int = 60 * 60 * 24 * 7
+    JOB_QUEUE_IN_APP_WORKERS: int = 1
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,59 @@
+from typing import Any, Dict
+
+from fastapi.responses import Response
+from pydantic_core import to_json
+
+from utils.cache_codec import decode_cache_json, decode_legacy_pickle, StaleCacheEntryError, CACHE_HEADER_MAGIC
+from utils.config import settings
+
+
+class EncodedJSONResponse(Response):
+    """
+    JSON response serialized straight with pydantic-core instead of FastAPI's jsonable_encoder.
+    The content is either already encoded bytes or a model (ResponseEnvelope, ResponseSchema) to serialize.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return to_json(content)
+
+
+def encode_envelope(message: str, json_fields: Dict[str, str], status_code: int = 200, **extra_data: Any) -> bytes:
+    """
+    Build the bytes of a ResponseSchema body around already serialized data fields, without parsing them.
+    :param json_fields: Data key -> JSON text of its value, in response order.
+    :param extra_data: More data fields that still have to be serialized, e.g. role.
+    """
+    data_parts = [to_json(key) + b":" + json_text.encode() for key, json_text in json_fields.items()]
+    data_parts.extend(to_json(key) + b":" + to_json(value) for key, value in extra_data.items())
+
+    return (
+        b'{"success":true,"status_code":' + str(status_code).encode()
+        + b',"message":' + to_json(message)
+        + b',"data":{' + b",".join(data_parts) + b"}}"
+    )
+
+
+def cached_json(data: str) -> str:
+    """
+    JSON text of a cache entry's payload, ready to be spliced into a response body.
+    :raises StaleCacheEntryError: If the entry has an old schema version or uses the legacy pickle format.
+    """
+    try:
+        return decode_cache_json(data)
+
+    except StaleCacheEntryError:
+        if settings.CACHE_ACCEPT_LEGACY_PICKLE and not data.startswith(f"{CACHE_HEADER_MAGIC}:"):
+            return to_json(decode_legacy_pickle(data)).decode()
+        raise
+
+
+def cached_envelope(message: str, cached_fields: Dict[str, str]) -> EncodedJSONResponse:
+    """
+    Response for a cache hit, the cached JSON goes into the body as is, there is no decode and re-encode.
+    :param cached_fields: Data key -> cache entry, in response order.
+    :raises StaleCacheEntryError: If an entry was written by an older deploy.
+    """
+    return EncodedJSONResponse(encode_envelope(message, {key: cached_json(value) for key, value in cached_fields.items()}))
@@ -1,5 +1,3 @@
-import base64
-import pickle
 import re
 
 from passlib.context import CryptContext
@@ -10,6 +8,8 @@ import re
 from pydantic import BaseModel
 from typing import Any, Dict, Union
 
+from utils.cache_codec import encode_cache_payload, decode_cache_payload
+
 crypt_context = CryptContext(schemes=["bcrypt"])
 
 def sanitize_filename_base(name: str) -> str:
@@ -20,10 +20,12 @@ def sanitize_filename_base(name: str) -> str:
     return re.sub(r'[^a-zA-Z0-9_]', '_', name)
 
 def encode_for_cache(obj):
-    return base64.b64encode(pickle.dumps(obj)).decode()
+    """Encodes a cache payload into a versioned, optionally compressed JSON cache entry."""
+    return encode_cache_payload(obj)
 
 def decode_from_cache(data):
-    return pickle.loads(base64.b64decode(data.encode()))
+    """Decodes a cache entry, raises StaleCacheEntryError for entries written by an older deploy."""
+    return decode_cache_payload(data)
 
 def encrypt_string(plain_string: str) -> str:
     """Encrypts a plain string using bcrypt."""